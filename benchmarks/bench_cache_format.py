@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: файл кэша в JSON против бинарного формата serialization.
+
+Наполняет кэш прогнозами и текущей погодой для LOCATIONS локаций, сохраняет
+его в каждом доступном формате и сравнивает размер файла, время записи и
+время загрузки при старте. Половина записей истекла: бинарный формат
+пропускает их по заголовку, не распаковывая данные.
+
+Запуск: python benchmarks/bench_cache_format.py
+"""
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from models import CurrentWeather, Forecast, decode_model, encode_model
+from serialization import CODECS, COMPRESSORS, parse_format, read_entries, write_entries
+
+LOCATIONS = 2000
+ROUNDS = 3
+
+
+def make_forecast(i: int) -> Forecast:
+    start = 1766300000
+    items = []
+    for k in range(40):
+        temp = 10 + 8 * math.sin(k / 8 * 2 * math.pi) + random.uniform(-2, 2)
+        items.append({
+            "dt": start + k * 10800,
+            "main": {"temp": temp, "feels_like": temp - random.uniform(0, 3),
+                     "humidity": random.randint(20, 95), "pressure": random.randint(995, 1025)},
+            "wind": {"speed": random.uniform(0, 12)},
+            "pop": random.random(),
+            "weather": [{"description": "облачно"}],
+        })
+    return Forecast.from_api({"list": items, "city": {"name": f"City {i}", "country": "RU", "timezone": 10800}})
+
+
+def make_weather(i: int) -> CurrentWeather:
+    return CurrentWeather.from_api({
+        "name": f"City {i}", "dt": 1766300000, "timezone": 10800,
+        "main": {"temp": random.uniform(-20, 30), "feels_like": 0, "humidity": 50, "pressure": 1010},
+        "wind": {"speed": 3.0}, "weather": [{"description": "ясно"}],
+        "sys": {"country": "RU", "sunrise": 1766290000, "sunset": 1766320000},
+    })
+
+
+def make_entries(now: float):
+    entries = []
+    for i in range(LOCATIONS):
+        # Половина записей истекла давно и при загрузке не нужна
+        expires_at = now + 3600 if i % 2 else now - 86400
+        entries.append((f"forecast:{i}", expires_at - 10800, expires_at, make_forecast(i)))
+        entries.append((f"weather:{i}", expires_at - 600, expires_at, make_weather(i)))
+    return entries
+
+
+def json_save(path: str, entries) -> None:
+    data = {key: {"data": data, "fetched_at": fetched_at, "expires_at": expires_at}
+            for key, fetched_at, expires_at, data in entries}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, default=encode_model)
+
+
+def json_load(path: str, now: float) -> int:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f, object_hook=decode_model)
+    return sum(1 for entry in data.values() if entry["expires_at"] > now)
+
+
+def binary_load(path: str, now: float) -> int:
+    return sum(1 for _ in read_entries(path, lambda _, expires_at: expires_at > now))
+
+
+def measure(func) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def main():
+    random.seed(42)
+    now = time.time()
+    entries = make_entries(now)
+
+    print(f"📊 Файл кэша на {len(entries)} записей (среднее за {ROUNDS} прогонов)")
+    print(f"{'формат':<16}{'размер, КБ':>12}{'запись, мс':>12}{'загрузка, мс':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.json")
+        save_time = measure(lambda: json_save(path, entries))
+        assert json_load(path, now) == len(entries) // 2
+        load_time = measure(lambda: json_load(path, now))
+        print(f"{'JSON (старый)':<16}{os.path.getsize(path) / 1024:>12.0f}"
+              f"{save_time * 1000:>12.1f}{load_time * 1000:>14.1f}")
+
+        for codec_name in CODECS:
+            for compression in COMPRESSORS:
+                spec = f"{codec_name}+{compression}"
+                path = os.path.join(tmp, f"cache.{codec_name}.{compression}")
+                codec, compressor = parse_format(spec)
+                save_time = measure(lambda: write_entries(path, entries, codec, compressor))
+                assert binary_load(path, now) == len(entries) // 2
+                load_time = measure(lambda: binary_load(path, now))
+                print(f"{spec:<16}{os.path.getsize(path) / 1024:>12.0f}"
+                      f"{save_time * 1000:>12.1f}{load_time * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
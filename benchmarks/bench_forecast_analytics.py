@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: аналитика прогноза циклами Python против ForecastFrame (numpy).
+
+Генерирует прогнозы 5 дней / 3 часа для LOCATIONS локаций в разных часовых
+поясах и считает для всех одно и то же: дневные min/max/среднее, индекс
+комфорта, лучшее время дня и тренд температуры - по локации в цикле Python
+и одним ForecastFrame на все локации (как на тике рассылки).
+
+Запуск: python benchmarks/bench_forecast_analytics.py
+"""
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from forecast_analytics import (
+    COMFORT_HUMIDITY, COMFORT_TEMP, COMFORT_WIND, DAYTIME_HOURS, ForecastFrame
+)
+from models import Forecast
+
+LOCATIONS = 2000
+ROUNDS = 5
+TIMEZONES = [-18000, 0, 3600, 10800, 19800, 32400]
+
+
+def make_forecast(i: int) -> Forecast:
+    start = 1766300000 + random.randrange(0, 10800)
+    items = []
+    for k in range(40):
+        temp = 10 + 8 * math.sin(k / 8 * 2 * math.pi) + random.uniform(-2, 2)
+        items.append({
+            "dt": start + k * 10800,
+            "main": {"temp": temp, "feels_like": temp - random.uniform(0, 3),
+                     "humidity": random.randint(20, 95), "pressure": random.randint(995, 1025)},
+            "wind": {"speed": random.uniform(0, 12)},
+            "pop": random.random(),
+            "weather": [{"description": "облачно"}],
+        })
+    return Forecast.from_api({"list": items, "city": {"name": f"City {i}", "country": "RU",
+                                                      "timezone": random.choice(TIMEZONES)}})
+
+
+def comfort(feels_like, humidity, wind_speed, pop) -> float:
+    low, high = COMFORT_HUMIDITY
+    penalty = (3.0 * abs(feels_like - COMFORT_TEMP) + max(0, low - humidity) + max(0, humidity - high)
+               + 5.0 * max(0.0, wind_speed - COMFORT_WIND) + 40.0 * pop)
+    return min(100.0, max(0.0, 100.0 - penalty))
+
+
+def analyze_python(forecasts):
+    results = []
+    for forecast in forecasts:
+        days = []
+        for day in forecast.days:
+            temps = forecast.temp[day.start:day.stop]
+            best, best_score = None, -1.0
+            for i in range(day.start, day.stop):
+                score = comfort(forecast.feels_like[i], forecast.humidity[i],
+                                forecast.wind_speed[i], forecast.pop[i])
+                if DAYTIME_HOURS[0] <= forecast.local_time(i).hour < DAYTIME_HOURS[1] and score > best_score:
+                    best, best_score = forecast.dt[i], score
+            days.append((min(temps), max(temps), sum(temps) / len(temps), best))
+
+        xs = [t / 86400 for t in forecast.dt]
+        x_mean, y_mean = sum(xs) / len(xs), sum(forecast.temp) / len(forecast.temp)
+        slope = (sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, forecast.temp))
+                 / sum((x - x_mean) ** 2 for x in xs))
+        results.append((days, slope))
+    return results
+
+
+def analyze_numpy(forecasts):
+    frame = ForecastFrame(forecasts)
+    return frame.daily(), frame.best_times(), frame.temp_trend()
+
+
+def measure(func, forecasts) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(forecasts)
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def main():
+    random.seed(42)
+    forecasts = [make_forecast(i) for i in range(LOCATIONS)]
+
+    # Результаты должны совпадать
+    python_result = analyze_python(forecasts)
+    daily, best, trend = analyze_numpy(forecasts)
+    for i, (days, slope) in enumerate(python_result):
+        for d, (t_min, t_max, t_mean, best_dt) in enumerate(days):
+            assert abs(daily["temp_min"][i, d] - t_min) < 1e-9
+            assert abs(daily["temp_max"][i, d] - t_max) < 1e-9
+            assert abs(daily["temp_mean"][i, d] - t_mean) < 1e-9
+            assert (best[i, d] or None) == best_dt
+        assert abs(trend[i] - slope) < 1e-6
+
+    python_time = measure(analyze_python, forecasts)
+    numpy_time = measure(analyze_numpy, forecasts)
+
+    print(f"📊 Аналитика прогноза для {LOCATIONS} локаций (среднее за {ROUNDS} прогонов)")
+    print(f"циклы Python:   {python_time * 1000:8.1f} мс")
+    print(f"ForecastFrame:  {numpy_time * 1000:8.1f} мс  (x{python_time / numpy_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: requests.get на каждый запрос против пула keep-alive соединений.
+
+Поднимает локальный HTTP-сервер-заглушку вместо api.openweathermap.org,
+считает новые TCP-соединения и время на серию запросов из нескольких потоков.
+Задержка CONNECT_DELAY имитирует TCP+TLS рукопожатие до реального API.
+
+Запуск: python benchmarks/bench_keepalive.py
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from api_client import create_session
+
+REQUESTS_TOTAL = 400
+WORKER_THREADS = 4
+CONNECT_DELAY = 0.02  # ~20 мс на рукопожатие
+
+RESPONSE_BODY = b'{"main": {"temp": 1.5, "humidity": 80, "pressure": 1010}}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # без этого сервер закрывает соединение после ответа
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        with StubHandler.lock:
+            StubHandler.connections += 1
+        time.sleep(CONNECT_DELAY)
+        super().setup()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_series(get, url: str) -> tuple:
+    StubHandler.connections = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKER_THREADS) as executor:
+        list(executor.map(lambda _: get(url, timeout=10).content, range(REQUESTS_TOTAL)))
+    return time.perf_counter() - started, StubHandler.connections
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather"
+
+    print(f"📊 {REQUESTS_TOTAL} запросов, {WORKER_THREADS} потоков, рукопожатие {CONNECT_DELAY * 1000:.0f} мс")
+
+    elapsed, connections = run_series(requests.get, url)
+    print(f"requests.get:    {elapsed:.2f} с, {elapsed / REQUESTS_TOTAL * 1000:.2f} мс/запрос, "
+          f"соединений: {connections}")
+
+    session = create_session(pool_maxsize=WORKER_THREADS)
+    elapsed_pool, connections = run_series(session.get, url)
+    print(f"пул keep-alive:  {elapsed_pool:.2f} с, {elapsed_pool / REQUESTS_TOTAL * 1000:.2f} мс/запрос, "
+          f"соединений: {connections}")
+    print(f"✅ Ускорение: x{elapsed / elapsed_pool:.1f}")
+
+    session.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
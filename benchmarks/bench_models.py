@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: память и доступ к полям для сырых JSON-словарей против моделей.
+
+Генерирует ответы data/2.5/weather и data/2.5/forecast для LOCATIONS городов,
+держит их в памяти как словари (как раньше в кэше) и как CurrentWeather/Forecast,
+сравнивает занятую память (tracemalloc) и время обхода полей прогноза.
+
+Запуск: python benchmarks/bench_models.py
+"""
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from models import CurrentWeather, Forecast
+
+LOCATIONS = 500
+RENDER_ROUNDS = 20
+
+DESCRIPTIONS = ["ясно", "пасмурно", "небольшой дождь", "облачно с прояснениями", "снег"]
+
+
+def make_weather(i: int) -> dict:
+    return {
+        "coord": {"lon": 37.6 + i, "lat": 55.7},
+        "weather": [{"id": 800, "main": "Clear", "description": random.choice(DESCRIPTIONS), "icon": "01d"}],
+        "base": "stations",
+        "main": {"temp": random.uniform(-20, 30), "feels_like": random.uniform(-25, 30),
+                 "temp_min": -1.0, "temp_max": 3.0, "pressure": 1012, "humidity": 80,
+                 "sea_level": 1012, "grnd_level": 993},
+        "visibility": 10000,
+        "wind": {"speed": 3.2, "deg": 200, "gust": 7.1},
+        "clouds": {"all": 0},
+        "dt": 1700000000,
+        "sys": {"country": "RU", "sunrise": 1699990000, "sunset": 1700020000},
+        "timezone": 10800,
+        "id": 524901 + i,
+        "name": f"City{i}",
+        "cod": 200,
+    }
+
+
+def make_forecast(i: int) -> dict:
+    items = []
+    for step in range(40):
+        dt = 1700006400 + step * 10800
+        items.append({
+            "dt": dt,
+            "main": {"temp": random.uniform(-20, 30), "feels_like": random.uniform(-25, 30),
+                     "temp_min": -1.0, "temp_max": 3.0, "pressure": 1012, "sea_level": 1012,
+                     "grnd_level": 993, "humidity": 80, "temp_kf": 0},
+            "weather": [{"id": 804, "main": "Clouds", "description": random.choice(DESCRIPTIONS), "icon": "04n"}],
+            "clouds": {"all": 100},
+            "wind": {"speed": 3.2, "deg": 200, "gust": 7.1},
+            "visibility": 10000,
+            "pop": random.random(),
+            "sys": {"pod": "n"},
+            "dt_txt": datetime.fromtimestamp(dt, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    return {
+        "cod": "200", "message": 0, "cnt": 40, "list": items,
+        "city": {"id": 524901 + i, "name": f"City{i}", "coord": {"lat": 55.7, "lon": 37.6 + i},
+                 "country": "RU", "population": 1000000, "timezone": 10800,
+                 "sunrise": 1699990000, "sunset": 1700020000},
+    }
+
+
+def measure(build) -> tuple:
+    tracemalloc.start()
+    data = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return data, size
+
+
+def main():
+    random.seed(1)
+    # Каждый ответ проходит через JSON, как при получении из сети
+    weather_json = [json.dumps(make_weather(i)) for i in range(LOCATIONS)]
+    forecast_json = [json.dumps(make_forecast(i)) for i in range(LOCATIONS)]
+
+    raw, raw_size = measure(lambda: [(json.loads(w), json.loads(f))
+                                     for w, f in zip(weather_json, forecast_json)])
+    models, model_size = measure(lambda: [(CurrentWeather.from_api(json.loads(w)), Forecast.from_api(json.loads(f)))
+                                          for w, f in zip(weather_json, forecast_json)])
+
+    print(f"📊 {LOCATIONS} локаций (погода + прогноз на 40 точек)")
+    print(f"словари: {raw_size / LOCATIONS / 1024:.1f} КБ на локацию")
+    print(f"модели:  {model_size / LOCATIONS / 1024:.1f} КБ на локацию "
+          f"(x{raw_size / model_size:.1f} меньше)")
+
+    started = time.perf_counter()
+    for _ in range(RENDER_ROUNDS):
+        for weather, forecast in raw:
+            temps = [item['main']['temp'] for item in forecast['list']]
+            _ = (weather['main']['temp'], weather['wind']['speed'], min(temps), max(temps))
+    raw_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(RENDER_ROUNDS):
+        for weather, forecast in models:
+            _ = (weather.temp, weather.wind_speed, min(forecast.temp), max(forecast.temp))
+    model_time = time.perf_counter() - started
+
+    renders = RENDER_ROUNDS * LOCATIONS
+    print(f"обход полей, словари: {raw_time / renders * 1e6:.1f} мкс на локацию")
+    print(f"обход полей, модели:  {model_time / renders * 1e6:.1f} мкс на локацию "
+          f"(x{raw_time / model_time:.1f} быстрее)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: рассылка через bot.send_message в цикле против очереди отправки.
+
+Поднимает локальную заглушку Telegram Bot API (apihelper.API_URL) с лимитами
+как у Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат,
+сверх лимита - 429 с retry_after. Во время рассылки BROADCAST_CHATS чатам
+пользователи из других чатов получают ответы; измеряются 429, потерянные
+сообщения, общее время и задержка ответов пользователям.
+
+Запуск: python benchmarks/bench_send_queue.py
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import telebot
+from telebot import apihelper
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from rate_limiter import TokenBucket
+from send_queue import BULK, INTERACTIVE, TelegramSendQueue
+
+BROADCAST_CHATS = 100
+MESSAGES_PER_CHAT = 2
+INTERACTIVE_REPLIES = 20
+SERVER_LATENCY = 0.01  # время ответа Telegram (сек)
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    lock = threading.Lock()
+    global_bucket = None
+    chat_buckets = {}
+    accepted = 0
+    rejected = 0
+
+    @classmethod
+    def reset(cls):
+        cls.global_bucket = TokenBucket(rate=30, capacity=30)
+        cls.chat_buckets = {}
+        cls.accepted = 0
+        cls.rejected = 0
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(self.rfile.read(length).decode()))
+        chat_id = int(params["chat_id"][0])
+        time.sleep(SERVER_LATENCY)
+
+        cls = FakeTelegramHandler
+        with cls.lock:
+            chat_bucket = cls.chat_buckets.setdefault(chat_id, TokenBucket(rate=1, capacity=3))
+            allowed = (chat_bucket.reserve(max_wait=0) is not None
+                       and cls.global_bucket.reserve(max_wait=0) is not None)
+            if allowed:
+                cls.accepted += 1
+            else:
+                cls.rejected += 1
+
+        if not allowed:
+            self._reply(429, {"ok": False, "error_code": 429,
+                              "description": "Too Many Requests: retry after 1",
+                              "parameters": {"retry_after": 1}})
+            return
+        self._reply(200, {"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", [""])[0]}})
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def interactive_replies(send) -> list:
+    """Ответы пользователям во время рассылки. Returns: задержки ответов (сек)."""
+    latencies = []
+
+    def reply(i):
+        time.sleep(0.1 * i)
+        started = time.perf_counter()
+        try:
+            send(10 ** 6 + i, "Погода в Москве")
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=reply, args=(i,)) for i in range(INTERACTIVE_REPLIES)]
+    for thread in threads:
+        thread.start()
+    return threads, latencies
+
+
+def report(name: str, elapsed: float, lost: int, latencies: list):
+    total = BROADCAST_CHATS * MESSAGES_PER_CHAT
+    latencies = sorted(latencies) or [float("nan")]
+    print(f"{name}: {elapsed:.1f} с, рассылка доставлена {total - lost}/{total}, "
+          f"429 от Telegram: {FakeTelegramHandler.rejected}, "
+          f"ответы пользователям: {len(latencies)}/{INTERACTIVE_REPLIES}, "
+          f"медиана задержки {latencies[len(latencies) // 2] * 1000:.0f} мс")
+
+
+def run_loop(bot):
+    FakeTelegramHandler.reset()
+    started = time.perf_counter()
+    threads, latencies = interactive_replies(lambda chat_id, text: bot.send_message(chat_id, text))
+    lost = 0
+    for _ in range(MESSAGES_PER_CHAT):
+        for chat_id in range(BROADCAST_CHATS):
+            try:
+                bot.send_message(chat_id, "🔔 Погода по подписке")
+            except Exception:
+                lost += 1
+    for thread in threads:
+        thread.join()
+    report("send_message в цикле", time.perf_counter() - started, lost, latencies)
+
+
+def run_queue(bot):
+    FakeTelegramHandler.reset()
+    queue = TelegramSendQueue(bot.send_message)
+    started = time.perf_counter()
+    futures = [queue.send(chat_id, "🔔 Погода по подписке", priority=BULK)
+               for _ in range(MESSAGES_PER_CHAT) for chat_id in range(BROADCAST_CHATS)]
+    threads, latencies = interactive_replies(
+        lambda chat_id, text: queue.send(chat_id, text, priority=INTERACTIVE).result())
+    lost = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            lost += 1
+    for thread in threads:
+        thread.join()
+    report("очередь отправки    ", time.perf_counter() - started, lost, latencies)
+    print(f"метрики очереди: {queue.stats()}")
+    queue.close()
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegramHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}"
+    bot = telebot.TeleBot("123:fake", threaded=False)
+
+    print(f"📊 Рассылка {BROADCAST_CHATS} чатам по {MESSAGES_PER_CHAT} сообщения "
+          f"+ {INTERACTIVE_REPLIES} ответов пользователям")
+    run_loop(bot)
+    run_queue(bot)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: update_user_location в JSON-файле, SQLite (WAL) и в памяти с отложенной записью.
+
+Заполняет хранилище USERS пользователями и измеряет среднее время одного
+обновления локации - то, что бот делает на каждый ответ с погодой.
+
+Запуск: python benchmarks/bench_storage.py
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
+
+from storage import JSONUserStorage, SQLiteUserStorage, WriteBehindUserStorage, default_user
+
+USERS = 10000
+UPDATES = 200
+
+
+def run(storage) -> float:
+    users = {str(user_id): dict(default_user(), last_city="Москва", last_lat=55.75, last_lon=37.62)
+             for user_id in range(USERS)}
+    storage.save_all(users)
+
+    started = time.perf_counter()
+    for i in range(UPDATES):
+        storage.update_location(i * 37 % USERS, "Казань", 55.79, 49.12)
+    return (time.perf_counter() - started) / UPDATES
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_time = run(JSONUserStorage(str(Path(tmp) / "users.json")))
+        sqlite_time = run(SQLiteUserStorage(str(Path(tmp) / "users.db"), json_file=None))
+        memory = WriteBehindUserStorage(JSONUserStorage(str(Path(tmp) / "memory.json")))
+        memory_time = run(memory)
+        memory.close()
+
+    print(f"📊 {USERS} пользователей, {UPDATES} обновлений локации")
+    print(f"JSON:   {json_time * 1000:.2f} мс на обновление")
+    print(f"SQLite: {sqlite_time * 1000:.2f} мс на обновление (x{json_time / sqlite_time:.0f} быстрее)")
+    print(f"Память: {memory_time * 1000:.3f} мс на обновление (x{json_time / memory_time:.0f} быстрее), "
+          f"на диск пачками: {memory.stats()}")
+
+
+if __name__ == "__main__":
+    main()
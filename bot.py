@@ -5,6 +5,7 @@ Telegram-бот для прогноза погоды.
 import os
 import sys
 import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
 
 # Настраиваем логирование
@@ -53,7 +54,10 @@ try:
             format_weather_output
         )
         # Отдельно импортируем функции из storage
-        from src import load_user, save_user, load_all_users, save_all_users
+        from src import (
+            load_user, save_user, load_all_users, save_all_users,
+            update_user_location, toggle_notifications
+        )
 
         logger.info("✅ Успешный импорт через 'src'")
 
@@ -66,22 +70,34 @@ try:
         from cache_manager import CacheManager
         from exceptions import WeatherAPIError, CityNotFoundError
         from weather_formatter import format_weather_output
-        from storage import load_user, save_user, load_all_users, save_all_users
+        from storage import (
+            load_user, save_user, load_all_users, save_all_users,
+            update_user_location, toggle_notifications
+        )
 
         logger.info("✅ Успешный прямой импорт")
 
+    from circuit_breaker import CircuitBreakerRegistry
+    from notification_scheduler import NotificationScheduler
+    from send_queue import TelegramSendQueue, BULK
+    from callback_registry import CallbackRegistry
+    from render_cache import RenderCache, LOCATION_ID
+    from geo_grid import snap_to_grid
+
     # Импортируем дополнительные функции из weather_formatter
     try:
         # Пробуем оба способа
         try:
             from src import (
                 format_forecast_summary, format_forecast_day,
-                format_air_quality_report, format_city_comparison
+                format_air_quality_report, format_city_comparison,
+                format_cities_comparison
             )
         except ImportError:
             from weather_formatter import (
                 format_forecast_summary, format_forecast_day,
-                format_air_quality_report, format_city_comparison
+                format_air_quality_report, format_city_comparison,
+                format_cities_comparison
             )
     except ImportError as e:
         logger.warning(f"Некоторые функции форматирования не импортированы: {e}")
@@ -89,7 +105,7 @@ try:
 
         # Определим заглушки для недостающих функций
         def format_forecast_summary(data):
-            return f"Прогноз для {data.get('city', {}).get('name', 'города')}"
+            return f"Прогноз для {data.city_name}"
 
 
         def format_forecast_day(data, day_idx):
@@ -104,29 +120,8 @@ try:
             return f"Сравнение {city1} и {city2}"
 
 
-    # Определяем дополнительные функции storage
-    def update_user_location(user_id, city, lat, lon):
-        """Обновляет локацию пользователя"""
-        user_data = load_user(user_id)
-        user_data["last_city"] = city
-        user_data["last_lat"] = lat
-        user_data["last_lon"] = lon
-        save_user(user_id, user_data)
-
-
-    def toggle_notifications(user_id, enabled=None):
-        """Переключает уведомления"""
-        user_data = load_user(user_id)
-        if "notifications" not in user_data:
-            user_data["notifications"] = {"enabled": False, "interval_h": 2}
-
-        if enabled is None:
-            user_data["notifications"]["enabled"] = not user_data["notifications"]["enabled"]
-        else:
-            user_data["notifications"]["enabled"] = enabled
-
-        save_user(user_id, user_data)
-        return user_data["notifications"]["enabled"]
+        def format_cities_comparison(items):
+            return "Сравнение " + ", ".join(item['city'] for item in items)
 
 
     logger.info("✅ Все модули успешно импортированы")
@@ -152,6 +147,16 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
+# Число рабочих потоков бота; пул HTTP-соединений к OpenWeather берем с запасом,
+# чтобы каждый поток получал готовое keep-alive соединение
+BOT_WORKER_THREADS = int(os.getenv("BOT_WORKER_THREADS", "4"))
+
+MAX_COMPARE_CITIES = 5
+
+# Сколько поток бота ждет отправки ответа: сообщение, отложенное на долгий
+# retry_after, не должно держать рабочий поток без ограничения (сек)
+SEND_TIMEOUT = 30
+
 # Проверяем токены
 if not BOT_TOKEN:
     logger.error("❌ BOT_TOKEN не найден в .env файле")
@@ -167,14 +172,155 @@ if not API_KEY:
 
 # Создаем экземпляры
 try:
-    bot = telebot.TeleBot(BOT_TOKEN)
+    bot = telebot.TeleBot(BOT_TOKEN, num_threads=BOT_WORKER_THREADS)
     cache_manager = CacheManager()
-    weather_client = WeatherAPIClient(API_KEY, cache_manager)
+    circuit_breakers = CircuitBreakerRegistry(
+        on_state_change=lambda name, old, new: logger.warning(
+            f"Circuit breaker '{name}': {old} -> {new} ({circuit_breakers.stats()[name]})")
+    )
+    weather_client = WeatherAPIClient(API_KEY, cache_manager,
+                                      circuit_breakers=circuit_breakers,
+                                      pool_maxsize=BOT_WORKER_THREADS * 2,
+                                      serve_stale=True)
+    # Кнопки ссылаются на город коротким ID, координаты хранятся здесь
+    callback_registry = CallbackRegistry()
+    render_cache = RenderCache()
+    # Все сообщения идут через очередь с лимитами Telegram; рассылки - с низким приоритетом
+    send_queue = TelegramSendQueue(bot.send_message)
+    notification_scheduler = NotificationScheduler(
+        weather_client,
+        send=lambda user_id, text: send_queue.send(user_id, text, priority=BULK, parse_mode="Markdown"),
+        grid_km=weather_client.grid_km
+    )
     logger.info("✅ Клиенты инициализированы")
 except Exception as e:
     logger.error(f"❌ Ошибка инициализации: {e}")
     sys.exit(1)
 
+
+def send_message(chat_id, text, **kwargs):
+    """
+    Ответ пользователю через очередь отправки; ответы идут раньше рассылок.
+    Возвращает отправленное сообщение или None, если оно не ушло за SEND_TIMEOUT
+    (сообщение остается в очереди и уйдет позже).
+    """
+    try:
+        return send_queue.send(chat_id, text, **kwargs).result(timeout=SEND_TIMEOUT)
+    except FutureTimeoutError:
+        logger.warning(f"⚠️ Сообщение в чат {chat_id} не отправлено за {SEND_TIMEOUT} с, ждет в очереди")
+        return None
+
+
+def resolve_callback_location(call, location_id):
+    """Локация кнопки по ID; если кнопка устарела, сообщает об этом пользователю"""
+    location = callback_registry.resolve(location_id)
+    if location is None:
+        bot.answer_callback_query(call.id, "Кнопка устарела, запросите погоду заново")
+    return location
+
+
+def city_not_found_text(city):
+    """Сообщение о ненайденном городе с подсказками из офлайн-справочника"""
+    text = f"❌ Город '{city}' не найден"
+    suggestions = weather_client.suggest_cities(city)
+    if suggestions:
+        text += "\n\nВозможно, вы имели в виду: " + ", ".join(suggestions)
+    return text
+
+
+def remember_location(user_id, city, lat, lon):
+    """Сохраняет последнюю локацию пользователя; подписчикам уведомления придут по ней"""
+    update_user_location(user_id, city, lat, lon)
+    notification_scheduler.update_location(user_id, city, lat, lon)
+
+
+# ===== СТРАНИЦЫ: текст + клавиатура, отдаются из кэша отрисовки =====
+# Страницы кэшируются по ячейке сетки локации и версии данных в кэше погоды;
+# в кнопках LOCATION_ID, вместо него подставляется ID локации запроса
+
+def cached_page(location_id, lat, lon, endpoint, data, page, render):
+    version = weather_client.data_version(endpoint, lat, lon, data)
+    location = snap_to_grid(lat, lon, weather_client.grid_km)
+    return render_cache.get_or_render(version, location, page, render, location_id=location_id)
+
+
+def weather_page(location_id, city, lat, lon, weather_data):
+    def render():
+        markup = types.InlineKeyboardMarkup()
+        btn_air = types.InlineKeyboardButton("🌬️ Качество воздуха", callback_data=f"air_{LOCATION_ID}")
+        btn_forecast = types.InlineKeyboardButton("📅 Прогноз", callback_data=f"forecast_{LOCATION_ID}")
+        markup.add(btn_air, btn_forecast)
+        return format_weather_output(weather_data, city), markup
+
+    # Название города - в тексте страницы
+    return cached_page(location_id, lat, lon, "weather", weather_data, f"weather:{city}", render)
+
+
+def forecast_summary_page(location_id, lat, lon, forecast_data):
+    def render():
+        markup = types.InlineKeyboardMarkup(row_width=3)
+        buttons = []
+        for i, day in enumerate(forecast_data.days):
+            btn = types.InlineKeyboardButton(f"{day.weekday} {day.label}", callback_data=f"day_{LOCATION_ID}_{i}")
+            buttons.append(btn)
+
+        markup.add(*buttons)
+        btn_back = types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")
+        markup.add(btn_back)
+        return format_forecast_summary(forecast_data), markup
+
+    return cached_page(location_id, lat, lon, "forecast", forecast_data, "forecast", render)
+
+
+def forecast_day_page(location_id, lat, lon, forecast_data, day_idx):
+    def render():
+        day_forecast = format_forecast_day(forecast_data, day_idx)
+
+        # Улучшаем навигацию
+        markup = types.InlineKeyboardMarkup(row_width=2)
+
+        # Кнопки навигации по дням
+        nav_buttons = []
+        if day_idx > 0:
+            nav_buttons.append(types.InlineKeyboardButton(
+                "◀️ Предыдущий",
+                callback_data=f"day_{LOCATION_ID}_{day_idx - 1}"
+            ))
+
+        nav_buttons.append(types.InlineKeyboardButton(
+            "📋 Сводка",
+            callback_data=f"forecast_{LOCATION_ID}"
+        ))
+
+        if day_idx < len(forecast_data.days) - 1:
+            nav_buttons.append(types.InlineKeyboardButton(
+                "Следующий ▶️",
+                callback_data=f"day_{LOCATION_ID}_{day_idx + 1}"
+            ))
+
+        markup.add(*nav_buttons)
+        markup.add(types.InlineKeyboardButton(
+            "◀️ Назад в меню",
+            callback_data="back_to_main"
+        ))
+        return day_forecast, markup
+
+    return cached_page(location_id, lat, lon, "forecast", forecast_data, f"day:{day_idx}", render)
+
+
+def air_quality_page(location_id, lat, lon, components):
+    def render():
+        analysis = weather_client.analyze_air_pollution(components, extended=True)
+
+        # Добавляем кнопку "Назад"
+        markup = types.InlineKeyboardMarkup()
+        back_button = types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")
+        markup.add(back_button)
+        return format_air_quality_report(analysis), markup
+
+    return cached_page(location_id, lat, lon, "air_pollution", components, "air", render)
+
+
 # ===== КОМАНДЫ БОТА =====
 # (Здесь продолжается остальной код бота, который ты уже видел)
 
@@ -218,39 +364,38 @@ def send_welcome(message):
     btn6 = types.KeyboardButton("🔔 Уведомления")
     markup.add(btn1, btn2, btn3, btn4, btn5, btn6)
 
-    bot.send_message(message.chat.id, welcome_text,
-                     parse_mode="Markdown", reply_markup=markup)
+    send_message(message.chat.id, welcome_text,
+                 parse_mode="Markdown", reply_markup=markup)
 
 
 @bot.message_handler(func=lambda message: message.text == "🌤️ Текущая погода")
 def ask_city_current(message):
-    msg = bot.send_message(message.chat.id, "Введите название города:")
-    bot.register_next_step_handler(msg, process_city_current)
+    send_message(message.chat.id, "Введите название города:")
+    bot.register_next_step_handler_by_chat_id(message.chat.id, process_city_current)
 
 
 def process_city_current(message):
     city = message.text.strip()
     if not city:
-        bot.send_message(message.chat.id, "❌ Город не указан")
+        send_message(message.chat.id, "❌ Город не указан")
         return
 
     try:
         bot.send_chat_action(message.chat.id, 'typing')
         lat, lon = weather_client.get_coordinates(city)
         weather_data = weather_client.get_current_weather(lat, lon)
-        response = format_weather_output(weather_data, city)
 
         # Сохраняем локацию
-        update_user_location(message.from_user.id, city, lat, lon)
+        remember_location(message.from_user.id, city, lat, lon)
+        # Прогноз и качество воздуха грузим заранее: кнопки ниже ответят из кэша
+        weather_client.prefetch_location_bundle(lat, lon)
 
         # Кнопка для дополнительной информации
-        markup = types.InlineKeyboardMarkup()
-        btn_air = types.InlineKeyboardButton("🌬️ Качество воздуха", callback_data=f"air_{city}")
-        btn_forecast = types.InlineKeyboardButton("📅 Прогноз", callback_data=f"forecast_{city}")
-        markup.add(btn_air, btn_forecast)
+        location_id = callback_registry.register(city, lat, lon)
+        response, markup = weather_page(location_id, city, lat, lon, weather_data)
 
-        bot.send_message(message.chat.id, response,
-                         parse_mode="Markdown", reply_markup=markup)
+        send_message(message.chat.id, response,
+                     parse_mode="Markdown", reply_markup=markup)
 
     except CityNotFoundError:
         # Кнопка назад при ошибке
@@ -258,16 +403,16 @@ def process_city_current(message):
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Город '{city}' не найден",
-                         reply_markup=markup)
+        send_message(message.chat.id, city_not_found_text(city),
+                     reply_markup=markup)
 
     except WeatherAPIError as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"⚠️ Ошибка: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"⚠️ Ошибка: {str(e)}",
+                     reply_markup=markup)
 
     except Exception as e:
         logger.error(f"Ошибка: {e}")
@@ -276,20 +421,20 @@ def process_city_current(message):
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, "😔 Произошла ошибка",
-                         reply_markup=markup)
+        send_message(message.chat.id, "😔 Произошла ошибка",
+                     reply_markup=markup)
 
 
 @bot.message_handler(func=lambda message: message.text == "📅 Прогноз на 5 дней")
 def ask_city_forecast(message):
-    msg = bot.send_message(message.chat.id, "Введите название города для прогноза:")
-    bot.register_next_step_handler(msg, process_city_forecast)
+    send_message(message.chat.id, "Введите название города для прогноза:")
+    bot.register_next_step_handler_by_chat_id(message.chat.id, process_city_forecast)
 
 
 def process_city_forecast(message):
     city = message.text.strip()
     if not city:
-        bot.send_message(message.chat.id, "❌ Город не указан")
+        send_message(message.chat.id, "❌ Город не указан")
         return
 
     try:
@@ -297,86 +442,49 @@ def process_city_forecast(message):
         lat, lon = weather_client.get_coordinates(city)
         forecast_data = weather_client.get_forecast_5d3h(lat, lon)
 
-        summary = format_forecast_summary(forecast_data)
-
-        # Создаем inline-клавиатуру с днями
-        markup = types.InlineKeyboardMarkup(row_width=3)
-        buttons = []
-        for i in range(5):
-            if i < len(forecast_data['list']) // 8:
-                btn = types.InlineKeyboardButton(f"День {i + 1}", callback_data=f"day_{city}_{i}")
-                buttons.append(btn)
-
-        markup.add(*buttons)
-        btn_back = types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")
-        markup.add(btn_back)
+        location_id = callback_registry.register(city, lat, lon)
+        summary, markup = forecast_summary_page(location_id, lat, lon, forecast_data)
 
-        bot.send_message(message.chat.id, summary,
-                         parse_mode="Markdown", reply_markup=markup)
+        send_message(message.chat.id, summary,
+                     parse_mode="Markdown", reply_markup=markup)
 
     except CityNotFoundError:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Город '{city}' не найден",
-                         reply_markup=markup)
+        send_message(message.chat.id, city_not_found_text(city),
+                     reply_markup=markup)
 
     except WeatherAPIError as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Ошибка API: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Ошибка API: {str(e)}",
+                     reply_markup=markup)
 
     except Exception as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
+                     reply_markup=markup)
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('day_'))
 def handle_day_selection(call):
     try:
-        _, city, day_idx = call.data.split('_')
+        _, location_id, day_idx = call.data.split('_')
         day_idx = int(day_idx)
 
-        lat, lon = weather_client.get_coordinates(city)
-        forecast_data = weather_client.get_forecast_5d3h(lat, lon)
-
-        day_forecast = format_forecast_day(forecast_data, day_idx)
-
-        # Улучшаем навигацию
-        markup = types.InlineKeyboardMarkup(row_width=2)
-
-        # Кнопки навигации по дням
-        nav_buttons = []
-        if day_idx > 0:
-            nav_buttons.append(types.InlineKeyboardButton(
-                "◀️ Предыдущий",
-                callback_data=f"day_{city}_{day_idx - 1}"
-            ))
-
-        nav_buttons.append(types.InlineKeyboardButton(
-            "📋 Сводка",
-            callback_data=f"forecast_{city}"
-        ))
-
-        if day_idx < 4 and day_idx < (len(forecast_data['list']) // 8) - 1:
-            nav_buttons.append(types.InlineKeyboardButton(
-                "Следующий ▶️",
-                callback_data=f"day_{city}_{day_idx + 1}"
-            ))
+        location = resolve_callback_location(call, location_id)
+        if location is None:
+            return
+        forecast_data = weather_client.get_forecast_5d3h(location.lat, location.lon)
 
-        markup.add(*nav_buttons)
-        markup.add(types.InlineKeyboardButton(
-            "◀️ Назад в меню",
-            callback_data="back_to_main"
-        ))
+        day_forecast, markup = forecast_day_page(location_id, location.lat, location.lon, forecast_data, day_idx)
 
         bot.edit_message_text(chat_id=call.message.chat.id,
                               message_id=call.message.message_id,
@@ -390,67 +498,69 @@ def handle_day_selection(call):
 
 @bot.message_handler(func=lambda message: message.text == "🏙️ Сравнить города")
 def ask_cities_compare(message):
-    msg = bot.send_message(message.chat.id,
-                           "Введите два города через запятую (например: Москва, Санкт-Петербург):")
-    bot.register_next_step_handler(msg, process_cities_compare)
+    send_message(message.chat.id,
+                 f"Введите от двух до {MAX_COMPARE_CITIES} городов через запятую "
+                 "(например: Москва, Санкт-Петербург):")
+    bot.register_next_step_handler_by_chat_id(message.chat.id, process_cities_compare)
 
 
 def process_cities_compare(message):
-    cities = [c.strip() for c in message.text.split(',')]
-    if len(cities) != 2:
+    cities = [c.strip() for c in (message.text or "").split(',') if c.strip()]
+    if not 2 <= len(cities) <= MAX_COMPARE_CITIES:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, "❌ Введите ровно два города через запятую",
-                         reply_markup=markup)
+        send_message(message.chat.id,
+                     f"❌ Введите от двух до {MAX_COMPARE_CITIES} городов через запятую",
+                     reply_markup=markup)
         return
 
-    city1, city2 = cities
-
     try:
         bot.send_chat_action(message.chat.id, 'typing')
 
-        # Получаем данные для первого города
-        lat1, lon1 = weather_client.get_coordinates(city1)
-        weather1 = weather_client.get_current_weather(lat1, lon1)
-
-        # Получаем данные для второго города
-        lat2, lon2 = weather_client.get_coordinates(city2)
-        weather2 = weather_client.get_current_weather(lat2, lon2)
+        # Все города запрашиваем параллельно
+        items = weather_client.get_weather_many(cities)
 
-        response = format_city_comparison(city1, weather1, city2, weather2)
+        if len(items) == 2:
+            for item in items:
+                if item['error'] is not None:
+                    raise item['error']
+            response = format_city_comparison(items[0]['city'], items[0]['weather'],
+                                              items[1]['city'], items[1]['weather'])
+        else:
+            response = format_cities_comparison(items)
 
         # Добавляем кнопку "Назад"
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, response,
-                         parse_mode="Markdown",
-                         reply_markup=markup)
+        send_message(message.chat.id, response,
+                     parse_mode="Markdown",
+                     reply_markup=markup)
 
     except CityNotFoundError as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Город не найден: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Город не найден: {str(e)}",
+                     reply_markup=markup)
 
     except Exception as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
+                     reply_markup=markup)
 
 
 @bot.message_handler(func=lambda message: message.text == "🌬️ Качество воздуха")
 def ask_city_air(message):
-    msg = bot.send_message(message.chat.id, "Введите название города:")
-    bot.register_next_step_handler(msg, process_city_air)
+    send_message(message.chat.id, "Введите название города:")
+    bot.register_next_step_handler_by_chat_id(message.chat.id, process_city_air)
 
 
 def process_city_air(message):
@@ -460,8 +570,8 @@ def process_city_air(message):
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, "❌ Город не указан",
-                         reply_markup=markup)
+        send_message(message.chat.id, "❌ Город не указан",
+                     reply_markup=markup)
         return
 
     try:
@@ -477,33 +587,33 @@ def process_city_air(message):
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, response,
-                         parse_mode="Markdown",
-                         reply_markup=markup)
+        send_message(message.chat.id, response,
+                     parse_mode="Markdown",
+                     reply_markup=markup)
 
     except CityNotFoundError:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Город '{city}' не найден",
-                         reply_markup=markup)
+        send_message(message.chat.id, city_not_found_text(city),
+                     reply_markup=markup)
 
     except WeatherAPIError as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Ошибка API: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Ошибка API: {str(e)}",
+                     reply_markup=markup)
 
     except Exception as e:
         markup = types.InlineKeyboardMarkup()
         back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
         markup.add(back_button)
 
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
-                         reply_markup=markup)
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}",
+                     reply_markup=markup)
 
 
 @bot.message_handler(func=lambda message: message.text == "🔔 Уведомления")
@@ -512,6 +622,7 @@ def handle_notifications(message):
     user_data = load_user(user_id)
 
     notifications_enabled = user_data.get("notifications", {}).get("enabled", False)
+    interval_h = user_data.get("notifications", {}).get("interval_h", 2)
     status = "включены" if notifications_enabled else "выключены"
 
     markup = types.InlineKeyboardMarkup()
@@ -522,11 +633,11 @@ def handle_notifications(message):
 
     markup.add(btn)
 
-    bot.send_message(message.chat.id,
-                     f"📢 Уведомления сейчас *{status}*\n\n"
-                     "Вы будете получать погоду каждые 2 часа",
-                     parse_mode="Markdown",
-                     reply_markup=markup)
+    send_message(message.chat.id,
+                 f"📢 Уведомления сейчас *{status}*\n\n"
+                 f"Вы будете получать погоду каждые {interval_h} часа",
+                 parse_mode="Markdown",
+                 reply_markup=markup)
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('notif_'))
@@ -540,6 +651,16 @@ def handle_notification_toggle(call):
         enabled = toggle_notifications(user_id, False)
         status = "выключены"
 
+    user_data = load_user(user_id)
+    interval_h = user_data.get("notifications", {}).get("interval_h", 2)
+    if not enabled:
+        notification_scheduler.unsubscribe(user_id)
+    elif user_data.get("last_lat") is not None:
+        notification_scheduler.subscribe(user_id, user_data.get("last_city", ""),
+                                         user_data["last_lat"], user_data["last_lon"], interval_h)
+    else:
+        status += " (сначала запросите погоду, чтобы мы знали ваш город)"
+
     bot.answer_callback_query(call.id, f"Уведомления {status}")
 
     # Обновляем сообщение
@@ -554,7 +675,7 @@ def handle_notification_toggle(call):
     bot.edit_message_text(chat_id=call.message.chat.id,
                           message_id=call.message.message_id,
                           text=f"📢 Уведомления сейчас *{status}*\n\n"
-                               "Вы будете получать погоду каждые 2 часа",
+                               f"Вы будете получать погоду каждые {interval_h} часа",
                           parse_mode="Markdown",
                           reply_markup=markup)
 
@@ -567,46 +688,45 @@ def handle_location(message):
 
         try:
             bot.send_chat_action(message.chat.id, 'typing')
-            weather_data = weather_client.get_current_weather(lat, lon)
 
-            city = f"{lat:.4f}, {lon:.4f}"
-            response = format_weather_output(weather_data, city)
+            # Ближайший город: тот же кэш, страницы и рассылка, что и при поиске по названию
+            place = weather_client.reverse_geocode(lat, lon)
+            if place is not None:
+                city, lat, lon = place
+            else:
+                city = f"{lat:.4f}, {lon:.4f}"
 
-            update_user_location(message.from_user.id, city, lat, lon)
+            weather_data = weather_client.get_current_weather(lat, lon)
+
+            remember_location(message.from_user.id, city, lat, lon)
+            weather_client.prefetch_location_bundle(lat, lon)
 
-            # Добавляем кнопки
-            markup = types.InlineKeyboardMarkup()
-            back_button = types.InlineKeyboardButton("◀️ Назад в меню", callback_data="back_to_main")
-            markup.add(back_button)
+            location_id = callback_registry.register(city, lat, lon)
+            response, markup = weather_page(location_id, city, lat, lon, weather_data)
 
-            bot.send_message(message.chat.id, response,
-                             parse_mode="Markdown",
-                             reply_markup=markup)
+            send_message(message.chat.id, response,
+                         parse_mode="Markdown",
+                         reply_markup=markup)
 
         except Exception as e:
-            bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+            send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('air_'))
 def handle_air_quality_callback(call):
-    city = call.data[4:]  # Убираем "air_"
+    location_id = call.data[4:]  # Убираем "air_"
+    location = resolve_callback_location(call, location_id)
+    if location is None:
+        return
 
     try:
         bot.send_chat_action(call.message.chat.id, 'typing')
-        lat, lon = weather_client.get_coordinates(city)
-        components = weather_client.get_air_pollution(lat, lon)
-        analysis = weather_client.analyze_air_pollution(components, extended=True)
-
-        response = format_air_quality_report(analysis)
-
-        # Добавляем кнопку "Назад"
-        markup = types.InlineKeyboardMarkup()
-        back_button = types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")
-        markup.add(back_button)
+        components = weather_client.get_air_pollution(location.lat, location.lon)
+        response, markup = air_quality_page(location_id, location.lat, location.lon, components)
 
-        bot.send_message(call.message.chat.id, response,
-                         parse_mode="Markdown",
-                         reply_markup=markup)
+        send_message(call.message.chat.id, response,
+                     parse_mode="Markdown",
+                     reply_markup=markup)
         bot.answer_callback_query(call.id)
 
     except Exception as e:
@@ -615,25 +735,16 @@ def handle_air_quality_callback(call):
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('forecast_'))
 def handle_forecast_callback(call):
-    city = call.data[9:]  # Убираем "forecast_"
+    location_id = call.data[9:]  # Убираем "forecast_"
+    location = resolve_callback_location(call, location_id)
+    if location is None:
+        return
 
     try:
         bot.send_chat_action(call.message.chat.id, 'typing')
-        lat, lon = weather_client.get_coordinates(city)
-        forecast_data = weather_client.get_forecast_5d3h(lat, lon)
-
-        summary = format_forecast_summary(forecast_data)
-
-        markup = types.InlineKeyboardMarkup(row_width=3)
-        buttons = []
-        for i in range(5):
-            if i < len(forecast_data['list']) // 8:
-                btn = types.InlineKeyboardButton(f"День {i + 1}", callback_data=f"day_{city}_{i}")
-                buttons.append(btn)
+        forecast_data = weather_client.get_forecast_5d3h(location.lat, location.lon)
 
-        markup.add(*buttons)
-        btn_back = types.InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")
-        markup.add(btn_back)
+        summary, markup = forecast_summary_page(location_id, location.lat, location.lon, forecast_data)
 
         bot.edit_message_text(chat_id=call.message.chat.id,
                               message_id=call.message.message_id,
@@ -665,7 +776,7 @@ def handle_back_to_main(call):
                           message_id=call.message.message_id,
                           text=welcome_text,
                           parse_mode="Markdown")
-    bot.send_message(call.message.chat.id, "Главное меню:", reply_markup=markup)
+    send_message(call.message.chat.id, "Главное меню:", reply_markup=markup)
 
 
 @bot.message_handler(func=lambda message: True)
@@ -674,32 +785,30 @@ def handle_text_message(message):
     city = message.text.strip()
 
     if not city:
-        bot.send_message(message.chat.id, "Пожалуйста, введите название города.")
+        send_message(message.chat.id, "Пожалуйста, введите название города.")
         return
 
     try:
         bot.send_chat_action(message.chat.id, 'typing')
         lat, lon = weather_client.get_coordinates(city)
         weather_data = weather_client.get_current_weather(lat, lon)
-        response = format_weather_output(weather_data, city)
 
-        update_user_location(message.from_user.id, city, lat, lon)
+        remember_location(message.from_user.id, city, lat, lon)
+        weather_client.prefetch_location_bundle(lat, lon)
 
-        markup = types.InlineKeyboardMarkup()
-        btn_air = types.InlineKeyboardButton("🌬️ Качество воздуха", callback_data=f"air_{city}")
-        btn_forecast = types.InlineKeyboardButton("📅 Прогноз", callback_data=f"forecast_{city}")
-        markup.add(btn_air, btn_forecast)
+        location_id = callback_registry.register(city, lat, lon)
+        response, markup = weather_page(location_id, city, lat, lon, weather_data)
 
-        bot.send_message(message.chat.id, response,
-                         parse_mode="Markdown", reply_markup=markup)
+        send_message(message.chat.id, response,
+                     parse_mode="Markdown", reply_markup=markup)
 
     except CityNotFoundError:
-        bot.send_message(message.chat.id, f"❌ Город '{city}' не найден")
+        send_message(message.chat.id, city_not_found_text(city))
     except WeatherAPIError as e:
-        bot.send_message(message.chat.id, f"⚠️ Ошибка: {str(e)}")
+        send_message(message.chat.id, f"⚠️ Ошибка: {str(e)}")
     except Exception as e:
         logger.error(f"Ошибка: {e}")
-        bot.send_message(message.chat.id, "😔 Произошла ошибка")
+        send_message(message.chat.id, "😔 Произошла ошибка")
 
 
 # ===== ЗАПУСК БОТА =====
@@ -711,12 +820,20 @@ def main():
     logger.info(f"API ключ: {API_KEY[:10]}...")
     logger.info("=" * 50)
 
+    subscribers = notification_scheduler.load(load_all_users())
+    notification_scheduler.start()
+    logger.info(f"Подписчиков на уведомления: {subscribers}")
+
     try:
         bot.polling(none_stop=True, interval=2, timeout=30)
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
         logger.error(f"Критическая ошибка бота: {e}")
+    finally:
+        notification_scheduler.stop()
+        send_queue.close()
+        weather_client.close()
 
 
 if __name__ == "__main__":
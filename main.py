@@ -123,7 +123,7 @@ def show_forecast(api_client: WeatherAPIClient):
 
         # Показываем краткий прогноз по дням
         print("\n" + "-" * 30)
-        for i in range(min(5, len(forecast_data['list']) // 8)):
+        for i in range(len(forecast_data.days)):
             day_forecast = format_forecast_day(forecast_data, i)
             print(f"\n{day_forecast}")
 
@@ -151,13 +151,12 @@ def compare_cities(api_client: WeatherAPIClient):
     try:
         print(f"🔍 Сравниваем '{city1}' и '{city2}'...")
 
-        # Получаем координаты и погоду для первого города
-        lat1, lon1 = api_client.get_coordinates(city1)
-        weather1 = api_client.get_current_weather(lat1, lon1)
-
-        # Получаем координаты и погоду для второго города
-        lat2, lon2 = api_client.get_coordinates(city2)
-        weather2 = api_client.get_current_weather(lat2, lon2)
+        # Оба города запрашиваем параллельно
+        item1, item2 = api_client.get_weather_many([city1, city2])
+        for item in (item1, item2):
+            if item['error'] is not None:
+                raise item['error']
+        weather1, weather2 = item1['weather'], item2['weather']
 
         print("\n" + format_city_comparison(city1, weather1, city2, weather2))
 
@@ -214,11 +213,11 @@ def test_api_functions(api_client: WeatherAPIClient):
 
         print(f"2. Получение текущей погоды...")
         weather = api_client.get_current_weather(lat, lon)
-        print(f"   ✅ Температура: {weather['main']['temp']:.1f}°C")
+        print(f"   ✅ Температура: {weather.temp:.1f}°C")
 
         print(f"3. Получение прогноза на 5 дней...")
         forecast = api_client.get_forecast_5d3h(lat, lon)
-        print(f"   ✅ Прогнозов получено: {forecast['cnt']}")
+        print(f"   ✅ Прогнозов получено: {forecast.cnt}")
 
         print(f"4. Получение качества воздуха...")
         components = api_client.get_air_pollution(lat, lon)
@@ -258,7 +257,7 @@ def main():
 
         # Создаем клиент
         cache_manager = CacheManager()
-        api_client = WeatherAPIClient(API_KEY, cache_manager)
+        api_client = WeatherAPIClient(API_KEY, cache_manager, serve_stale=True)
 
         print("✅ Погодный клиент инициализирован")
 
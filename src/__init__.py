@@ -3,6 +3,12 @@
 Экспортирует все основные классы и функции.
 """
 # Импорты для экспорта
-from .exceptions import WeatherAPIError, InvalidAPIKeyError, CityNotFoundError
+from .exceptions import (
+    WeatherAPIError, InvalidAPIKeyError, CityNotFoundError,
+    RateLimitExceededError, CircuitOpenError
+)
 from .cache_manager import CacheManager
-from .storage import load_user, save_user, load_all_users, save_all_users, init_user_data
+from .storage import (
+    load_user, save_user, load_all_users, save_all_users, init_user_data,
+    update_user_location, toggle_notifications, get_users_with_notifications
+)
@@ -0,0 +1,292 @@
+from bisect import bisect_right
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # без numpy пакетная классификация идет через bisect по значениям
+    np = None
+
+from models import AirPollutionSeries
+
+# Таблица качества воздуха: диапазоны [min, max) в µg/m³ -> (индекс, статус)
+AIR_QUALITY_STANDARDS = {
+    'so2': {
+        'ranges': [
+            (0, 20, 1, 'Хорошо'),
+            (20, 80, 2, 'Удовлетворительно'),
+            (80, 250, 3, 'Умеренно'),
+            (250, 350, 4, 'Плохо'),
+            (350, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Диоксид серы (SO₂)',
+        'unit': 'µg/m³'
+    },
+    'no2': {
+        'ranges': [
+            (0, 40, 1, 'Хорошо'),
+            (40, 70, 2, 'Удовлетворительно'),
+            (70, 150, 3, 'Умеренно'),
+            (150, 200, 4, 'Плохо'),
+            (200, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Диоксид азота (NO₂)',
+        'unit': 'µg/m³'
+    },
+    'pm10': {
+        'ranges': [
+            (0, 20, 1, 'Хорошо'),
+            (20, 50, 2, 'Удовлетворительно'),
+            (50, 100, 3, 'Умеренно'),
+            (100, 200, 4, 'Плохо'),
+            (200, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Частицы PM₁₀',
+        'unit': 'µg/m³'
+    },
+    'pm2_5': {
+        'ranges': [
+            (0, 10, 1, 'Хорошо'),
+            (10, 25, 2, 'Удовлетворительно'),
+            (25, 50, 3, 'Умеренно'),
+            (50, 75, 4, 'Плохо'),
+            (75, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Частицы PM₂.₅',
+        'unit': 'µg/m³'
+    },
+    'o3': {
+        'ranges': [
+            (0, 60, 1, 'Хорошо'),
+            (60, 100, 2, 'Удовлетворительно'),
+            (100, 140, 3, 'Умеренно'),
+            (140, 180, 4, 'Плохо'),
+            (180, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Озон (O₃)',
+        'unit': 'µg/m³'
+    },
+    'co': {
+        'ranges': [
+            (0, 4400, 1, 'Хорошо'),
+            (4400, 9400, 2, 'Удовлетворительно'),
+            (9400, 12400, 3, 'Умеренно'),
+            (12400, 15400, 4, 'Плохо'),
+            (15400, float('inf'), 5, 'Очень плохо')
+        ],
+        'name': 'Угарный газ (CO)',
+        'unit': 'µg/m³'
+    },
+    # Дополнительные параметры (не влияют на общий индекс)
+    'nh3': {
+        'ranges': [(0.1, 200, None, 'В норме')],
+        'name': 'Аммиак (NH₃)',
+        'unit': 'µg/m³'
+    },
+    'no': {
+        'ranges': [(0.1, 100, None, 'В норме')],
+        'name': 'Оксид азота (NO)',
+        'unit': 'µg/m³'
+    }
+}
+
+# Основные компоненты, которые влияют на общий индекс
+MAIN_COMPONENTS = ('so2', 'no2', 'pm10', 'pm2_5', 'o3', 'co')
+EXTRA_COMPONENTS = ('nh3', 'no')
+
+# Значение вне всех диапазонов считается очень плохим
+OUT_OF_RANGE = (5, 'Очень плохо')
+
+STATUSES = {1: 'Хорошо', 2: 'Удовлетворительно', 3: 'Умеренно', 4: 'Плохо', 5: 'Очень плохо'}
+
+
+class Breakpoints:
+    """
+    Скомпилированные диапазоны одного компонента.
+
+    Диапазоны идут подряд, поэтому уровень значения - это первый диапазон,
+    чья верхняя граница больше значения: bisect по списку верхних границ
+    (или numpy.searchsorted для массива значений).
+    """
+
+    __slots__ = ("component", "name", "unit", "lower", "uppers", "levels", "_indices")
+
+    def __init__(self, component: str, standard: Dict):
+        ranges = standard['ranges']
+        self.component = component
+        self.name = standard['name']
+        self.unit = standard['unit']
+        self.lower = ranges[0][0]
+        self.uppers = [max_val for _, max_val, _, _ in ranges]
+        # Последний элемент - для значений выше всех диапазонов
+        self.levels: List[Tuple[Optional[int], str]] = \
+            [(index, status) for _, _, index, status in ranges] + [OUT_OF_RANGE]
+        self._indices = None
+
+    def classify(self, value: float) -> Tuple[Optional[int], str]:
+        """(индекс, статус) для значения."""
+        if value < self.lower:
+            return OUT_OF_RANGE
+        return self.levels[bisect_right(self.uppers, value)]
+
+    def classify_many(self, values: Sequence[float]):
+        """
+        Индексы 1..5 для массива значений одним проходом numpy
+        (0 - компонент без индекса, как nh3 и no). Без numpy - список.
+        """
+        if np is None:
+            return [self.classify(value)[0] or 0 for value in values]
+
+        if self._indices is None:
+            self._indices = np.array([index or 0 for index, _ in self.levels], dtype=np.int8)
+        values = np.asarray(values, dtype=float)
+        indices = self._indices[np.searchsorted(self.uppers, values, side='right')]
+        return np.where(values < self.lower, OUT_OF_RANGE[0], indices)
+
+
+# Компилируются один раз при импорте
+BREAKPOINTS: Dict[str, Breakpoints] = {
+    component: Breakpoints(component, standard) for component, standard in AIR_QUALITY_STANDARDS.items()
+}
+
+
+def analyze_components(components: Mapping[str, float], extended: bool = False) -> Dict:
+    """
+    Отчет о качестве воздуха по компонентам ответа air_pollution (µg/m³).
+
+    Returns:
+        {'overall_status': 'Хорошо', 'overall_index': 1,
+         'details': [{'component', 'name', 'value', 'unit', 'status', 'index'}, ...],
+         'components_analyzed': 6}
+    """
+    # Приводим ключи к нижнему регистру для унификации
+    components_lower = {k.lower(): v for k, v in components.items()}
+
+    details = []
+    max_index = 0
+    overall_status = "Хорошо"
+
+    for comp_key in MAIN_COMPONENTS:
+        if comp_key in components_lower:
+            value = components_lower[comp_key]
+            breakpoints = BREAKPOINTS[comp_key]
+            index, status = breakpoints.classify(value)
+            details.append({
+                'component': comp_key,
+                'name': breakpoints.name,
+                'value': value,
+                'unit': breakpoints.unit,
+                'status': status,
+                'index': index
+            })
+
+            # Общий индекс = максимальный из всех компонентов
+            if index > max_index:
+                max_index = index
+                overall_status = status
+
+    # Сначала самые загрязненные; сортировка устойчивая, порядок MAIN_COMPONENTS сохраняется
+    details.sort(key=lambda x: -x['index'])
+
+    if extended:
+        for comp_key in EXTRA_COMPONENTS:
+            if comp_key in components_lower:
+                value = components_lower[comp_key]
+                breakpoints = BREAKPOINTS[comp_key]
+                _, status = breakpoints.classify(value)
+                details.append({
+                    'component': comp_key,
+                    'name': breakpoints.name,
+                    'value': value,
+                    'unit': breakpoints.unit,
+                    'status': status,
+                    'index': None
+                })
+
+    return {
+        'overall_status': overall_status,
+        'overall_index': max_index,
+        'details': details,
+        'components_analyzed': len([d for d in details if d['index'] is not None])
+    }
+
+
+def classify_batch(readings: Mapping[str, Sequence[float]]) -> Dict:
+    """
+    Индексы для набора измерений сразу: readings - компонент -> значения
+    (например, один час для многих локаций или много часов одной локации).
+
+    Returns:
+        {'components': {компонент: индексы}, 'overall_index': индексы,
+         'overall_status': [статус, ...]} - массивы numpy одной длины
+        (без numpy - списки). 0 - нет ни одного основного компонента.
+    """
+    indices = {comp_key: BREAKPOINTS[comp_key].classify_many(readings[comp_key])
+               for comp_key in MAIN_COMPONENTS if comp_key in readings}
+    length = len(next(iter(readings.values()), ()))
+
+    if np is not None:
+        overall = np.zeros(length, dtype=np.int8)
+        for values in indices.values():
+            np.maximum(overall, values, out=overall)
+    else:
+        overall = [max(column, default=0) for column in zip(*indices.values())] or [0] * length
+
+    return {
+        'components': indices,
+        'overall_index': overall,
+        'overall_status': [STATUSES.get(int(index), 'Нет данных') for index in overall],
+    }
+
+
+def analyze_series(series: AirPollutionSeries) -> Dict:
+    """
+    Почасовой индекс для ряда air_pollution/forecast или /history.
+
+    Returns:
+        {'dt': [...], 'overall_index': индексы по часам, 'overall_status': [...],
+         'worst_index', 'worst_dt', 'components': {компонент: индексы}}
+    """
+    result = classify_batch(series.components)
+    overall = result['overall_index']
+    if not len(series):
+        worst = None
+    elif np is not None:
+        worst = int(np.argmax(overall))
+    else:
+        worst = overall.index(max(overall))
+    return {
+        'dt': series.dt.tolist(),
+        **result,
+        'worst_index': int(overall[worst]) if worst is not None else 0,
+        'worst_dt': series.dt[worst] if worst is not None else None,
+    }
+
+
+def analyze_series_many(series_list: Sequence[AirPollutionSeries]) -> List[Dict]:
+    """
+    analyze_series для рядов многих локаций: все часы всех локаций
+    классифицируются одним вызовом classify_batch.
+    """
+    if np is None:
+        return [analyze_series(series) for series in series_list]
+
+    bounds = np.cumsum([0] + [len(series) for series in series_list])
+    readings = {comp_key: np.concatenate([np.frombuffer(series.components[comp_key], dtype=float)
+                                          for series in series_list])
+                for comp_key in MAIN_COMPONENTS} if series_list else {}
+    result = classify_batch(readings) if series_list else None
+
+    items = []
+    for i, series in enumerate(series_list):
+        start, stop = bounds[i], bounds[i + 1]
+        overall = result['overall_index'][start:stop]
+        worst = int(np.argmax(overall)) if len(overall) else None
+        items.append({
+            'dt': series.dt.tolist(),
+            'components': {comp_key: values[start:stop] for comp_key, values in result['components'].items()},
+            'overall_index': overall,
+            'overall_status': result['overall_status'][start:stop],
+            'worst_index': int(overall[worst]) if worst is not None else 0,
+            'worst_dt': series.dt[worst] if worst is not None else None,
+        })
+    return items
@@ -1,39 +1,168 @@
 import json
+import threading
 import time
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 from datetime import datetime
 
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import os
 
 # Импорты ВНУТРИ src должны быть относительными (с точкой)
-from exceptions import WeatherAPIError, InvalidAPIKeyError, CityNotFoundError
-from cache_manager import CacheManager
+from exceptions import (
+    WeatherAPIError, InvalidAPIKeyError, CityNotFoundError,
+    RateLimitExceededError, CircuitOpenError
+)
+from cache_manager import CacheManager, mark_stale
+from geocoding_index import GeocodingIndex, normalize_city_name
+from gazetteer import Gazetteer, open_gazetteer
+from single_flight import SingleFlight
+from rate_limiter import RateLimiter, parse_retry_after
+from circuit_breaker import CircuitBreakerRegistry
+from models import CurrentWeather, Forecast, AirPollutionSeries
+from air_quality import analyze_components
+from geo_grid import snap_to_grid
 
 load_dotenv()
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
+CALLS_PER_MINUTE = int(os.getenv("OPENWEATHER_CALLS_PER_MINUTE", "60"))
+CALLS_PER_DAY = int(os.getenv("OPENWEATHER_CALLS_PER_DAY", "30000"))
+# Размер ячейки сетки для координат запросов и радиус поиска соседних данных (км), 0 - выключено
+GRID_CELL_KM = float(os.getenv("OPENWEATHER_GRID_KM", "2"))
+NEAREST_KM = float(os.getenv("OPENWEATHER_NEAREST_KM", "3"))
 
 MAX_RETRIES = 3
 BASE_RETRY_DELAY = 1
+REQUEST_TIMEOUT = 10
+
+GEOCODING_URL = "http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&lang=ru&appid={api_key}"
+WEATHER_URL = ("https://api.openweathermap.org/data/2.5/weather"
+               "?lat={lat}&lon={lon}&units=metric&lang=ru&appid={api_key}")
+FORECAST_URL = ("https://api.openweathermap.org/data/2.5/forecast"
+                "?lat={lat}&lon={lon}&units=metric&lang=ru&appid={api_key}")
+AIR_POLLUTION_URL = "http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
+AIR_POLLUTION_FORECAST_URL = ("http://api.openweathermap.org/data/2.5/air_pollution/forecast"
+                              "?lat={lat}&lon={lon}&appid={api_key}")
+AIR_POLLUTION_HISTORY_URL = ("http://api.openweathermap.org/data/2.5/air_pollution/history"
+                             "?lat={lat}&lon={lon}&start={start}&end={end}&appid={api_key}")
+
+ENDPOINTS = ("weather", "forecast", "air_pollution")
+
+# Пул соединений с keep-alive: pool_connections - сколько хостов держим в пуле
+# (api.openweathermap.org по http и https), pool_maxsize - сколько соединений
+# открыто к одному хосту (должно быть не меньше числа рабочих потоков бота)
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+POOL_BLOCK = False
+PREFETCH_WORKERS = 2
+# Фоновые пакеты (рассылка) идут в своем пуле и не занимают потоки запросов пользователей
+BACKGROUND_WORKERS = 2
+
+
+def create_session(pool_connections: int = POOL_CONNECTIONS,
+                   pool_maxsize: int = POOL_MAXSIZE,
+                   pool_block: bool = POOL_BLOCK) -> requests.Session:
+    """
+    Создает сессию requests с пулом keep-alive соединений.
+
+    Args:
+        pool_connections: Количество пулов (по одному на хост)
+        pool_maxsize: Максимум соединений к одному хосту
+        pool_block: Если True, pool_maxsize - жесткий лимит и лишние потоки ждут
+            свободное соединение; иначе лишние соединения закрываются после запроса
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 class WeatherAPIClient:
-    def __init__(self, api_key: str = None, cache_manager: CacheManager = None):
+    def __init__(self, api_key: str = None, cache_manager: CacheManager = None,
+                 geocoding_index: GeocodingIndex = None,
+                 gazetteer: Gazetteer = None,
+                 rate_limiter: RateLimiter = None,
+                 circuit_breakers: CircuitBreakerRegistry = None,
+                 session: requests.Session = None,
+                 pool_connections: int = POOL_CONNECTIONS,
+                 pool_maxsize: int = POOL_MAXSIZE,
+                 pool_block: bool = POOL_BLOCK,
+                 batch_workers: int = None,
+                 serve_stale: bool = False,
+                 grid_km: float = GRID_CELL_KM,
+                 nearest_km: float = NEAREST_KM):
         self.api_key = api_key or API_KEY
         self.cache_manager = cache_manager or CacheManager()
+        self.geocoding_index = geocoding_index if geocoding_index is not None else GeocodingIndex()
+        # Офлайн-справочник городов (если собран файл): находит город без запроса к API
+        self.gazetteer = gazetteer if gazetteer is not None else open_gazetteer()
+        self.rate_limiter = rate_limiter or RateLimiter(CALLS_PER_MINUTE, CALLS_PER_DAY)
+        self.circuit_breakers = circuit_breakers or CircuitBreakerRegistry()
+        self.session = session or create_session(pool_connections, pool_maxsize, pool_block)
+        # Одинаковые одновременные запросы из разных потоков бота выполняются один раз
+        self.single_flight = SingleFlight()
+        # Пулы потоков для пакетных запросов создаются при первом использовании;
+        # по умолчанию потоков столько же, сколько соединений в пуле сессии
+        self.batch_workers = batch_workers or pool_maxsize
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._executor_lock = threading.Lock()
+        # stale-while-revalidate: отдаем устаревшие данные сразу и обновляем их в фоне
+        self.serve_stale = serve_stale
+        # Координаты запросов привязываются к сетке grid_km, при промахе ищутся
+        # свежие данные ближайшей точки в радиусе nearest_km
+        self.grid_km = grid_km
+        self.nearest_km = nearest_km
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Закрывает все соединения пула и останавливает потоки пакетных запросов."""
+        with self._executor_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=False)
+        self.session.close()
+
+    def _get_executor(self, kind: str = "batch") -> ThreadPoolExecutor:
+        """Пул потоков: 'batch' - запросы пользователей, 'prefetch' и 'background' - фоновые."""
+        with self._executor_lock:
+            executor = self._executors.get(kind)
+            if executor is None:
+                workers = {"batch": self.batch_workers, "prefetch": PREFETCH_WORKERS,
+                           "background": BACKGROUND_WORKERS}[kind]
+                executor = self._executors[kind] = ThreadPoolExecutor(max_workers=workers,
+                                                                      thread_name_prefix=f"weather-{kind}")
+            return executor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def make_request_with_retry(self, url: str, max_retries: int = MAX_RETRIES) -> requests.Response:
         for attempt in range(max_retries):
+            # Ждем своей очереди в лимите или сразу получаем RateLimitExceededError
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
             try:
-                response = requests.get(url, timeout=10)
+                response = self.session.get(url, timeout=REQUEST_TIMEOUT)
                 if response.status_code == 429:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    delay = retry_after if retry_after is not None else BASE_RETRY_DELAY * (2 ** attempt)
+                    # Пауза действует на все потоки: следующий reserve() дождется ее окончания
+                    self.rate_limiter.pause(delay)
                     if attempt < max_retries - 1:
-                        delay = BASE_RETRY_DELAY * (2 ** attempt)
-                        print(f"⚠️ Превышен лимит запросов. Ждём {delay} сек...")
-                        time.sleep(delay)
+                        print(f"⚠️ Превышен лимит запросов. Ждём {delay:.1f} сек...")
                         continue
-                    raise WeatherAPIError("Превышен лимит запросов")
+                    raise RateLimitExceededError("Превышен лимит запросов")
                 return response
             except requests.exceptions.Timeout:
                 if attempt < max_retries - 1:
@@ -51,14 +180,312 @@ class WeatherAPIClient:
                     raise WeatherAPIError("Ошибка соединения")
         raise WeatherAPIError("Не удалось выполнить запрос")
 
+    def _request(self, url: str, endpoint: str) -> requests.Response:
+        """
+        Запрос через circuit breaker типа endpoint.
+
+        Пока API недоступен, запросы отклоняются сразу (CircuitOpenError),
+        не занимая поток на повторы и таймауты.
+        """
+        breaker = self.circuit_breakers.get(endpoint)
+        breaker.before_request()
+        try:
+            response = self.make_request_with_retry(url)
+        except RateLimitExceededError:
+            breaker.cancel()
+            raise
+        except (WeatherAPIError, requests.exceptions.RequestException):
+            breaker.record_failure()
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def _cached(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Читает ответ из кэша, при промахе выполняет запрос и кладет результат в кэш.
+
+        Одновременные промахи по одному ключу объединяются в один запрос.
+        В режиме serve_stale устаревшая запись отдается сразу (с пометкой
+        возраста CACHE_AGE_KEY), а обновление запускается в фоне.
+        """
+        entry = self.cache_manager.get_entry(key, allow_stale=self.serve_stale)
+        if entry is not None and time.time() < entry["expires_at"]:
+            return entry["data"]
+
+        # Свежие данные соседней точки (в пределах nearest_km) лучше устаревших своих
+        nearby = self.cache_manager.get_nearest_entry(key, self.nearest_km)
+        if nearby is not None:
+            return nearby["data"]
+
+        if entry is not None:
+            self._refresh_in_background(key, fetch)
+            return mark_stale(entry["data"], time.time() - entry["fetched_at"])
+
+        try:
+            return self.single_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+        except CircuitOpenError:
+            # API недоступен: отвечаем последним известным значением, если оно есть
+            entry = self.cache_manager.get_entry(key, allow_stale=True)
+            if entry is None:
+                raise
+            return mark_stale(entry["data"], time.time() - entry["fetched_at"])
+
+    def _fetch_and_store(self, key: str, fetch: Callable[[], Any]) -> Any:
+        data = fetch()
+        self.cache_manager.set(key, data)
+        return data
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Any]) -> None:
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.single_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+            except WeatherAPIError as e:
+                print(f"⚠️ Не удалось обновить кэш {key}: {e}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        self._get_executor().submit(refresh)
+
     def get_coordinates(self, city: str) -> Tuple[float, float]:
+        coords = self.geocoding_index.lookup(city)
+        if coords is not None:
+            return coords
+        if self.gazetteer is not None:
+            place = self.gazetteer.lookup(city)
+            if place is not None:
+                return place.lat, place.lon
+        if self.geocoding_index.is_not_found(city):
+            raise CityNotFoundError(f"Город '{city}' не найден")
+
+        key = f"geocode:{normalize_city_name(city)}"
+        return self.single_flight.do(key, lambda: self._resolve_coordinates(city))
+
+    def suggest_cities(self, text: str, limit: int = 5) -> List[str]:
+        """
+        Подсказки названий городов по началу названия или с одной опечаткой
+        (из офлайн-справочника, без запросов к API): ['Москва, RU', ...].
+        """
+        if self.gazetteer is None:
+            return []
+        return [f"{place.name}, {place.country}" if place.country else place.name
+                for place in self.gazetteer.suggest(text, limit)]
+
+    def reverse_geocode(self, lat: float, lon: float) -> Optional[Tuple[str, float, float]]:
+        """
+        Ближайший город из офлайн-справочника: (название, lat, lon) города или None.
+
+        Точка с геолокации заменяется координатами города - теми же, что
+        get_coordinates возвращает для его названия, поэтому у таких запросов
+        общие с поиском по названию кэш, страницы бота и группы рассылки.
+        """
+        if self.gazetteer is None:
+            return None
+        place = self.gazetteer.nearest(lat, lon)
+        if place is None:
+            return None
+        return place.name, place.lat, place.lon
+
+    def _resolve_coordinates(self, city: str) -> Tuple[float, float]:
+        try:
+            place = self._fetch_coordinates(city)
+        except CityNotFoundError:
+            self.geocoding_index.add_not_found(city)
+            raise
+
+        self.geocoding_index.add_place(city, place)
+        return place['lat'], place['lon']
+
+    def get_current_weather(self, lat: float, lon: float) -> CurrentWeather:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("weather", lat, lon)
+        return self._cached(key, lambda: self._fetch_current_weather(lat, lon))
+
+    def get_forecast_5d3h(self, lat: float, lon: float) -> Forecast:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("forecast", lat, lon)
+        return self._cached(key, lambda: self._fetch_forecast_5d3h(lat, lon))
+
+    def get_air_pollution(self, lat: float, lon: float) -> Dict:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution", lat, lon)
+        return self._cached(key, lambda: self._fetch_air_pollution(lat, lon))
+
+    def get_air_pollution_forecast(self, lat: float, lon: float) -> AirPollutionSeries:
+        """Почасовой прогноз загрязнения воздуха (около 4 суток)."""
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution_forecast", lat, lon)
+        url = AIR_POLLUTION_FORECAST_URL.format(lat=lat, lon=lon, api_key=self.api_key)
+        return self._cached(key, lambda: self._fetch_air_pollution_series(url, "air_pollution_forecast"))
+
+    def get_air_pollution_history(self, lat: float, lon: float, start: int, end: int) -> AirPollutionSeries:
+        """Почасовая история загрязнения воздуха за [start, end] (unix time, UTC)."""
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution_history", lat, lon, str(int(start)), str(int(end)))
+        url = AIR_POLLUTION_HISTORY_URL.format(lat=lat, lon=lon, start=int(start), end=int(end),
+                                               api_key=self.api_key)
+        return self._cached(key, lambda: self._fetch_air_pollution_series(url, "air_pollution_history"))
+
+    def data_version(self, endpoint: str, lat: float, lon: float, data: Any) -> Optional[float]:
+        """
+        Версия данных, которые get_* вернул для точки: время загрузки их записи
+        в кэше. None, если это не данные своей свежей записи (устаревшие или
+        соседней точки) - по таким не стоит кэшировать производные.
+        """
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        return self.cache_manager.fetched_at(self.cache_manager.make_key(endpoint, lat, lon), data)
+
+    def _fetch_endpoint(self, endpoint: str, lat: float, lon: float) -> Any:
+        if endpoint == "weather":
+            return self.get_current_weather(lat, lon)
+        if endpoint == "forecast":
+            return self.get_forecast_5d3h(lat, lon)
+        if endpoint == "air_pollution":
+            return self.get_air_pollution(lat, lon)
+        if endpoint == "air_pollution_forecast":
+            return self.get_air_pollution_forecast(lat, lon)
+        raise ValueError(f"Неизвестный тип запроса: {endpoint}")
+
+    def _fetch_background(self, endpoint: str, lat: float, lon: float) -> Any:
+        with self.rate_limiter.background():
+            return self._fetch_endpoint(endpoint, lat, lon)
+
+    # Пакетные запросы
+
+    def _run_batch(self, calls: List[Callable[[], Any]], kind: str = "batch") -> List[Any]:
+        """
+        Выполняет вызовы параллельно в пуле потоков клиента kind.
+
+        Результаты возвращаются в порядке calls; исключение отдельного вызова
+        попадает в список на его место, а не прерывает остальные.
+        """
+        executor = self._get_executor(kind)
+        futures = [executor.submit(call) for call in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def get_weather_many(self, cities: Sequence[str]) -> List[Dict]:
+        """
+        Текущая погода для списка городов: геокодинг и запрос погоды идут параллельно.
+
+        Returns:
+            Список в порядке cities: [{'city', 'lat', 'lon', 'weather', 'error'}, ...].
+            При ошибке по городу weather = None, а error содержит исключение.
+        """
+        def fetch_city(city):
+            lat, lon = self.get_coordinates(city)
+            return lat, lon, self.get_current_weather(lat, lon)
+
+        results = self._run_batch([lambda c=c: fetch_city(c) for c in cities])
+
+        items = []
+        for city, result in zip(cities, results):
+            if isinstance(result, Exception):
+                items.append({'city': city, 'lat': None, 'lon': None, 'weather': None, 'error': result})
+            else:
+                lat, lon, weather = result
+                items.append({'city': city, 'lat': lat, 'lon': lon, 'weather': weather, 'error': None})
+        return items
+
+    def get_bundle_many(self, locations: Sequence[Tuple[float, float]],
+                        endpoints: Sequence[str] = ENDPOINTS,
+                        background: bool = False) -> List[Dict]:
+        """
+        Несколько типов данных для списка координат, все запросы параллельно.
+
+        Args:
+            background: Фоновые запросы (рассылка): выполняются в своем пуле
+                потоков и в rate limiter'е пропускают вперед запросы пользователей
+
+        Returns:
+            Список в порядке locations: [{'lat', 'lon', 'weather', 'forecast',
+            'air_pollution', 'errors': {endpoint: исключение}}, ...].
+        """
+        tasks = [(i, endpoint, lat, lon)
+                 for i, (lat, lon) in enumerate(locations)
+                 for endpoint in endpoints]
+        if background:
+            results = self._run_batch([lambda t=t: self._fetch_background(t[1], t[2], t[3]) for t in tasks],
+                                      "background")
+        else:
+            results = self._run_batch([lambda t=t: self._fetch_endpoint(t[1], t[2], t[3]) for t in tasks])
+
+        items = [{'lat': lat, 'lon': lon, 'errors': {}} for lat, lon in locations]
+        for (i, endpoint, _, _), result in zip(tasks, results):
+            if isinstance(result, Exception):
+                items[i][endpoint] = None
+                items[i]['errors'][endpoint] = result
+            else:
+                items[i][endpoint] = result
+        return items
+
+    def get_location_bundle(self, lat: float, lon: float) -> Dict:
+        """
+        Текущая погода, прогноз и качество воздуха для точки: три запроса параллельно.
+
+        Полный набор кэшируется одной записью 'bundle:...' (со сроком жизни
+        самой короткоживущей части), поэтому повторный вызов - одно чтение
+        из кэша. Набор с ошибками не кэшируется.
+
+        Returns:
+            {'lat', 'lon', 'weather', 'forecast', 'air_pollution',
+             'errors': {endpoint: исключение}}
+        """
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("bundle", lat, lon)
+
+        entry = self.cache_manager.get_entry(key)
+        if entry is None:
+            entry = self.cache_manager.get_nearest_entry(key, self.nearest_km)
+        if entry is not None:
+            return {**entry["data"], 'lat': lat, 'lon': lon, 'errors': {}}
+
+        return self.single_flight.do(key, lambda: self._fetch_location_bundle(key, lat, lon))
+
+    def _fetch_location_bundle(self, key: str, lat: float, lon: float) -> Dict:
+        bundle = self.get_bundle_many([(lat, lon)], ENDPOINTS)[0]
+        if not bundle['errors']:
+            self.cache_manager.set(key, {endpoint: bundle[endpoint] for endpoint in ENDPOINTS})
+        return bundle
+
+    def prefetch_location_bundle(self, lat: float, lon: float) -> None:
+        """
+        Загружает набор данных для точки в фоне, не дожидаясь результата.
+
+        Бот вызывает это после первого ответа, чтобы нажатия кнопок
+        "Прогноз" и "Качество воздуха" обслуживались из кэша.
+        """
+        def prefetch():
+            try:
+                self.get_location_bundle(lat, lon)
+            except WeatherAPIError as e:
+                print(f"⚠️ Не удалось загрузить данные для {lat}, {lon}: {e}")
+
+        # Отдельный пул: prefetch ждет запросы из основного пула и не должен его занимать
+        self._get_executor("prefetch").submit(prefetch)
+
+    def _fetch_coordinates(self, city: str) -> Dict:
         if not self.api_key:
             raise InvalidAPIKeyError("API-ключ не найден")
 
-        url = f"http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&lang=ru&appid={self.api_key}"
+        url = GEOCODING_URL.format(city=city, api_key=self.api_key)
 
         try:
-            response = self.make_request_with_retry(url)
+            response = self._request(url, "geocode")
             if response.status_code == 401:
                 raise InvalidAPIKeyError("Неверный API-ключ")
             elif response.status_code != 200:
@@ -68,52 +495,56 @@ class WeatherAPIClient:
             if not data:
                 raise CityNotFoundError(f"Город '{city}' не найден")
 
-            return data[0]['lat'], data[0]['lon']
+            return data[0]
         except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
             raise WeatherAPIError(f"Ошибка при получении координат: {str(e)}")
 
-    def get_current_weather(self, lat: float, lon: float) -> Dict:
+    def _fetch_current_weather(self, lat: float, lon: float) -> CurrentWeather:
         if not self.api_key:
             raise InvalidAPIKeyError("API-ключ не найден")
 
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&lang=ru&appid={self.api_key}"
+        url = WEATHER_URL.format(lat=lat, lon=lon, api_key=self.api_key)
 
         try:
-            response = self.make_request_with_retry(url)
+            response = self._request(url, "weather")
             if response.status_code == 401:
                 raise InvalidAPIKeyError("Неверный API-ключ")
             elif response.status_code != 200:
                 raise WeatherAPIError(f"Ошибка API: {response.status_code}")
 
-            return response.json()
+            return CurrentWeather.from_api(response.json())
         except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
             raise WeatherAPIError(f"Ошибка при получении погоды: {str(e)}")
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные о погоде: {str(e)}")
 
-    def get_forecast_5d3h(self, lat: float, lon: float) -> Dict:
+    def _fetch_forecast_5d3h(self, lat: float, lon: float) -> Forecast:
         if not self.api_key:
             raise InvalidAPIKeyError("API-ключ не найден")
 
-        url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&lang=ru&appid={self.api_key}"
+        url = FORECAST_URL.format(lat=lat, lon=lon, api_key=self.api_key)
 
         try:
-            response = self.make_request_with_retry(url)
+            response = self._request(url, "forecast")
             if response.status_code == 401:
                 raise InvalidAPIKeyError("Неверный API-ключ")
             elif response.status_code != 200:
                 raise WeatherAPIError(f"Ошибка API прогноза: {response.status_code}")
 
-            return response.json()
+            return Forecast.from_api(response.json())
         except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
             raise WeatherAPIError(f"Ошибка при получении прогноза: {str(e)}")
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные прогноза: {str(e)}")
 
-    def get_air_pollution(self, lat: float, lon: float) -> Dict:
+    def _fetch_air_pollution(self, lat: float, lon: float) -> Dict:
         if not self.api_key:
             raise InvalidAPIKeyError("API-ключ не найден")
 
-        url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={self.api_key}"
+        url = AIR_POLLUTION_URL.format(lat=lat, lon=lon, api_key=self.api_key)
 
         try:
-            response = self.make_request_with_retry(url)
+            response = self._request(url, "air_pollution")
             if response.status_code == 401:
                 raise InvalidAPIKeyError("Неверный API-ключ")
             elif response.status_code != 200:
@@ -126,6 +557,23 @@ class WeatherAPIClient:
         except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
             raise WeatherAPIError(f"Ошибка при получении загрязнения: {str(e)}")
 
+    def _fetch_air_pollution_series(self, url: str, endpoint: str) -> AirPollutionSeries:
+        if not self.api_key:
+            raise InvalidAPIKeyError("API-ключ не найден")
+
+        try:
+            response = self._request(url, endpoint)
+            if response.status_code == 401:
+                raise InvalidAPIKeyError("Неверный API-ключ")
+            elif response.status_code != 200:
+                raise WeatherAPIError(f"Ошибка API загрязнения: {response.status_code}")
+
+            return AirPollutionSeries.from_api(response.json())
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            raise WeatherAPIError(f"Ошибка при получении загрязнения: {str(e)}")
+        except (KeyError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные о загрязнении: {str(e)}")
+
     def analyze_air_pollution(self, components: dict, extended: bool = False) -> dict:
         """
         Анализирует компоненты загрязнения воздуха и возвращает отчет.
@@ -141,152 +589,7 @@ class WeatherAPIClient:
                 'details': [{'component': 'SO2', 'value': 15.0, 'status': 'Хорошо', 'index': 1}, ...]
             }
         """
-        # Таблица качества воздуха (из твоего скриншота)
-        AIR_QUALITY_STANDARDS = {
-            'so2': {
-                'ranges': [
-                    (0, 20, 1, 'Хорошо'),
-                    (20, 80, 2, 'Удовлетворительно'),
-                    (80, 250, 3, 'Умеренно'),
-                    (250, 350, 4, 'Плохо'),
-                    (350, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Диоксид серы (SO₂)',
-                'unit': 'µg/m³'
-            },
-            'no2': {
-                'ranges': [
-                    (0, 40, 1, 'Хорошо'),
-                    (40, 70, 2, 'Удовлетворительно'),
-                    (70, 150, 3, 'Умеренно'),
-                    (150, 200, 4, 'Плохо'),
-                    (200, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Диоксид азота (NO₂)',
-                'unit': 'µg/m³'
-            },
-            'pm10': {
-                'ranges': [
-                    (0, 20, 1, 'Хорошо'),
-                    (20, 50, 2, 'Удовлетворительно'),
-                    (50, 100, 3, 'Умеренно'),
-                    (100, 200, 4, 'Плохо'),
-                    (200, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Частицы PM₁₀',
-                'unit': 'µg/m³'
-            },
-            'pm2_5': {
-                'ranges': [
-                    (0, 10, 1, 'Хорошо'),
-                    (10, 25, 2, 'Удовлетворительно'),
-                    (25, 50, 3, 'Умеренно'),
-                    (50, 75, 4, 'Плохо'),
-                    (75, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Частицы PM₂.₅',
-                'unit': 'µg/m³'
-            },
-            'o3': {
-                'ranges': [
-                    (0, 60, 1, 'Хорошо'),
-                    (60, 100, 2, 'Удовлетворительно'),
-                    (100, 140, 3, 'Умеренно'),
-                    (140, 180, 4, 'Плохо'),
-                    (180, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Озон (O₃)',
-                'unit': 'µg/m³'
-            },
-            'co': {
-                'ranges': [
-                    (0, 4400, 1, 'Хорошо'),
-                    (4400, 9400, 2, 'Удовлетворительно'),
-                    (9400, 12400, 3, 'Умеренно'),
-                    (12400, 15400, 4, 'Плохо'),
-                    (15400, float('inf'), 5, 'Очень плохо')
-                ],
-                'name': 'Угарный газ (CO)',
-                'unit': 'µg/m³'
-            },
-            # Дополнительные параметры (не влияют на общий индекс)
-            'nh3': {
-                'ranges': [(0.1, 200, None, 'В норме')],
-                'name': 'Аммиак (NH₃)',
-                'unit': 'µg/m³'
-            },
-            'no': {
-                'ranges': [(0.1, 100, None, 'В норме')],
-                'name': 'Оксид азота (NO)',
-                'unit': 'µg/m³'
-            }
-        }
-
-        def get_component_status(value: float, ranges: list):
-            """Определяет статус компонента по значению."""
-            for min_val, max_val, index, status in ranges:
-                if min_val <= value < max_val:
-                    return status, index
-            # Если значение выше максимального
-            return 'Очень плохо', 5
-
-        # Основные компоненты, которые влияют на общий индекс
-        # Приводим ключи к нижнему регистру для унификации
-        components_lower = {k.lower(): v for k, v in components.items()}
-
-        main_components = ['so2', 'no2', 'pm10', 'pm2_5', 'o3', 'co']
-
-        details = []
-        max_index = 0
-        overall_status = "Хорошо"
-
-        # Анализируем каждый компонент
-        for comp_key in main_components:
-            if comp_key in components_lower:
-                value = components_lower[comp_key]
-                comp_info = AIR_QUALITY_STANDARDS[comp_key]
-                status, index = get_component_status(value, comp_info['ranges'])
-
-                details.append({
-                    'component': comp_key,
-                    'name': comp_info['name'],
-                    'value': value,
-                    'unit': comp_info['unit'],
-                    'status': status,
-                    'index': index
-                })
-
-                # Общий индекс = максимальный из всех компонентов
-                if index and index > max_index:
-                    max_index = index
-                    overall_status = status
-
-        # Добавляем дополнительные компоненты при расширенном режиме
-        if extended:
-            for comp_key in ['nh3', 'no']:
-                if comp_key in components_lower:
-                    value = components_lower[comp_key]
-                    comp_info = AIR_QUALITY_STANDARDS[comp_key]
-                    status, _ = get_component_status(value, comp_info['ranges'])
-
-                    details.append({
-                        'component': comp_key,
-                        'name': comp_info['name'],
-                        'value': value,
-                        'unit': comp_info['unit'],
-                        'status': status,
-                        'index': None
-                    })
-
-        # Сортируем детали по важности (сначала основные)
-        details.sort(key=lambda x: (x['index'] is None, -x['index'] if x['index'] else 0))
-
-        return {
-            'overall_status': overall_status,
-            'overall_index': max_index,
-            'details': details,
-            'components_analyzed': len([d for d in details if d['index'] is not None])
-        }
+        return analyze_components(components, extended)
 
 # Тестовая функция
 def test_client():
@@ -311,11 +614,11 @@ def test_client():
 
         print("🌤️ Получаем погоду...")
         weather = client.get_current_weather(lat, lon)
-        print(f"✅ Температура: {weather['main']['temp']:.1f}°C")
+        print(f"✅ Температура: {weather.temp:.1f}°C")
 
         print("📅 Получаем прогноз...")
         forecast = client.get_forecast_5d3h(lat, lon)
-        print(f"✅ Прогнозов: {forecast['cnt']}")
+        print(f"✅ Прогнозов: {forecast.cnt}")
 
         print("🌬️ Получаем качество воздуха...")
         components = client.get_air_pollution(lat, lon)
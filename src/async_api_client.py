@@ -0,0 +1,389 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple
+
+import aiohttp
+
+from exceptions import (
+    WeatherAPIError, InvalidAPIKeyError, CityNotFoundError,
+    RateLimitExceededError, CircuitOpenError
+)
+from cache_manager import CacheManager, mark_stale
+from geocoding_index import GeocodingIndex, normalize_city_name
+from gazetteer import Gazetteer, open_gazetteer
+from single_flight import AsyncSingleFlight
+from rate_limiter import RateLimiter, parse_retry_after
+from circuit_breaker import CircuitBreakerRegistry
+from models import CurrentWeather, Forecast, AirPollutionSeries
+from geo_grid import snap_to_grid
+from api_client import (
+    API_KEY, MAX_RETRIES, BASE_RETRY_DELAY, REQUEST_TIMEOUT, POOL_MAXSIZE,
+    CALLS_PER_MINUTE, CALLS_PER_DAY, GRID_CELL_KM, NEAREST_KM,
+    GEOCODING_URL, WEATHER_URL, FORECAST_URL, AIR_POLLUTION_URL, ENDPOINTS,
+    AIR_POLLUTION_FORECAST_URL, AIR_POLLUTION_HISTORY_URL,
+    WeatherAPIClient
+)
+
+# Сколько запросов одновременно выполняют fan-out помощники (get_weather_many и др.)
+DEFAULT_CONCURRENCY = 10
+POOL_LIMIT = 100
+
+
+class AsyncWeatherAPIClient:
+    """
+    Асинхронный аналог WeatherAPIClient на aiohttp.
+
+    Все запросы идут через один ClientSession с общим пулом соединений,
+    паузы между повторами не блокируют поток (asyncio.sleep). Кэш ответов и
+    индекс геокодинга общие с синхронным клиентом, если передать те же объекты.
+
+    CacheManager и запись индекса геокодинга блокируют поток (блокировки,
+    SQLite, файлы), поэтому вызываются через asyncio.to_thread и не
+    останавливают цикл событий.
+    """
+
+    # Анализ и подсказки городов не делают запросов, поэтому берем реализацию синхронного клиента
+    analyze_air_pollution = WeatherAPIClient.analyze_air_pollution
+    suggest_cities = WeatherAPIClient.suggest_cities
+    reverse_geocode = WeatherAPIClient.reverse_geocode
+
+    def __init__(self, api_key: str = None, cache_manager: CacheManager = None,
+                 geocoding_index: GeocodingIndex = None,
+                 gazetteer: Gazetteer = None,
+                 rate_limiter: RateLimiter = None,
+                 circuit_breakers: CircuitBreakerRegistry = None,
+                 session: aiohttp.ClientSession = None,
+                 pool_limit: int = POOL_LIMIT,
+                 pool_limit_per_host: int = POOL_MAXSIZE,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 serve_stale: bool = False,
+                 grid_km: float = GRID_CELL_KM,
+                 nearest_km: float = NEAREST_KM):
+        self.api_key = api_key or API_KEY
+        self.cache_manager = cache_manager or CacheManager()
+        self.geocoding_index = geocoding_index if geocoding_index is not None else GeocodingIndex()
+        self.gazetteer = gazetteer if gazetteer is not None else open_gazetteer()
+        self.rate_limiter = rate_limiter or RateLimiter(CALLS_PER_MINUTE, CALLS_PER_DAY)
+        self.circuit_breakers = circuit_breakers or CircuitBreakerRegistry()
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.concurrency = concurrency
+        self.single_flight = AsyncSingleFlight()
+        self.serve_stale = serve_stale
+        # Координаты запросов привязываются к сетке grid_km, при промахе ищутся
+        # свежие данные ближайшей точки в радиусе nearest_km
+        self.grid_km = grid_km
+        self.nearest_km = nearest_km
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self._session = session
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Сессию создаем лениво: ей нужен работающий event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_limit,
+                                             limit_per_host=self.pool_limit_per_host)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Закрывает сессию и все соединения пула."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def make_request_with_retry(self, url: str, max_retries: int = MAX_RETRIES) -> Tuple[int, Any]:
+        """Выполняет GET-запрос с повторами. Возвращает (код ответа, JSON тела или None)."""
+        session = await self._get_session()
+        for attempt in range(max_retries):
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                async with session.get(url) as response:
+                    if response.status == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        delay = retry_after if retry_after is not None else BASE_RETRY_DELAY * (2 ** attempt)
+                        self.rate_limiter.pause(delay)
+                        if attempt < max_retries - 1:
+                            print(f"⚠️ Превышен лимит запросов. Ждём {delay:.1f} сек...")
+                            continue
+                        raise RateLimitExceededError("Превышен лимит запросов")
+                    if response.status != 200:
+                        return response.status, None
+                    return response.status, await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                if attempt < max_retries - 1:
+                    delay = BASE_RETRY_DELAY * (2 ** attempt)
+                    print(f"⚠️ Таймаут. Ждём {delay} сек...")
+                    await asyncio.sleep(delay)
+                else:
+                    raise WeatherAPIError("Сервер не отвечает")
+            except aiohttp.ClientConnectionError:
+                if attempt < max_retries - 1:
+                    delay = BASE_RETRY_DELAY * (2 ** attempt)
+                    print(f"⚠️ Ошибка соединения. Ждём {delay} сек...")
+                    await asyncio.sleep(delay)
+                else:
+                    raise WeatherAPIError("Ошибка соединения")
+        raise WeatherAPIError("Не удалось выполнить запрос")
+
+    async def _get_json(self, url: str, endpoint: str, status_error: str, request_error: str) -> Any:
+        if not self.api_key:
+            raise InvalidAPIKeyError("API-ключ не найден")
+
+        breaker = self.circuit_breakers.get(endpoint)
+        breaker.before_request()
+        try:
+            status, data = await self.make_request_with_retry(url)
+        except RateLimitExceededError:
+            breaker.cancel()
+            raise
+        except WeatherAPIError:
+            breaker.record_failure()
+            raise
+        except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            breaker.record_failure()
+            raise WeatherAPIError(f"{request_error}: {str(e)}")
+
+        if status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if status == 401:
+            raise InvalidAPIKeyError("Неверный API-ключ")
+        elif status != 200:
+            raise WeatherAPIError(f"{status_error}: {status}")
+        return data
+
+    async def _cached(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = await asyncio.to_thread(self.cache_manager.get_entry, key, self.serve_stale)
+        if entry is not None and time.time() < entry["expires_at"]:
+            return entry["data"]
+
+        # Свежие данные соседней точки (в пределах nearest_km) лучше устаревших своих
+        nearby = await asyncio.to_thread(self.cache_manager.get_nearest_entry, key, self.nearest_km)
+        if nearby is not None:
+            return nearby["data"]
+
+        if entry is not None:
+            self._refresh_in_background(key, fetch)
+            return mark_stale(entry["data"], time.time() - entry["fetched_at"])
+
+        try:
+            return await self.single_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+        except CircuitOpenError:
+            entry = await asyncio.to_thread(self.cache_manager.get_entry, key, True)
+            if entry is None:
+                raise
+            return mark_stale(entry["data"], time.time() - entry["fetched_at"])
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        data = await fetch()
+        await asyncio.to_thread(self.cache_manager.set, key, data)
+        return data
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refresh_tasks:
+            return
+
+        async def refresh():
+            try:
+                await self.single_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+            except WeatherAPIError as e:
+                print(f"⚠️ Не удалось обновить кэш {key}: {e}")
+            finally:
+                self._refresh_tasks.pop(key, None)
+
+        self._refresh_tasks[key] = asyncio.ensure_future(refresh())
+
+    async def get_coordinates(self, city: str) -> Tuple[float, float]:
+        coords = self.geocoding_index.lookup(city)
+        if coords is not None:
+            return coords
+        if self.gazetteer is not None:
+            place = self.gazetteer.lookup(city)
+            if place is not None:
+                return place.lat, place.lon
+        if self.geocoding_index.is_not_found(city):
+            raise CityNotFoundError(f"Город '{city}' не найден")
+
+        key = f"geocode:{normalize_city_name(city)}"
+        return await self.single_flight.do(key, lambda: self._resolve_coordinates(city))
+
+    async def _resolve_coordinates(self, city: str) -> Tuple[float, float]:
+        url = GEOCODING_URL.format(city=city, api_key=self.api_key)
+        data = await self._get_json(url, "geocode", "Ошибка API", "Ошибка при получении координат")
+        if not data:
+            await asyncio.to_thread(self.geocoding_index.add_not_found, city)
+            raise CityNotFoundError(f"Город '{city}' не найден")
+
+        await asyncio.to_thread(self.geocoding_index.add_place, city, data[0])
+        return data[0]['lat'], data[0]['lon']
+
+    async def get_current_weather(self, lat: float, lon: float) -> CurrentWeather:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("weather", lat, lon)
+        return await self._cached(key, lambda: self._fetch_current_weather(lat, lon))
+
+    async def get_forecast_5d3h(self, lat: float, lon: float) -> Forecast:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("forecast", lat, lon)
+        return await self._cached(key, lambda: self._fetch_forecast_5d3h(lat, lon))
+
+    async def get_air_pollution(self, lat: float, lon: float) -> Dict:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution", lat, lon)
+        return await self._cached(key, lambda: self._fetch_air_pollution(lat, lon))
+
+    async def get_air_pollution_forecast(self, lat: float, lon: float) -> AirPollutionSeries:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution_forecast", lat, lon)
+        url = AIR_POLLUTION_FORECAST_URL.format(lat=lat, lon=lon, api_key=self.api_key)
+        return await self._cached(key, lambda: self._fetch_air_pollution_series(url, "air_pollution_forecast"))
+
+    async def get_air_pollution_history(self, lat: float, lon: float, start: int, end: int) -> AirPollutionSeries:
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("air_pollution_history", lat, lon, str(int(start)), str(int(end)))
+        url = AIR_POLLUTION_HISTORY_URL.format(lat=lat, lon=lon, start=int(start), end=int(end),
+                                               api_key=self.api_key)
+        return await self._cached(key, lambda: self._fetch_air_pollution_series(url, "air_pollution_history"))
+
+    async def _fetch_current_weather(self, lat: float, lon: float) -> CurrentWeather:
+        url = WEATHER_URL.format(lat=lat, lon=lon, api_key=self.api_key)
+        data = await self._get_json(url, "weather", "Ошибка API", "Ошибка при получении погоды")
+        try:
+            return CurrentWeather.from_api(data)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные о погоде: {str(e)}")
+
+    async def _fetch_forecast_5d3h(self, lat: float, lon: float) -> Forecast:
+        url = FORECAST_URL.format(lat=lat, lon=lon, api_key=self.api_key)
+        data = await self._get_json(url, "forecast", "Ошибка API прогноза", "Ошибка при получении прогноза")
+        try:
+            return Forecast.from_api(data)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные прогноза: {str(e)}")
+
+    async def _fetch_air_pollution(self, lat: float, lon: float) -> Dict:
+        url = AIR_POLLUTION_URL.format(lat=lat, lon=lon, api_key=self.api_key)
+        data = await self._get_json(url, "air_pollution", "Ошибка API загрязнения",
+                                    "Ошибка при получении загрязнения")
+        if 'list' in data and len(data['list']) > 0:
+            return data['list'][0]['components']
+        raise WeatherAPIError("Нет данных о загрязнении")
+
+    async def _fetch_air_pollution_series(self, url: str, endpoint: str) -> AirPollutionSeries:
+        data = await self._get_json(url, endpoint, "Ошибка API загрязнения",
+                                    "Ошибка при получении загрязнения")
+        try:
+            return AirPollutionSeries.from_api(data)
+        except (KeyError, TypeError, ValueError) as e:
+            raise WeatherAPIError(f"Неполные данные о загрязнении: {str(e)}")
+
+    # Параллельные запросы
+
+    async def gather_limited(self, factories: Iterable[Callable[[], Awaitable[Any]]],
+                             concurrency: int = None) -> List[Any]:
+        """
+        Выполняет корутины не более чем по concurrency одновременно.
+
+        Результаты возвращаются в порядке factories; исключение отдельной задачи
+        попадает в список на ее место, а не прерывает остальные.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def run(factory):
+            async with semaphore:
+                return await factory()
+
+        return await asyncio.gather(*(run(f) for f in factories), return_exceptions=True)
+
+    async def _fetch_endpoint(self, endpoint: str, lat: float, lon: float) -> Any:
+        if endpoint == "weather":
+            return await self.get_current_weather(lat, lon)
+        if endpoint == "forecast":
+            return await self.get_forecast_5d3h(lat, lon)
+        if endpoint == "air_pollution":
+            return await self.get_air_pollution(lat, lon)
+        if endpoint == "air_pollution_forecast":
+            return await self.get_air_pollution_forecast(lat, lon)
+        raise ValueError(f"Неизвестный тип запроса: {endpoint}")
+
+    async def get_weather_many(self, cities: Sequence[str], concurrency: int = None) -> List[Dict]:
+        """
+        Текущая погода для списка городов.
+
+        Returns:
+            Список в порядке cities: [{'city', 'lat', 'lon', 'weather', 'error'}, ...].
+            При ошибке по городу weather = None, а error содержит исключение.
+        """
+        async def fetch_city(city):
+            lat, lon = await self.get_coordinates(city)
+            return lat, lon, await self.get_current_weather(lat, lon)
+
+        results = await self.gather_limited([lambda c=c: fetch_city(c) for c in cities], concurrency)
+
+        items = []
+        for city, result in zip(cities, results):
+            if isinstance(result, BaseException):
+                items.append({'city': city, 'lat': None, 'lon': None, 'weather': None, 'error': result})
+            else:
+                lat, lon, weather = result
+                items.append({'city': city, 'lat': lat, 'lon': lon, 'weather': weather, 'error': None})
+        return items
+
+    async def get_bundle_many(self, locations: Sequence[Tuple[float, float]],
+                              endpoints: Sequence[str] = ENDPOINTS,
+                              concurrency: int = None) -> List[Dict]:
+        """
+        Несколько типов данных для списка координат, все запросы параллельно.
+
+        Returns:
+            Список в порядке locations: [{'lat', 'lon', 'weather', 'forecast',
+            'air_pollution', 'errors': {endpoint: исключение}}, ...].
+        """
+        tasks = [(i, endpoint, lat, lon)
+                 for i, (lat, lon) in enumerate(locations)
+                 for endpoint in endpoints]
+        results = await self.gather_limited(
+            [lambda t=t: self._fetch_endpoint(t[1], t[2], t[3]) for t in tasks], concurrency)
+
+        items = [{'lat': lat, 'lon': lon, 'errors': {}} for lat, lon in locations]
+        for (i, endpoint, _, _), result in zip(tasks, results):
+            if isinstance(result, BaseException):
+                items[i][endpoint] = None
+                items[i]['errors'][endpoint] = result
+            else:
+                items[i][endpoint] = result
+        return items
+
+    async def get_location_bundle(self, lat: float, lon: float) -> Dict:
+        """Асинхронный аналог WeatherAPIClient.get_location_bundle (тот же ключ кэша 'bundle:...')."""
+        lat, lon = snap_to_grid(lat, lon, self.grid_km)
+        key = self.cache_manager.make_key("bundle", lat, lon)
+
+        entry = await asyncio.to_thread(self.cache_manager.get_entry, key)
+        if entry is None:
+            entry = await asyncio.to_thread(self.cache_manager.get_nearest_entry, key, self.nearest_km)
+        if entry is not None:
+            return {**entry["data"], 'lat': lat, 'lon': lon, 'errors': {}}
+
+        return await self.single_flight.do(key, lambda: self._fetch_location_bundle(key, lat, lon))
+
+    async def _fetch_location_bundle(self, key: str, lat: float, lon: float) -> Dict:
+        bundle = (await self.get_bundle_many([(lat, lon)], ENDPOINTS))[0]
+        if not bundle['errors']:
+            await asyncio.to_thread(self.cache_manager.set, key,
+                                    {endpoint: bundle[endpoint] for endpoint in ENDPOINTS})
+        return bundle
@@ -1,66 +1,553 @@
+import atexit
 import json
 import os
-from datetime import datetime, timedelta
-from typing import Optional, Dict
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from models import decode_model, with_cache_age
+from serialization import default_format, is_binary_file, parse_format, read_entries, write_entries
+from cache_store import CACHE_DB_FILE, SQLiteCacheStore
+from geo_grid import SpatialIndex
+
+# Время жизни записей по типам запросов (в секундах)
+DEFAULT_TTLS = {
+    "weather": 10 * 60,
+    "forecast": 60 * 60,
+    "air_pollution": 60 * 60,
+    "air_pollution_forecast": 60 * 60,
+    # Прошедшие часы не меняются
+    "air_pollution_history": 24 * 60 * 60,
+    # Набор weather + forecast + air_pollution живет как самая короткая его часть
+    "bundle": 10 * 60,
+}
+
+# Сколько устаревшая запись еще может отдаваться в режиме stale-while-revalidate (сек)
+MAX_STALE = 3 * 60 * 60
+
+MAX_ENTRIES = 1000
+COORD_PRECISION = 4
+SAVE_INTERVAL = 30  # не чаще одной записи файла кэша за интервал (сек)
+
+CACHE_FILE = "weather_cache.bin"
+LEGACY_CACHE_FILE = "weather_cache.json"   # прежний формат, читается один раз при переходе
+# Формат файла кэша: кодек + сжатие ('msgpack+zstd', 'msgpack+lz4', 'json+zlib', 'json+none')
+CACHE_FORMAT = os.getenv("WEATHER_CACHE_FORMAT") or default_format()
+
+# sqlite - записи процесса в памяти (L1) поверх общей базы SQLite (L2): бот,
+# CLI и несколько процессов бота видят один кэш; file - кэш одного процесса,
+# периодически сохраняемый в файл
+CACHE_BACKEND = os.getenv("WEATHER_CACHE_BACKEND", "sqlite")
+CACHE_DB = os.getenv("WEATHER_CACHE_DB", CACHE_DB_FILE)
+SYNC_INTERVAL = 1.0  # не чаще одной проверки чужих изменений L2 за интервал (сек)
+PURGE_INTERVAL = 60  # как часто фоновый поток чистит L2 от истекших записей (сек)
+
+# Ключ, которым помечаются устаревшие данные: возраст в секундах
+CACHE_AGE_KEY = "_cache_age"
+
+
+def mark_stale(data: Any, age: float) -> Any:
+    """Возвращает копию данных с пометкой возраста (поле cache_age модели или ключ словаря)."""
+    if hasattr(data, 'cache_age'):
+        return with_cache_age(data, age)
+    if isinstance(data, dict):
+        return {**data, CACHE_AGE_KEY: age}
+    return data
 
 
 class CacheManager:
-    def __init__(self, cache_file: str = "weather_cache.json", ttl_hours: int = 3):
+    """
+    Кэш ответов API: по записи на каждую пару (тип запроса, координаты).
+
+    Записи живут в памяти в порядке LRU, при переполнении вытесняются самые
+    старые по использованию. Истекшие записи хранятся еще max_stale секунд,
+    чтобы их можно было отдать, пока идет фоновое обновление.
+
+    С backend='sqlite' записи в памяти - это L1 перед общей базой (L2,
+    SQLiteCacheStore): set пишет в обе, промах L1 читает запись из L2 и
+    поднимает ее в L1. Раз в SYNC_INTERVAL кэш запрашивает изменения L2
+    после последней виденной версии и выбрасывает из L1 записи, которые
+    другой процесс обновил или удалил. Пространственный индекс покрывает
+    все ключи L2, поэтому ближайшие точки находятся и среди чужих записей.
+    Запросы к SQLite идут без блокировки L1, под ней только применяется
+    результат. Истекшие записи L2 удаляет фоновый поток раз в PURGE_INTERVAL
+    (запускается при первой записи или через start()), он же пересобирает
+    индекс.
+
+    С backend='file' кэш живет только в памяти процесса и периодически
+    сохраняется в файл (по умолчанию msgpack со сжатием, см. serialization).
+    """
+
+    def __init__(self, cache_file: str = CACHE_FILE, ttl_hours: int = 3,
+                 max_entries: int = MAX_ENTRIES, ttls: Dict[str, int] = None,
+                 max_stale: int = MAX_STALE, cache_format: str = CACHE_FORMAT,
+                 backend: str = CACHE_BACKEND, db_file: str = CACHE_DB,
+                 sync_interval: float = SYNC_INTERVAL, purge_interval: float = PURGE_INTERVAL):
         self.cache_file = cache_file
-        self.ttl_hours = ttl_hours
-
-    def save_weather(self, city: str, lat: float, lon: float, weather_data: Dict) -> None:
-        cache_entry = {
-            "city": city,
-            "lat": lat,
-            "lon": lon,
-            "weather_data": weather_data,
-            "fetched_at": datetime.now().isoformat(),
-            "type": "weather"
-        }
-        self._save_cache(cache_entry)
+        self.cache_format = cache_format
+        # Формат разбирается один раз: предупреждение о недоступном сжатии - только при старте
+        self.codec, self.compressor = parse_format(cache_format)
+        self.store = SQLiteCacheStore(db_file, self.codec, self.compressor) if backend == "sqlite" else None
+        self.sync_interval = sync_interval
+        self.purge_interval = purge_interval
+        self.ttl_hours = ttl_hours  # TTL для типов, которых нет в ttls
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_stale = max_stale
 
-    def save_forecast(self, lat: float, lon: float, forecast_data: Dict) -> None:
-        cache_entry = {
-            "lat": lat,
-            "lon": lon,
-            "forecast_data": forecast_data,
-            "fetched_at": datetime.now().isoformat(),
-            "type": "forecast"
+        self.hits = 0
+        self.stale_hits = 0
+        self.nearby_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.promotions = 0
+        self.invalidations = 0
+
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # Записи с координатами в ключе по типам запросов - для поиска ближайших
+        self._spatial: Dict[str, SpatialIndex] = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._version = 0        # последняя версия L2, изменения до которой учтены
+        self._last_sync = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        if self.store is not None:
+            self._init_store()
+        else:
+            self._load_cache()
+        atexit.register(self.close)
+
+    def start(self) -> None:
+        """Запускает фоновую очистку L2 (для backend='file' ничего не делает)."""
+        if self._thread is not None or self.store is None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._purge_loop, name="cache-purge", daemon=True)
+                self._thread.start()
+
+    @staticmethod
+    def make_key(endpoint: str, *parts) -> str:
+        """Ключ кэша: 'weather:55.7558:37.6173'."""
+        formatted = [f"{float(p):.{COORD_PRECISION}f}" if isinstance(p, (int, float)) else str(p)
+                     for p in parts]
+        return ":".join([endpoint] + formatted)
+
+    @staticmethod
+    def parse_location_key(key: str) -> Optional[Tuple[str, float, float]]:
+        """'weather:55.7558:37.6173' -> ('weather', 55.7558, 37.6173); None для других ключей."""
+        parts = key.split(":")
+        if len(parts) != 3:
+            return None
+        try:
+            return parts[0], float(parts[1]), float(parts[2])
+        except ValueError:
+            return None
+
+    def _index(self, key: str, spatial: Dict[str, SpatialIndex] = None) -> None:
+        location = self.parse_location_key(key)
+        if location is not None:
+            endpoint, lat, lon = location
+            (self._spatial if spatial is None else spatial).setdefault(endpoint, SpatialIndex()).add(key, lat, lon)
+
+    def _unindex(self, key: str) -> None:
+        location = self.parse_location_key(key)
+        if location is not None and location[0] in self._spatial:
+            self._spatial[location[0]].discard(key)
+
+    def get_ttl(self, endpoint: str) -> int:
+        return self.ttls.get(endpoint, self.ttl_hours * 3600)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает данные по ключу или None, если записи нет или она устарела."""
+        entry = self.get_entry(key)
+        return entry["data"] if entry is not None else None
+
+    def get_entry(self, key: str, allow_stale: bool = False) -> Optional[Dict]:
+        """
+        Возвращает запись целиком: {'data', 'fetched_at', 'expires_at'}.
+
+        При allow_stale=True возвращается и истекшая запись, если она старше
+        срока жизни не больше чем на max_stale секунд.
+        """
+        now = time.time()
+        self._sync(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None or self.store is None:
+                return self._checked(key, entry, now, allow_stale)
+            seen = self._version
+
+        # Промах L1: запись читается из L2 без блокировки, под ней только кладется в L1
+        entry = self._read_store(key)
+        with self._lock:
+            entry = self._install(key, entry, seen, now)
+            return self._checked(key, entry, now, allow_stale)
+
+    def _checked(self, key: str, entry: Optional[Dict], now: float, allow_stale: bool) -> Optional[Dict]:
+        """Проверяет срок найденной записи и считает попадание или промах."""
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if now >= entry["expires_at"] + self.max_stale:
+            if self._entries.pop(key, None) is not None:
+                if self.store is None:
+                    self._unindex(key)
+                self._dirty = True
+            self.misses += 1
+            return None
+
+        if now >= entry["expires_at"]:
+            if not allow_stale:
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        return entry
+
+    def fetched_at(self, key: str, data: Any) -> Optional[float]:
+        """
+        Время загрузки записи key, если в ней лежат именно эти данные (тот же
+        объект), иначе None. Версия для кэшей, построенных по данным записи:
+        новая загрузка дает новое время, а данные не сравниваются по содержимому.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["data"] is not data:
+                return None
+            return entry["fetched_at"]
+
+    def set(self, key: str, data: Any, ttl: int = None) -> None:
+        self.start()
+        endpoint = key.split(":", 1)[0]
+        now = time.time()
+        entry = {
+            "data": data,
+            "fetched_at": now,
+            "expires_at": now + (ttl if ttl is not None else self.get_ttl(endpoint)),
         }
-        self._save_cache(cache_entry)
+        if self.store is not None:
+            # Запись в L2 - без блокировки L1: читатели не ждут транзакцию SQLite.
+            # Если два потока пишут один ключ, в L1 может остаться старшая версия -
+            # _sync увидит расхождение версий и перечитает запись из L2
+            try:
+                entry["version"] = self.store.put(key, entry["fetched_at"], entry["expires_at"], data)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"⚠️ Не удалось записать в общий кэш: {e}")
+        with self._lock:
+            self._put_local(key, entry)
+            self._dirty = True
 
-    def read_weather(self) -> Optional[Dict]:
-        cache_data = self._read_cache()
-        if cache_data and cache_data.get("type") == "weather":
-            return cache_data
-        return None
+            if self.store is None and now - self._last_save >= SAVE_INTERVAL:
+                self._save_cache()
 
-    def read_forecast(self) -> Optional[Dict]:
-        cache_data = self._read_cache()
-        if cache_data and cache_data.get("type") == "forecast":
-            return cache_data
-        return None
+    def _put_local(self, key: str, entry: Dict) -> None:
+        """Кладет запись в память (L1) с вытеснением самых старых по использованию."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._index(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            # Вытесненная из L1 запись остается в L2 и в индексе
+            if self.store is None:
+                self._unindex(evicted)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self.store is not None:
+                try:
+                    self.store.delete(key)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Не удалось удалить запись общего кэша: {e}")
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+            self._unindex(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            if self.store is not None:
+                try:
+                    self.store.clear()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Не удалось очистить общий кэш: {e}")
+            self._entries.clear()
+            self._spatial.clear()
+            self._dirty = True
 
-    def _save_cache(self, cache_entry: Dict) -> None:
+    # Общий кэш (L2)
+
+    def _init_store(self) -> None:
+        """Подключает L2; при первом запуске переносит в него записи из файла кэша."""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_entry, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"⚠️ Не удалось сохранить кэш: {e}")
+            if not self.store.count():
+                self._load_cache()
+                if self._entries:
+                    self.store.put_many((k, v["fetched_at"], v["expires_at"], v["data"])
+                                        for k, v in self._entries.items())
+                    print(f"✅ Перенесено записей кэша в {self.store.db_file}: {len(self._entries)}")
+                self._entries.clear()
+                self._spatial.clear()
+                self._dirty = False
+            # Сначала версия, затем ключи: изменения между ними придут при синхронизации
+            self._version = self.store.max_version()
+            for key in self.store.keys(time.time() - self.max_stale):
+                self._index(key)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"⚠️ Общий кэш недоступен, кэш только в памяти процесса: {e}")
+            self.store = None
+            self._entries.clear()
+            self._spatial.clear()
+            self._load_cache()
 
-    def _read_cache(self) -> Optional[Dict]:
-        if not os.path.exists(self.cache_file):
+    def _read_store(self, key: str) -> Optional[Dict]:
+        """Запись из L2 или None, если ее там нет. Вызывается без блокировки L1."""
+        try:
+            row = self.store.get(key)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать общий кэш: {e}")
+            return None
+        if row is None:
             return None
+        fetched_at, expires_at, version, data = row
+        return {"data": data, "fetched_at": fetched_at, "expires_at": expires_at, "version": version}
 
+    def _install(self, key: str, entry: Optional[Dict], seen: int, now: float) -> Optional[Dict]:
+        """
+        Поднимает прочитанную из L2 запись в L1 (под блокировкой). seen -
+        версия L2, учтенная до чтения: если с тех пор _sync применил изменения,
+        запись могла успеть устареть, и она отдается без сохранения в L1.
+        """
+        if entry is None:
+            self._unindex(key)
+            return None
+        current = self._entries.get(key)
+        if current is not None:
+            return current  # пока читали, запись положил другой поток
+        if self._version == seen and now < entry["expires_at"] + self.max_stale:
+            self._put_local(key, entry)
+            self.promotions += 1
+        return entry
+
+    def _sync(self, now: float) -> None:
+        """
+        Учитывает изменения L2 от других процессов: их записи в L1 устарели.
+        Изменения читаются без блокировки L1.
+        """
+        if self.store is None or now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            if now - self._last_sync < self.sync_interval:
+                return
+            self._last_sync = now
+            since = self._version
         try:
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
+            changes = self.store.changes(since)
+        except sqlite3.Error as e:
+            print(f"⚠️ Не удалось проверить изменения общего кэша: {e}")
+            return
 
-            fetched_at = datetime.fromisoformat(cache_data['fetched_at'])
-            if datetime.now() - fetched_at > timedelta(hours=self.ttl_hours):
-                return None
+        with self._lock:
+            for key, version, _, deleted in changes:
+                entry = self._entries.get(key)
+                # Своя запись пришла с той же версией, которую вернул put
+                if entry is not None and entry.get("version") != version:
+                    del self._entries[key]
+                    self.invalidations += 1
+                if deleted:
+                    self._unindex(key)
+                else:
+                    self._index(key)
+                self._version = max(self._version, version)
 
-            return cache_data
-        except (IOError, json.JSONDecodeError, KeyError):
+    def get_nearest_entry(self, key: str, max_km: float) -> Optional[Dict]:
+        """
+        Свежая запись того же типа с ближайшими координатами не дальше max_km.
+
+        Для ключей без координат и при max_km <= 0 возвращает None. Запись
+        по самому ключу не учитывается - ее ищут через get_entry.
+        """
+        location = self.parse_location_key(key)
+        if location is None or max_km <= 0:
             return None
+        endpoint, lat, lon = location
+
+        now = time.time()
+        self._sync(now)
+        with self._lock:
+            index = self._spatial.get(endpoint)
+            if index is None:
+                return None
+            candidates = [(nearby_key, self._entries.get(nearby_key))
+                          for _, nearby_key in index.within(lat, lon, max_km) if nearby_key != key]
+            seen = self._version
+
+        for nearby_key, entry in candidates:
+            if entry is None:
+                if self.store is None:
+                    continue
+                entry = self._read_store(nearby_key)
+                with self._lock:
+                    entry = self._install(nearby_key, entry, seen, now)
+            if entry is None or now >= entry["expires_at"]:
+                continue
+            with self._lock:
+                self.nearby_hits += 1
+                if nearby_key in self._entries:
+                    self._entries.move_to_end(nearby_key)
+            return entry
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий/промахов для мониторинга."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "nearby_hits": self.nearby_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "backend": "sqlite" if self.store is not None else "file",
+                "promotions": self.promotions,
+                "invalidations": self.invalidations,
+                # Промах по своему ключу, закрытый данными соседней точки, - тоже попадание
+                "hit_rate": (self.hits + self.nearby_hits) / total if total else 0.0,
+            }
+
+    # Обертки для отдельных типов данных
+
+    def save_weather(self, lat: float, lon: float, weather_data: Dict) -> None:
+        self.set(self.make_key("weather", lat, lon), weather_data)
+
+    def save_forecast(self, lat: float, lon: float, forecast_data: Dict) -> None:
+        self.set(self.make_key("forecast", lat, lon), forecast_data)
+
+    def read_weather(self, lat: float, lon: float) -> Optional[Dict]:
+        return self.get(self.make_key("weather", lat, lon))
+
+    def read_forecast(self, lat: float, lon: float) -> Optional[Dict]:
+        return self.get(self.make_key("forecast", lat, lon))
+
+    # Сохранение на диск
+
+    def flush(self) -> None:
+        """Принудительно сохраняет кэш на диск, если есть изменения."""
+        if self.store is not None:
+            # Записи уже в L2 - остается убрать те, что нельзя отдать даже устаревшими
+            self.purge()
+            return
+        with self._lock:
+            if self._dirty:
+                self._save_cache()
+
+    def close(self) -> None:
+        """Останавливает фоновую очистку и сохраняет кэш."""
+        with self._lock:
+            self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        atexit.unregister(self.close)
+        self.flush()
+
+    def purge(self) -> None:
+        """
+        Удаляет из L2 записи, которые нельзя отдать даже устаревшими, и
+        пересобирает пространственный индекс по оставшимся ключам (так он
+        забывает и записи, очищенные другими процессами). Таблица
+        сканируется без блокировки L1, под блокировкой индекс только
+        подменяется готовым.
+        """
+        alive_after = time.time() - self.max_stale
+        try:
+            # Изменения после этой версии _sync применит к новому индексу заново
+            version = self.store.max_version()
+            self.store.purge(alive_after)
+            keys = self.store.keys(alive_after)
+        except sqlite3.Error as e:
+            print(f"⚠️ Не удалось очистить общий кэш: {e}")
+            return
+
+        spatial: Dict[str, SpatialIndex] = {}
+        for key in keys:
+            self._index(key, spatial)
+
+        with self._lock:
+            for key in self._entries:
+                self._index(key, spatial)
+            self._spatial = spatial
+            self._version = min(self._version, version)
+            self._last_sync = 0.0
+            self._dirty = False
+
+    def _purge_loop(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.purge_interval)
+            if self._stopped:
+                return
+            self.purge()
+
+    def _save_cache(self) -> None:
+        now = time.time()
+        entries = [(k, v["fetched_at"], v["expires_at"], v["data"])
+                   for k, v in self._entries.items() if v["expires_at"] + self.max_stale > now]
+        try:
+            write_entries(self.cache_file, entries, self.codec, self.compressor)
+            self._dirty = False
+        except (IOError, TypeError, ValueError) as e:
+            print(f"⚠️ Не удалось сохранить кэш: {e}")
+        self._last_save = now
+
+    def _load_cache(self) -> None:
+        now = time.time()
+        if os.path.exists(self.cache_file) and is_binary_file(self.cache_file):
+            # Истекшие записи отбрасываются по заголовку, их данные не разбираются
+            try:
+                entries = [(key, {"data": data, "fetched_at": fetched_at, "expires_at": expires_at})
+                           for key, fetched_at, expires_at, data in
+                           read_entries(self.cache_file, lambda _, expires_at: expires_at + self.max_stale > now)]
+            except (IOError, ValueError) as e:
+                print(f"⚠️ Не удалось прочитать кэш: {e}")
+                return
+        else:
+            entries = self._load_json_cache(self.cache_file if os.path.exists(self.cache_file)
+                                            else LEGACY_CACHE_FILE, now)
+            # Записи из JSON перепишутся в текущем формате при ближайшем сохранении
+            self._dirty = bool(entries)
+
+        entries.sort(key=lambda item: item[1]["fetched_at"])
+        for key, entry in entries[-self.max_entries:]:
+            self._entries[key] = entry
+            self._index(key)
+
+    def _load_json_cache(self, path: str, now: float) -> List[Tuple[str, Dict]]:
+        """Записи из JSON-файла кэша прежнего формата."""
+        if not os.path.exists(path):
+            return []
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f, object_hook=decode_model)
+        except (IOError, json.JSONDecodeError):
+            return []
+
+        if not isinstance(cache_data, dict):
+            return []
+
+        # Файл старого формата (одна запись без ключей) просто игнорируем
+        return [(k, v) for k, v in cache_data.items()
+                if isinstance(v, dict) and v.get("expires_at", 0) + self.max_stale > now and "data" in v]
@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+from serialization import Codec, Compressor, Entry, decode_payload, default_format, encode_payload, parse_format
+
+CACHE_DB_FILE = "weather_cache.db"
+
+# (ключ, версия, истекает, удалена ли запись)
+Change = Tuple[str, int, float, bool]
+
+
+class SQLiteCacheStore:
+    """
+    Общее хранилище кэша (L2) в SQLite (WAL) для нескольких процессов.
+
+    Строка - одна запись кэша: сроки в unix time, данные упакованы
+    serialization.encode_payload. Каждое изменение получает следующий
+    номер версии (счетчик в meta не уменьшается и после очистки старых
+    строк), удаление оставляет строку без данных (tombstone), поэтому
+    процесс узнает обо всех чужих изменениях одним запросом
+    changes(последняя виденная версия) по индексу версий.
+
+    У каждого потока свое соединение, как в SQLiteUserStorage.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            version INTEGER NOT NULL,
+            data BLOB
+        );
+        CREATE INDEX IF NOT EXISTS idx_cache_version ON cache (version);
+        CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, db_file: str = CACHE_DB_FILE, codec: Codec = None, compressor: Compressor = None):
+        self.db_file = db_file
+        if codec is None or compressor is None:
+            codec, compressor = parse_format(default_format())
+        self.codec, self.compressor = codec, compressor
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: транзакции открываем явно (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def init(self) -> None:
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            self._connect().executescript(self.SCHEMA)
+            self._initialized = True
+
+    def _write(self, statements) -> int:
+        """
+        Выполняет изменения в одной транзакции. statements(conn, version)
+        получает следующий номер версии: транзакция BEGIN IMMEDIATE держит
+        блокировку записи, так что номера не повторяются.
+        """
+        self.init()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            statements(conn, version)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def get(self, key: str) -> Optional[Tuple[float, float, int, Any]]:
+        """(fetched_at, expires_at, версия, данные) или None, если записи нет."""
+        self.init()
+        row = self._connect().execute(
+            "SELECT fetched_at, expires_at, version, data FROM cache WHERE key = ? AND data IS NOT NULL",
+            (key,)).fetchone()
+        if row is None:
+            return None
+        fetched_at, expires_at, version, data = row
+        return fetched_at, expires_at, version, decode_payload(data)
+
+    def put(self, key: str, fetched_at: float, expires_at: float, data: Any) -> int:
+        """Записывает запись. Returns: ее новая версия."""
+        return self.put_many([(key, fetched_at, expires_at, data)])
+
+    def put_many(self, entries: Iterable[Entry]) -> int:
+        """Записывает несколько записей одной транзакцией с общей версией."""
+        # Данные упаковываются до транзакции, чтобы не держать блокировку записи
+        rows = [(key, fetched_at, expires_at, encode_payload(data, self.codec, self.compressor))
+                for key, fetched_at, expires_at, data in entries]
+
+        def statements(conn, version):
+            conn.executemany(
+                """INSERT INTO cache (key, fetched_at, expires_at, version, data) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET
+                       fetched_at = excluded.fetched_at,
+                       expires_at = excluded.expires_at,
+                       version = excluded.version,
+                       data = excluded.data""",
+                [(key, fetched_at, expires_at, version, blob) for key, fetched_at, expires_at, blob in rows])
+
+        return self._write(statements)
+
+    def delete(self, key: str) -> int:
+        """Удаляет запись, оставляя tombstone для других процессов."""
+        return self._write(lambda conn, version: conn.execute(
+            "UPDATE cache SET data = NULL, version = ? WHERE key = ? AND data IS NOT NULL", (version, key)))
+
+    def clear(self) -> int:
+        return self._write(lambda conn, version: conn.execute(
+            "UPDATE cache SET data = NULL, version = ? WHERE data IS NOT NULL", (version,)))
+
+    def changes(self, since: int) -> List[Change]:
+        """Записи, измененные после версии since (в том числе удаленные), по возрастанию версии."""
+        self.init()
+        rows = self._connect().execute(
+            "SELECT key, version, expires_at, data IS NULL FROM cache WHERE version > ? ORDER BY version",
+            (since,)).fetchall()
+        return [(key, version, expires_at, bool(deleted)) for key, version, expires_at, deleted in rows]
+
+    def keys(self, alive_after: float) -> List[str]:
+        """Ключи записей, которые еще можно отдать после момента alive_after."""
+        self.init()
+        rows = self._connect().execute(
+            "SELECT key FROM cache WHERE data IS NOT NULL AND expires_at > ?", (alive_after,)).fetchall()
+        return [row[0] for row in rows]
+
+    def max_version(self) -> int:
+        self.init()
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def purge(self, expired_before: float) -> int:
+        """
+        Удаляет строки, истекшие до expired_before, вместе со старыми
+        tombstone. Returns: сколько строк удалено.
+        """
+        self.init()
+        return self._connect().execute("DELETE FROM cache WHERE expires_at < ?", (expired_before,)).rowcount
+
+    def count(self) -> int:
+        self.init()
+        return self._connect().execute("SELECT COUNT(*) FROM cache WHERE data IS NOT NULL").fetchone()[0]
+
+    def close(self) -> None:
+        """Закрывает соединение текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
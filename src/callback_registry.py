@@ -0,0 +1,80 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+CALLBACK_TTL = 24 * 60 * 60   # сколько живут кнопки (сек)
+MAX_ENTRIES = 50000
+
+
+@dataclass(slots=True)
+class CallbackLocation:
+    name: str
+    lat: float
+    lon: float
+
+
+class CallbackRegistry:
+    """
+    Короткие ID для callback_data кнопок вместо названия города.
+
+    В callback_data кладется 8-символьный ID (например, 'forecast_1f3a9c0b'),
+    а город с уже найденными координатами хранится на сервере. Нажатие
+    разрешается поиском в словаре без повторного геокодинга; названия
+    с '_' и длинные названия не упираются в лимит Telegram в 64 байта.
+
+    Записи живут ttl секунд с последней регистрации; ID неизвестен после
+    перезапуска бота - такие нажатия нужно попросить повторить.
+    """
+
+    def __init__(self, ttl: float = CALLBACK_TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, Tuple[float, CallbackLocation]]" = OrderedDict()
+        self._ids: Dict[Tuple[str, float, float], str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, lat: float, lon: float) -> str:
+        """Возвращает ID для локации; для той же локации - тот же ID с продленным сроком."""
+        location_key = (name, lat, lon)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+
+            location_id = self._ids.get(location_key)
+            if location_id is None:
+                # hex, а не urlsafe: в ID не должно быть '_' - это разделитель в callback_data
+                location_id = secrets.token_hex(4)
+                while location_id in self._entries:
+                    location_id = secrets.token_hex(4)
+                self._ids[location_key] = location_id
+                location = CallbackLocation(name, lat, lon)
+            else:
+                location = self._entries[location_id][1]
+
+            self._entries[location_id] = (now + self.ttl, location)
+            self._entries.move_to_end(location_id)
+            return location_id
+
+    def resolve(self, location_id: str) -> Optional[CallbackLocation]:
+        """Локация по ID или None, если ID неизвестен или истек."""
+        with self._lock:
+            entry = self._entries.get(location_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def _evict(self, now: float) -> None:
+        # Срок у всех одинаковый, поэтому порядок вставки - это порядок истечения
+        while self._entries:
+            location_id, (expires_at, location) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) < self.max_entries:
+                break
+            del self._entries[location_id]
+            del self._ids[(location.name, location.lat, location.lon)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
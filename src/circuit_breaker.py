@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from exceptions import CircuitOpenError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 5   # столько ошибок подряд размыкают цепь
+RESET_TIMEOUT = 30      # через столько секунд пробуем один запрос (сек)
+
+StateListener = Callable[[str, str, str], None]
+
+
+def print_state_change(name: str, old_state: str, new_state: str) -> None:
+    print(f"⚠️ Circuit breaker '{name}': {old_state} -> {new_state}")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одного типа запросов к API.
+
+    closed    - запросы идут как обычно, ошибки подряд считаются;
+    open      - после failure_threshold ошибок запросы сразу отклоняются
+                (CircuitOpenError) в течение reset_timeout секунд;
+    half_open - пропускается один пробный запрос: успех замыкает цепь,
+                ошибка снова размыкает.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT,
+                 on_state_change: Optional[StateListener] = print_state_change):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+
+        self.state = CLOSED
+        self.failures = 0        # ошибок подряд
+        self.total_failures = 0
+        self.rejected = 0        # запросов, отклоненных без отправки
+        self.opened_count = 0
+
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # RLock: обработчик смены состояния может читать stats() этого же breaker'а
+        self._lock = threading.RLock()
+
+    def before_request(self) -> None:
+        """Вызывается перед запросом. Raises: CircuitOpenError, если запрос отправлять нельзя."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Сервис погоды временно недоступен ({self.name})")
+                self._set_state(HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Сервис погоды временно недоступен ({self.name})")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened_count += 1
+                    self._set_state(OPEN)
+                self._opened_at = time.monotonic()
+
+    def cancel(self) -> None:
+        """Запрос не был отправлен по своим причинам (например, лимит) - результат не учитываем."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _set_state(self, new_state: str) -> None:
+        old_state, self.state = self.state, new_state
+        if self.on_state_change is not None:
+            try:
+                self.on_state_change(self.name, old_state, new_state)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработчика circuit breaker: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "total_failures": self.total_failures,
+                "rejected": self.rejected,
+                "opened_count": self.opened_count,
+            }
+
+
+class CircuitBreakerRegistry:
+    """Отдельный circuit breaker на каждый тип запросов (geocode, weather, ...)."""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT,
+                 on_state_change: Optional[StateListener] = print_state_change):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self.failure_threshold,
+                                         self.reset_timeout, self.on_state_change)
+                self._breakers[name] = breaker
+            return breaker
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
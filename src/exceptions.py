@@ -13,3 +13,11 @@ class CityNotFoundError(WeatherAPIError):
 class ForecastError(WeatherAPIError):
     """Ошибка получения прогноза."""
     pass
+
+class RateLimitExceededError(WeatherAPIError):
+    """Исчерпан лимит запросов к API: свой (запрос не отправлен) или по ответам 429."""
+    pass
+
+class CircuitOpenError(WeatherAPIError):
+    """Запрос не отправлен: API недоступен, circuit breaker разомкнут."""
+    pass
@@ -0,0 +1,258 @@
+import warnings
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from models import Forecast
+
+# Колонки прогноза, которые переносятся в numpy
+COLUMNS = ("temp", "feels_like", "humidity", "wind_speed", "pop", "pressure")
+
+SLOTS_PER_DAY = 8            # шаг прогноза 3 часа
+SLOT_SECONDS = 3 * 3600
+DAY_SECONDS = 24 * 3600
+
+ANOMALY_Z = 2.0              # точка аномальна, если отклоняется от своего часа на 2 сигмы
+PRESSURE_DROP_HPA = 3.0      # падение давления за 3 часа, после которого жди непогоды
+
+COMFORT_TEMP = 21.0          # ощущаемая температура, при которой комфорт максимален
+COMFORT_HUMIDITY = (30.0, 60.0)
+COMFORT_WIND = 5.0           # м/с, до этой скорости ветер не мешает
+DAYTIME_HOURS = (6, 22)      # "лучшее время" ищется только днем (по местному времени)
+
+
+class ForecastFrame:
+    """
+    Прогнозы нескольких локаций в виде numpy-куба: локация x день x 3-часовой слот.
+
+    Точка с местным временем t попадает в день (t - первый день) и слот
+    (час // 3): за сутки у каждой локации не больше 8 точек, поэтому куб
+    плотный, а пропуски (неполные первый и последний дни) заполнены NaN.
+    Дневные агрегаты, тренды, аномалии и индексы комфорта считаются
+    операциями над осями куба сразу для всех локаций, без циклов Python.
+
+    Дни совпадают с Forecast.days: граница дня - местная полночь города.
+    """
+
+    __slots__ = ("forecasts", "dt", "local_hour", "valid", "columns", "_comfort", "_insights")
+
+    def __init__(self, forecasts: Sequence[Forecast]):
+        self.forecasts = list(forecasts)
+        n_locations = len(self.forecasts)
+
+        # Позиции точек в кубе: номер локации, день от первого дня локации, слот
+        loc_idx, day_idx, slot_idx, dt_parts = [], [], [], []
+        for i, forecast in enumerate(self.forecasts):
+            # array.array поддерживает буферный протокол - колонки не копируются
+            dt = np.frombuffer(forecast.dt, dtype=np.int64) if len(forecast) else np.empty(0, np.int64)
+            local = dt + forecast.timezone
+            local_day = local // DAY_SECONDS
+            loc_idx.append(np.full(len(dt), i))
+            day_idx.append(local_day - (local_day[0] if len(dt) else 0))
+            slot_idx.append((local % DAY_SECONDS) // SLOT_SECONDS)
+            dt_parts.append(dt)
+
+        loc_idx = np.concatenate(loc_idx) if loc_idx else np.empty(0, np.int64)
+        day_idx = np.concatenate(day_idx) if day_idx else np.empty(0, np.int64)
+        slot_idx = np.concatenate(slot_idx) if slot_idx else np.empty(0, np.int64)
+        n_days = int(day_idx.max()) + 1 if len(day_idx) else 0
+        shape = (n_locations, n_days, SLOTS_PER_DAY)
+        where = (loc_idx, day_idx, slot_idx)
+
+        self.dt = np.zeros(shape, dtype=np.int64)
+        self.valid = np.zeros(shape, dtype=bool)
+        self.local_hour = np.zeros(shape, dtype=np.int64)
+        if len(loc_idx):
+            self.dt[where] = np.concatenate(dt_parts)
+            self.valid[where] = True
+            tz = np.array([f.timezone for f in self.forecasts], dtype=np.int64)
+            self.local_hour = ((self.dt + tz[:, None, None]) % DAY_SECONDS) // 3600
+
+        self.columns: Dict[str, np.ndarray] = {}
+        for name in COLUMNS:
+            cube = np.full(shape, np.nan)
+            if len(loc_idx):
+                cube[where] = np.concatenate([np.asarray(getattr(f, name), dtype=float)
+                                              for f in self.forecasts])
+            self.columns[name] = cube
+
+        self._comfort = None
+        self._insights: Dict[int, List[Dict]] = {}
+
+    @classmethod
+    def from_forecast(cls, forecast: Forecast) -> "ForecastFrame":
+        """Кадр одного прогноза; строится один раз и запоминается в forecast.frame."""
+        frame = forecast.frame
+        if frame is None:
+            frame = forecast.frame = cls([forecast])
+        return frame
+
+    def __len__(self) -> int:
+        return len(self.forecasts)
+
+    @property
+    def n_days(self) -> int:
+        return self.valid.shape[1]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    # ===== Дневные агрегаты =====
+
+    def daily(self) -> Dict[str, np.ndarray]:
+        """
+        Сводка по дням для всех локаций: массивы формы (локация, день).
+        Для дней без точек значения NaN, count = 0.
+        """
+        temp, feels = self.columns["temp"], self.columns["feels_like"]
+        has_points = self.valid.any(axis=2)
+        return {
+            "count": self.valid.sum(axis=2),
+            "temp_min": _nan_reduce(np.nanmin, temp, has_points),
+            "temp_max": _nan_reduce(np.nanmax, temp, has_points),
+            "temp_mean": _nan_reduce(np.nanmean, temp, has_points),
+            "feels_min": _nan_reduce(np.nanmin, feels, has_points),
+            "feels_max": _nan_reduce(np.nanmax, feels, has_points),
+            "humidity_mean": _nan_reduce(np.nanmean, self.columns["humidity"], has_points),
+            "wind_max": _nan_reduce(np.nanmax, self.columns["wind_speed"], has_points),
+            "pop_max": _nan_reduce(np.nanmax, self.columns["pop"], has_points),
+            "pressure_mean": _nan_reduce(np.nanmean, self.columns["pressure"], has_points),
+            "comfort_mean": _nan_reduce(np.nanmean, self.comfort(), has_points),
+        }
+
+    # ===== Тренд и аномалии =====
+
+    def temp_trend(self) -> np.ndarray:
+        """
+        Наклон линейной регрессии температуры по времени, °C в сутки,
+        для каждой локации (NaN, если точек меньше двух).
+        """
+        temp = self.columns["temp"].reshape(len(self), -1)
+        valid = self.valid.reshape(len(self), -1)
+        days = self.dt.reshape(len(self), -1) / DAY_SECONDS
+
+        n = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = np.where(valid, days, 0).sum(axis=1) / n
+            y_mean = np.where(valid, temp, 0).sum(axis=1) / n
+            dx = np.where(valid, days - x_mean[:, None], 0)
+            dy = np.where(valid, temp - y_mean[:, None], 0)
+            return (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+
+    def anomalies(self, z: float = ANOMALY_Z) -> np.ndarray:
+        """
+        Точки, где температура необычна для этого времени суток: отклонение
+        от среднего по тому же слоту за все дни прогноза больше z сигм.
+        Returns: bool-маска формы куба.
+        """
+        temp = self.columns["temp"]
+        with warnings.catch_warnings():
+            # Слоты без единой точки дают NaN - это ожидаемо
+            warnings.simplefilter("ignore", RuntimeWarning)
+            slot_mean = np.nanmean(temp, axis=1, keepdims=True)
+            slot_std = np.nanstd(temp, axis=1, keepdims=True)
+            score = np.abs(temp - slot_mean) / slot_std
+        return self.valid & (slot_std > 0) & (score > z)
+
+    def pressure_drops(self, threshold: float = PRESSURE_DROP_HPA) -> np.ndarray:
+        """
+        Точки, к которым давление упало больше чем на threshold гПа
+        за предыдущие 3 часа. Returns: bool-маска формы куба.
+        """
+        pressure = self.columns["pressure"].reshape(len(self), -1)
+        drop = np.zeros_like(pressure, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            # Слоты идут подряд через границы дней; пропуски (NaN) не дают ложных срабатываний
+            drop[:, 1:] = (pressure[:, :-1] - pressure[:, 1:]) >= threshold
+        return drop.reshape(self.valid.shape)
+
+    # ===== Комфорт и лучшее время =====
+
+    def comfort(self) -> np.ndarray:
+        """
+        Индекс комфорта 0..100 для каждой точки (NaN вне прогноза).
+
+        Штрафы: 3 балла за каждый градус ощущаемой температуры от
+        COMFORT_TEMP, 1 балл за процент влажности вне COMFORT_HUMIDITY,
+        5 баллов за каждый м/с ветра сверх COMFORT_WIND, до 40 баллов
+        за вероятность осадков.
+        """
+        if self._comfort is None:
+            low, high = COMFORT_HUMIDITY
+            humidity = self.columns["humidity"]
+            penalty = (3.0 * np.abs(self.columns["feels_like"] - COMFORT_TEMP)
+                       + np.clip(low - humidity, 0, None) + np.clip(humidity - high, 0, None)
+                       + 5.0 * np.clip(self.columns["wind_speed"] - COMFORT_WIND, 0, None)
+                       + 40.0 * self.columns["pop"])
+            self._comfort = np.clip(100.0 - penalty, 0.0, 100.0)
+        return self._comfort
+
+    def best_times(self, daytime_only: bool = True) -> np.ndarray:
+        """
+        Время (unix dt) самой комфортной точки каждого дня, форма (локация, день).
+        0 - в этот день подходящих точек нет.
+        """
+        candidates = self.valid
+        if daytime_only:
+            start, stop = DAYTIME_HOURS
+            candidates = candidates & (self.local_hour >= start) & (self.local_hour < stop)
+
+        score = np.where(candidates, self.comfort(), -np.inf)
+        best = score.argmax(axis=2)
+        found = np.take_along_axis(candidates, best[..., None], axis=2)[..., 0]
+        times = np.take_along_axis(self.dt, best[..., None], axis=2)[..., 0]
+        return np.where(found, times, 0)
+
+    def best_location(self, day: int) -> int:
+        """Номер локации с самым комфортным днем day (по среднему индексу комфорта), -1 если данных нет."""
+        if not 0 <= day < self.n_days:
+            return -1
+        comfort_mean = self.daily()["comfort_mean"][:, day]
+        if np.isnan(comfort_mean).all():
+            return -1
+        return int(np.nanargmax(comfort_mean))
+
+    # ===== Отчет для одной локации =====
+
+    def insights(self, location: int = 0) -> List[Dict]:
+        """
+        Сводка по дням для локации в виде обычных значений Python:
+        [{'temp_min', 'temp_max', 'temp_mean', 'pop_max', 'wind_max',
+          'comfort', 'best_time', 'anomalies', 'pressure_drops'}, ...]
+
+        Считается один раз на локацию; возвращается общий список - не изменять.
+        """
+        result = self._insights.get(location)
+        if result is None:
+            result = self._insights[location] = self._build_insights(location)
+        return result
+
+    def _build_insights(self, location: int) -> List[Dict]:
+        daily = self.daily()
+        best = self.best_times()[location]
+        anomalies = self.anomalies()[location].sum(axis=1)
+        drops = self.pressure_drops()[location].sum(axis=1)
+        result = []
+        for day in range(self.n_days):
+            if not daily["count"][location, day]:
+                continue
+            result.append({
+                "temp_min": float(daily["temp_min"][location, day]),
+                "temp_max": float(daily["temp_max"][location, day]),
+                "temp_mean": float(daily["temp_mean"][location, day]),
+                "pop_max": float(daily["pop_max"][location, day]),
+                "wind_max": float(daily["wind_max"][location, day]),
+                "comfort": float(daily["comfort_mean"][location, day]),
+                "best_time": int(best[day]) or None,
+                "anomalies": int(anomalies[day]),
+                "pressure_drops": int(drops[day]),
+            })
+        return result
+
+
+def _nan_reduce(func, cube: np.ndarray, has_points: np.ndarray) -> np.ndarray:
+    """nan-агрегат по слотам только для дней с точками: пустые дни - NaN без предупреждений numpy."""
+    result = np.full(has_points.shape, np.nan)
+    if has_points.any():
+        result[has_points] = func(cube[has_points], axis=1)
+    return result
@@ -0,0 +1,423 @@
+import gzip
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from geo_grid import KM_PER_DEGREE, haversine_km
+from geocoding_index import normalize_city_name
+
+GAZETTEER_FILE = os.getenv("OPENWEATHER_GAZETTEER", "gazetteer.bin")
+LANGS = ("ru", "en")            # какие альтернативные названия брать из дампа
+SAME_PLACE_KM = 30.0            # записи одного названия ближе этого - один город (дубли дампа)
+MIN_FUZZY_LENGTH = 4            # короче этого опечатки не ищем: слишком много совпадений
+PREFIX_SCAN = 500               # сколько названий с префиксом просматривать для ранжирования
+REVERSE_MAX_KM = float(os.getenv("OPENWEATHER_REVERSE_KM", "15"))  # дальше ближайшего города - просто координаты
+CELL_DEG = 0.5                  # ячейка пространственной таблицы мест (градусы)
+CELL_COLS = int(360 / CELL_DEG)
+
+MAGIC = b"GZT2"
+# magic, мест, названий, вариантов с удаленной буквой, ячеек;
+# смещения таблиц мест, названий, вариантов, ячеек, мест по ячейкам и строк
+HEADER = struct.Struct("<4sIIIIQQQQQQ")
+# lat, lon, население, страна, смещение и длина подписи (русское название, если есть)
+PLACE = struct.Struct("<ddI2sIH")
+# смещение и длина ключа, смещение и длина подписи, номер места
+NAME = struct.Struct("<IHIHI")
+# crc32 варианта, номер названия
+DELETE = struct.Struct("<II")
+# номер ячейки, начало ее мест в таблице мест по ячейкам
+CELL = struct.Struct("<II")
+PLACE_REF = struct.Struct("<I")
+
+
+@dataclass(slots=True)
+class GazetteerPlace:
+    name: str           # название, по которому найдено место
+    country: str
+    lat: float
+    lon: float
+    population: int
+
+
+def _deletes(key: str) -> Iterable[str]:
+    """Варианты ключа без одной буквы: общий вариант есть у слов на расстоянии 1."""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _edit_distance(a: str, b: str, limit: int = 1) -> int:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв), обрезанное на limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    row = min(int((lat + 90.0) // CELL_DEG), int(180 / CELL_DEG) - 1)
+    col = int((lon + 180.0) // CELL_DEG) % CELL_COLS
+    return row, col
+
+
+def _read_city_list(source: str) -> List[Dict]:
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _place_names(city: Dict) -> List[str]:
+    """
+    Основное название и альтернативные на языках LANGS (поля local_names или langs).
+    Первым идет название для подписи: русское, если оно есть.
+    """
+    local_names = city.get('local_names') or {}
+    for item in city.get('langs') or []:
+        local_names = {**item, **local_names}
+    names = [local_names[lang] for lang in LANGS if local_names.get(lang)]
+    return names[:1] + [city['name']] + names[1:]
+
+
+def build_gazetteer(source: str, output: str = GAZETTEER_FILE) -> int:
+    """
+    Собирает файл индекса из дампа городов (city.list.json OpenWeather,
+    можно .gz). Returns: сколько названий проиндексировано.
+
+    В файле: таблица мест, отсортированная таблица нормализованных названий
+    (для точного поиска и поиска по префиксу), отсортированная таблица
+    crc32 вариантов названий без одной буквы (для поиска с опечаткой)
+    и места, сгруппированные по ячейкам CELL_DEG (для поиска ближайшего).
+    """
+    places = []
+    names = []      # (ключ, подпись, номер места)
+    for city in _read_city_list(source):
+        coord = city.get('coord') or {}
+        if 'lat' not in coord or 'lon' not in coord:
+            continue
+        population = city.get('population') or (city.get('stat') or {}).get('population') or 0
+        place_id = len(places)
+        place_names = _place_names(city)
+        places.append((float(coord['lat']), float(coord['lon']), int(population),
+                       (city.get('country') or '').encode('ascii', 'replace')[:2], place_names[0]))
+        seen = set()
+        for label in place_names:
+            key = normalize_city_name(label)
+            if key and key not in seen:
+                seen.add(key)
+                names.append((key, label, place_id))
+
+    # Одинаковые ключи - сначала самые населенные: они отдаются при точном поиске
+    names.sort(key=lambda n: (n[0].encode('utf-8'), -places[n[2]][2], n[2]))
+
+    # Места по ячейкам: номер ячейки = строка * CELL_COLS + столбец
+    by_cell = sorted(range(len(places)), key=lambda i: _cell(places[i][0], places[i][1]))
+    cells = []
+    for position, place_id in enumerate(by_cell):
+        row, col = _cell(places[place_id][0], places[place_id][1])
+        cell_key = row * CELL_COLS + col
+        if not cells or cells[-1][0] != cell_key:
+            cells.append((cell_key, position))
+    cells.append((0xFFFFFFFF, len(by_cell)))   # граница последней ячейки
+
+    strings = bytearray()
+    string_offsets: Dict[str, Tuple[int, int]] = {}
+
+    def intern(text: str) -> Tuple[int, int]:
+        if text not in string_offsets:
+            data = text.encode('utf-8')[:0xFFFF]
+            string_offsets[text] = (len(strings), len(data))
+            strings.extend(data)
+        return string_offsets[text]
+
+    name_records = bytearray()
+    deletes = []
+    for name_idx, (key, label, place_id) in enumerate(names):
+        key_off, key_len = intern(key)
+        label_off, label_len = intern(label)
+        name_records += NAME.pack(key_off, key_len, label_off, label_len, place_id)
+        if len(key) >= MIN_FUZZY_LENGTH:
+            for variant in _deletes(key):
+                deletes.append((zlib.crc32(variant.encode('utf-8')), name_idx))
+    deletes.sort()
+
+    place_records = bytearray()
+    for lat, lon, population, country, label in places:
+        place_records += PLACE.pack(lat, lon, population, country, *intern(label))
+
+    places_off = HEADER.size
+    names_off = places_off + len(place_records)
+    deletes_off = names_off + len(name_records)
+    cells_off = deletes_off + DELETE.size * len(deletes)
+    refs_off = cells_off + CELL.size * len(cells)
+    strings_off = refs_off + PLACE_REF.size * len(by_cell)
+
+    tmp_file = f"{output}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(places), len(names), len(deletes), len(cells) - 1,
+                            places_off, names_off, deletes_off, cells_off, refs_off, strings_off))
+        f.write(place_records)
+        f.write(name_records)
+        for record in deletes:
+            f.write(DELETE.pack(*record))
+        for record in cells:
+            f.write(CELL.pack(*record))
+        for place_id in by_cell:
+            f.write(PLACE_REF.pack(place_id))
+        f.write(strings)
+    os.replace(tmp_file, output)
+    return len(names)
+
+
+class Gazetteer:
+    """
+    Офлайн-справочник городов в файле, отображенном в память (mmap).
+
+    Файл собирается один раз build_gazetteer из дампа городов, при открытии
+    ничего не загружается в память: поиск - двоичный поиск по таблицам
+    фиксированного размера прямо в mmap, страницы файла подтягивает ОС и
+    делит между процессами.
+
+    - lookup: точное совпадение названия (русского или латинского);
+    - prefix: автодополнение по началу названия;
+    - fuzzy: одна опечатка (замена, вставка, пропуск, перестановка букв);
+    - nearest: ближайший город к координатам (обратный геокодинг).
+    """
+
+    def __init__(self, path: str = GAZETTEER_FILE):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self._mm[:len(MAGIC)]
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path}: не файл справочника городов или старая версия - соберите заново")
+        (_, self.n_places, self.n_names, self.n_deletes, self.n_cells,
+         self._places_off, self._names_off, self._deletes_off, self._cells_off,
+         self._refs_off, self._strings_off) = HEADER.unpack_from(self._mm, 0)
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __len__(self) -> int:
+        return self.n_names
+
+    # ===== Чтение записей =====
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._strings_off + offset
+        return self._mm[start:start + length]
+
+    def _name(self, i: int) -> Tuple[bytes, int, int, int]:
+        """(ключ, смещение подписи, длина подписи, номер места) названия i."""
+        key_off, key_len, label_off, label_len, place_id = NAME.unpack_from(self._mm, self._names_off + i * NAME.size)
+        return self._string(key_off, key_len), label_off, label_len, place_id
+
+    def _key(self, i: int) -> bytes:
+        key_off, key_len = struct.unpack_from("<IH", self._mm, self._names_off + i * NAME.size)
+        return self._string(key_off, key_len)
+
+    def _place(self, name_idx: int) -> GazetteerPlace:
+        """Место названия name_idx, подписанное этим названием."""
+        _, label_off, label_len, place_id = self._name(name_idx)
+        lat, lon, population, country, _, _ = PLACE.unpack_from(self._mm, self._places_off + place_id * PLACE.size)
+        return GazetteerPlace(self._string(label_off, label_len).decode('utf-8'),
+                              country.decode('ascii').strip('\x00'), lat, lon, population)
+
+    def _place_by_id(self, place_id: int) -> GazetteerPlace:
+        """Место с основной подписью (русское название, если есть)."""
+        lat, lon, population, country, label_off, label_len = PLACE.unpack_from(
+            self._mm, self._places_off + place_id * PLACE.size)
+        return GazetteerPlace(self._string(label_off, label_len).decode('utf-8'),
+                              country.decode('ascii').strip('\x00'), lat, lon, population)
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.n_names
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # ===== Поиск =====
+
+    def _exact_range(self, key: str) -> Tuple[int, int]:
+        encoded = key.encode('utf-8')
+        start = stop = self._lower_bound(encoded)
+        while stop < self.n_names and self._key(stop) == encoded:
+            stop += 1
+        return start, stop
+
+    def lookup(self, city: str) -> Optional[GazetteerPlace]:
+        """
+        Место с таким названием или None.
+
+        Если названию соответствуют несколько городов далеко друг от друга
+        и население не выделяет один из них, возвращается None: такой
+        запрос лучше отдать геокодеру API.
+        """
+        start, stop = self._exact_range(normalize_city_name(city))
+        if start == stop:
+            return None
+
+        best = self._place(start)   # самый населенный
+        for i in range(start + 1, stop):
+            other = self._place(i)
+            if (other.population >= best.population
+                    and haversine_km(best.lat, best.lon, other.lat, other.lon) > SAME_PLACE_KM):
+                return None
+        return best
+
+    def prefix(self, text: str, limit: int = 5) -> List[GazetteerPlace]:
+        """Города, название которых начинается с text, самые населенные первыми."""
+        encoded = normalize_city_name(text).encode('utf-8')
+        if not encoded:
+            return []
+
+        found = []
+        i = self._lower_bound(encoded)
+        while i < self.n_names and len(found) < PREFIX_SCAN and self._key(i).startswith(encoded):
+            found.append(self._place(i))
+            i += 1
+        return _rank(found, limit)
+
+    def fuzzy(self, text: str, limit: int = 5) -> List[GazetteerPlace]:
+        """Города, название которых отличается от text не больше чем на одну опечатку."""
+        key = normalize_city_name(text)
+        if len(key) < MIN_FUZZY_LENGTH - 1:
+            return []
+
+        # Замена и перестановка дают общий вариант без буквы, пропуск в запросе -
+        # запрос среди вариантов названия, лишняя буква в запросе - название среди вариантов запроса
+        candidates = set()
+        for variant in {key, *_deletes(key)}:
+            candidates.update(self._deletes_with_hash(zlib.crc32(variant.encode('utf-8'))))
+            candidates.update(range(*self._exact_range(variant)))
+
+        found = [self._place(i) for i in sorted(candidates)
+                 if _edit_distance(key, self._key(i).decode('utf-8')) <= 1]
+        return _rank(found, limit)
+
+    def _deletes_with_hash(self, value: int) -> List[int]:
+        lo, hi = 0, self.n_deletes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if DELETE.unpack_from(self._mm, self._deletes_off + mid * DELETE.size)[0] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = []
+        while lo < self.n_deletes:
+            hash_value, name_idx = DELETE.unpack_from(self._mm, self._deletes_off + lo * DELETE.size)
+            if hash_value != value:
+                break
+            result.append(name_idx)
+            lo += 1
+        return result
+
+    def _cell_places(self, key_lo: int, key_hi: int) -> Iterable[int]:
+        """Номера мест в ячейках с номерами key_lo..key_hi."""
+        lo, hi = 0, self.n_cells
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if CELL.unpack_from(self._mm, self._cells_off + mid * CELL.size)[0] < key_lo:
+                lo = mid + 1
+            else:
+                hi = mid
+        while lo < self.n_cells:
+            cell_key, start = CELL.unpack_from(self._mm, self._cells_off + lo * CELL.size)
+            if cell_key > key_hi:
+                break
+            stop = CELL.unpack_from(self._mm, self._cells_off + (lo + 1) * CELL.size)[1]
+            for position in range(start, stop):
+                yield PLACE_REF.unpack_from(self._mm, self._refs_off + position * PLACE_REF.size)[0]
+            lo += 1
+
+    def nearest(self, lat: float, lon: float, max_km: float = REVERSE_MAX_KM) -> Optional[GazetteerPlace]:
+        """
+        Ближайший к точке город не дальше max_km или None.
+
+        Просматриваются только ячейки, которые пересекает круг радиуса max_km:
+        в каждом ряду ячеек они идут подряд, поэтому на ряд - один двоичный поиск.
+        """
+        dlat = max_km / KM_PER_DEGREE
+        row_min, _ = _cell(max(-90.0, lat - dlat), lon)
+        row_max, _ = _cell(min(90.0, lat + dlat), lon)
+        dlon = min(180.0, max_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(89.9, abs(lat) + dlat))), 1e-6)))
+        col_min = math.floor((lon - dlon + 180.0) / CELL_DEG)
+        col_max = math.floor((lon + dlon + 180.0) / CELL_DEG)
+
+        # Через антимеридиан диапазон столбцов разбивается на два
+        if col_max - col_min + 1 >= CELL_COLS:
+            col_ranges = [(0, CELL_COLS - 1)]
+        elif col_min < 0:
+            col_ranges = [(col_min % CELL_COLS, CELL_COLS - 1), (0, col_max)]
+        elif col_max >= CELL_COLS:
+            col_ranges = [(col_min, CELL_COLS - 1), (0, col_max % CELL_COLS)]
+        else:
+            col_ranges = [(col_min, col_max)]
+
+        best_id, best_km = None, max_km
+        for row in range(row_min, row_max + 1):
+            for first, last in col_ranges:
+                for place_id in self._cell_places(row * CELL_COLS + first, row * CELL_COLS + last):
+                    place_lat, place_lon = struct.unpack_from("<dd", self._mm, self._places_off + place_id * PLACE.size)
+                    distance = haversine_km(lat, lon, place_lat, place_lon)
+                    if distance <= best_km:
+                        best_id, best_km = place_id, distance
+        return self._place_by_id(best_id) if best_id is not None else None
+
+    def suggest(self, text: str, limit: int = 5) -> List[GazetteerPlace]:
+        """Подсказки для ввода: сначала продолжения названия, затем варианты с опечаткой."""
+        places = self.prefix(text, limit)
+        if len(places) < limit:
+            seen = {(p.lat, p.lon) for p in places}
+            places += [p for p in self.fuzzy(text, limit) if (p.lat, p.lon) not in seen]
+        return places[:limit]
+
+
+def _rank(places: List[GazetteerPlace], limit: int) -> List[GazetteerPlace]:
+    """Убирает повторы одного места (по разным названиям) и сортирует по населению."""
+    unique = {}
+    for place in places:
+        key = (place.lat, place.lon)
+        if key not in unique:
+            unique[key] = place
+    return sorted(unique.values(), key=lambda p: -p.population)[:limit]
+
+
+def open_gazetteer(path: str = GAZETTEER_FILE) -> Optional[Gazetteer]:
+    """Справочник из файла или None, если файла нет (тогда города ищутся только через API)."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return Gazetteer(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"⚠️ Не удалось открыть справочник городов {path}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python src/gazetteer.py city.list.json.gz [gazetteer.bin]")
+        sys.exit(1)
+    output = sys.argv[2] if len(sys.argv) > 2 else GAZETTEER_FILE
+    count = build_gazetteer(sys.argv[1], output)
+    print(f"✅ {output}: {count} названий, {os.path.getsize(output) / 1024 / 1024:.1f} МБ")
@@ -0,0 +1,107 @@
+import math
+from typing import Dict, Iterator, List, Optional, Tuple
+
+KM_PER_DEGREE = 111.32       # длина градуса широты (и долготы на экваторе)
+EARTH_RADIUS_KM = 6371.0
+GRID_CELL_KM = 2.0           # размер ячейки сетки для координат запросов
+INDEX_CELL_KM = 5.0          # размер ячейки пространственного индекса
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли между двумя точками (км)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _lon_degrees(km: float, lat: float) -> float:
+    """Сколько градусов долготы занимают km на широте lat."""
+    return min(360.0, km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)))
+
+
+def snap_to_grid(lat: float, lon: float, cell_km: float = GRID_CELL_KM) -> Tuple[float, float]:
+    """
+    Центр ячейки сетки cell_km x cell_km, в которую попадает точка.
+
+    Все точки одной ячейки получают одинаковые координаты, поэтому у них
+    общие ключ кэша и запрос к API. Ширина ячейки по долготе считается по
+    широте ряда, чтобы на любой широте ячейка была примерно квадратной.
+    cell_km <= 0 - координаты не меняются.
+    """
+    if cell_km <= 0:
+        return lat, lon
+
+    lat_step = cell_km / KM_PER_DEGREE
+    row = math.floor((lat + 90.0) / lat_step)
+    center_lat = min(90.0, -90.0 + (row + 0.5) * lat_step)
+
+    lon_step = _lon_degrees(cell_km, center_lat)
+    col = math.floor((lon + 180.0) / lon_step)
+    center_lon = -180.0 + (col + 0.5) * lon_step
+    if center_lon >= 180.0:
+        center_lon -= 360.0
+
+    return round(center_lat, 6), round(center_lon, 6)
+
+
+class SpatialIndex:
+    """
+    Индекс точек по ячейкам равного размера в градусах: ключ -> координаты.
+    Поиск ближайших просматривает только ячейки в радиусе поиска.
+    """
+
+    def __init__(self, cell_km: float = INDEX_CELL_KM):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._cells: Dict[Tuple[int, int], Dict[str, Tuple[float, float]]] = {}
+        self._points: Dict[str, Tuple[int, int]] = {}
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def add(self, key: str, lat: float, lon: float) -> None:
+        self.discard(key)
+        cell = self._cell(lat, lon)
+        self._cells.setdefault(cell, {})[key] = (lat, lon)
+        self._points[key] = cell
+
+    def discard(self, key: str) -> None:
+        cell = self._points.pop(key, None)
+        if cell is None:
+            return
+        points = self._cells[cell]
+        del points[key]
+        if not points:
+            del self._cells[cell]
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def within(self, lat: float, lon: float, max_km: float) -> List[Tuple[float, str]]:
+        """Точки не дальше max_km: [(расстояние, ключ), ...] от ближайшей к дальней."""
+        dlat = max_km / KM_PER_DEGREE
+        dlon = _lon_degrees(max_km, min(89.9, abs(lat) + dlat))
+        row_min, col_min = self._cell(lat - dlat, lon - dlon)
+        row_max, col_max = self._cell(lat + dlat, lon + dlon)
+
+        found = []
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                for key, (point_lat, point_lon) in self._cells.get((row, col), {}).items():
+                    distance = haversine_km(lat, lon, point_lat, point_lon)
+                    if distance <= max_km:
+                        found.append((distance, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> Optional[Tuple[float, str]]:
+        found = self.within(lat, lon, max_km)
+        return found[0] if found else None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._points)
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, Optional, Tuple
+
+NOT_FOUND_TTL = 60 * 60  # сколько помним, что город не найден (сек)
+
+_SEPARATORS_RE = re.compile(r"[\s\-‐‑–—_.,]+")
+
+
+def normalize_city_name(name: str) -> str:
+    """
+    Приводит название города к ключу индекса.
+
+    " Москва ", "москва" и "МОСКВА" дают один ключ; "ё" считается "е",
+    дефисы и повторные пробелы схлопываются в один пробел.
+    """
+    name = unicodedata.normalize("NFKC", name).casefold().replace("ё", "е")
+    return _SEPARATORS_RE.sub(" ", name).strip()
+
+
+class GeocodingIndex:
+    """
+    Постоянный индекс: название города -> (lat, lon).
+
+    Координаты городов не меняются, поэтому найденные записи хранятся без TTL.
+    Отрицательные ответы ("город не найден") хранятся NOT_FOUND_TTL секунд.
+    Индекс сохраняется в JSON-файл и переживает перезапуск.
+    """
+
+    def __init__(self, index_file: str = "geocoding_index.json", not_found_ttl: int = NOT_FOUND_TTL):
+        self.index_file = index_file
+        self.not_found_ttl = not_found_ttl
+
+        self._coords: Dict[str, Tuple[float, float]] = {}
+        self._not_found: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self._load_index()
+
+    def lookup(self, city: str) -> Optional[Tuple[float, float]]:
+        return self._coords.get(normalize_city_name(city))
+
+    def is_not_found(self, city: str) -> bool:
+        expires_at = self._not_found.get(normalize_city_name(city))
+        return expires_at is not None and time.time() < expires_at
+
+    def add(self, city: str, lat: float, lon: float, aliases: Iterable[str] = ()) -> None:
+        """Запоминает координаты города и его альтернативные названия (например, из local_names)."""
+        with self._lock:
+            for name in [city, *aliases]:
+                key = normalize_city_name(name) if name else ""
+                if key:
+                    self._coords[key] = (lat, lon)
+                    self._not_found.pop(key, None)
+            self._save_index()
+
+    def add_place(self, city: str, place: Dict) -> None:
+        """
+        Запоминает ответ geo/1.0/direct для запроса city.
+
+        Вместе с запросом индексируются официальное название и русское/английское
+        из local_names, чтобы "Москва" и "Moscow" попадали в одну запись.
+        """
+        local_names = place.get('local_names') or {}
+        aliases = [place.get('name'), local_names.get('ru'), local_names.get('en')]
+        self.add(city, place['lat'], place['lon'], aliases)
+
+    def add_not_found(self, city: str) -> None:
+        with self._lock:
+            self._not_found[normalize_city_name(city)] = time.time() + self.not_found_ttl
+            self._save_index()
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    def _save_index(self) -> None:
+        now = time.time()
+        self._not_found = {k: v for k, v in self._not_found.items() if v > now}
+        data = {
+            "coords": {k: list(v) for k, v in self._coords.items()},
+            "not_found": self._not_found,
+        }
+
+        tmp_file = f"{self.index_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except IOError as e:
+            print(f"⚠️ Не удалось сохранить индекс геокодинга: {e}")
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_file):
+            return
+
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._coords = {k: (v[0], v[1]) for k, v in data.get("coords", {}).items()}
+            now = time.time()
+            self._not_found = {k: v for k, v in data.get("not_found", {}).items() if v > now}
+        except (IOError, json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+            self._coords = {}
+            self._not_found = {}
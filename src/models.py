@@ -0,0 +1,347 @@
+import sys
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field, fields, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+MODEL_KEY = "__model__"
+
+
+@dataclass(slots=True)
+class CurrentWeather:
+    """
+    Текущая погода. JSON ответа разбирается в модель один раз в клиенте,
+    дальше модель используют форматтеры и кэш.
+    """
+    temp: float
+    feels_like: float
+    humidity: int
+    pressure: int
+    wind_speed: float
+    description: str
+    icon: str
+    dt: int
+    timezone: int
+    lat: float
+    lon: float
+    city_name: str
+    cache_age: Optional[float] = None  # возраст устаревших данных из кэша (сек)
+
+    @classmethod
+    def from_api(cls, data: Dict) -> "CurrentWeather":
+        """Разбирает ответ data/2.5/weather. Raises: KeyError, IndexError при неполном ответе."""
+        main = data['main']
+        weather = data['weather'][0]
+        coord = data.get('coord', {})
+        return cls(
+            temp=float(main['temp']),
+            feels_like=float(main.get('feels_like', main['temp'])),
+            humidity=int(main['humidity']),
+            pressure=int(main['pressure']),
+            wind_speed=float(data['wind']['speed']),
+            description=sys.intern(weather['description']),
+            icon=sys.intern(weather.get('icon', '')),
+            dt=int(data.get('dt', 0)),
+            timezone=int(data.get('timezone', 0)),
+            lat=float(coord.get('lat', 0.0)),
+            lon=float(coord.get('lon', 0.0)),
+            city_name=data.get('name', ''),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'cache_age'}
+        result[MODEL_KEY] = "CurrentWeather"
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CurrentWeather":
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+@dataclass(slots=True)
+class ForecastPoint:
+    """Одна точка прогноза (шаг 3 часа). Создается по запросу из колонок Forecast."""
+    dt: int
+    temp: float
+    feels_like: float
+    humidity: int
+    pressure: int
+    wind_speed: float
+    pop: float
+    description: str
+
+    @property
+    def dt_txt(self) -> str:
+        """Время точки в UTC в формате API: 'YYYY-MM-DD HH:MM:SS'."""
+        return datetime.fromtimestamp(self.dt, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+@dataclass(slots=True)
+class ForecastDay:
+    """Один день прогноза: точки forecast[start:stop] и сводка по ним."""
+    date: str           # 'YYYY-MM-DD' по местному времени города
+    weekday: str        # 'Пн'
+    label: str          # '21.12'
+    start: int
+    stop: int
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    dominant: str       # самое частое описание погоды за день
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+
+@dataclass(slots=True)
+class ForecastIndex:
+    """
+    Разбивка прогноза по дням, считается один раз при создании Forecast.
+
+    Границы дней - полночь по местному времени города (city.timezone из
+    ответа API), поэтому первый и последний дни обычно неполные.
+    """
+    days: List[ForecastDay]
+
+    @classmethod
+    def build(cls, dt: array, temp: array, description: List[str], tz_offset: int) -> "ForecastIndex":
+        tz = timezone(timedelta(seconds=tz_offset))
+        days = []
+        start = 0
+        for i in range(1, len(dt) + 1):
+            # Точки отсортированы по времени: день заканчивается, когда меняется местная дата
+            if i < len(dt) and (dt[i] + tz_offset) // 86400 == (dt[start] + tz_offset) // 86400:
+                continue
+            date = datetime.fromtimestamp(dt[start], tz)
+            temps = temp[start:i]
+            days.append(ForecastDay(
+                date=date.strftime("%Y-%m-%d"),
+                weekday=WEEKDAYS[date.weekday()],
+                label=date.strftime("%d.%m"),
+                start=start,
+                stop=i,
+                temp_min=min(temps),
+                temp_max=max(temps),
+                temp_mean=sum(temps) / len(temps),
+                dominant=Counter(description[start:i]).most_common(1)[0][0],
+            ))
+            start = i
+        return cls(days)
+
+
+# Колонки прогноза и типы массивов для них
+FORECAST_COLUMNS = {
+    'dt': 'q',
+    'temp': 'd',
+    'feels_like': 'd',
+    'humidity': 'h',
+    'pressure': 'h',
+    'wind_speed': 'd',
+    'pop': 'd',
+}
+
+
+@dataclass(slots=True)
+class Forecast:
+    """Прогноз 5 дней / 3 часа: по массиву на каждое поле вместо списка словарей."""
+    city_name: str
+    country: str
+    timezone: int
+    lat: float
+    lon: float
+    dt: array
+    temp: array
+    feels_like: array
+    humidity: array
+    pressure: array
+    wind_speed: array
+    pop: array
+    description: List[str]
+    cache_age: Optional[float] = None
+    # Не сохраняется в кэш: строится заново в __post_init__ (40 точек - это дешево)
+    index: Optional[ForecastIndex] = field(default=None, compare=False, repr=False)
+    # Не сохраняется в кэш: numpy-кадр прогноза, строится при первом обращении
+    # (ForecastFrame.from_forecast) и живет, пока объект прогноза лежит в кэше
+    frame: Any = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.index is None:
+            self.index = ForecastIndex.build(self.dt, self.temp, self.description, self.timezone)
+
+    @classmethod
+    def from_api(cls, data: Dict) -> "Forecast":
+        """Разбирает ответ data/2.5/forecast. Raises: KeyError, IndexError при неполном ответе."""
+        columns = {name: array(typecode) for name, typecode in FORECAST_COLUMNS.items()}
+        descriptions = []
+
+        for item in sorted(data['list'], key=lambda x: x['dt']):
+            main = item['main']
+            columns['dt'].append(int(item['dt']))
+            columns['temp'].append(float(main['temp']))
+            columns['feels_like'].append(float(main.get('feels_like', main['temp'])))
+            columns['humidity'].append(int(main['humidity']))
+            columns['pressure'].append(int(main['pressure']))
+            columns['wind_speed'].append(float(item.get('wind', {}).get('speed', 0.0)))
+            columns['pop'].append(float(item.get('pop', 0.0)))
+            # Описаний немного разных - интернируем, чтобы 40 точек делили строки
+            descriptions.append(sys.intern(item['weather'][0]['description']))
+
+        city = data['city']
+        coord = city.get('coord', {})
+        return cls(
+            city_name=city['name'],
+            country=city.get('country', ''),
+            timezone=int(city.get('timezone', 0)),
+            lat=float(coord.get('lat', 0.0)),
+            lon=float(coord.get('lon', 0.0)),
+            description=descriptions,
+            **columns
+        )
+
+    @property
+    def cnt(self) -> int:
+        return len(self.dt)
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    def __getitem__(self, i: int) -> ForecastPoint:
+        return ForecastPoint(
+            dt=self.dt[i],
+            temp=self.temp[i],
+            feels_like=self.feels_like[i],
+            humidity=self.humidity[i],
+            pressure=self.pressure[i],
+            wind_speed=self.wind_speed[i],
+            pop=self.pop[i],
+            description=self.description[i],
+        )
+
+    def __iter__(self) -> Iterator[ForecastPoint]:
+        for i in range(len(self.dt)):
+            yield self[i]
+
+    @property
+    def days(self) -> List[ForecastDay]:
+        return self.index.days
+
+    def local_time(self, i: int) -> datetime:
+        """Время точки i по местному времени города."""
+        return datetime.fromtimestamp(self.dt[i], timezone(timedelta(seconds=self.timezone)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            'city_name': self.city_name,
+            'country': self.country,
+            'timezone': self.timezone,
+            'lat': self.lat,
+            'lon': self.lon,
+            'description': self.description,
+            MODEL_KEY: "Forecast",
+        }
+        for name in FORECAST_COLUMNS:
+            result[name] = getattr(self, name).tolist()
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Forecast":
+        columns = {name: array(typecode, data[name]) for name, typecode in FORECAST_COLUMNS.items()}
+        return cls(
+            city_name=data['city_name'],
+            country=data['country'],
+            timezone=data['timezone'],
+            lat=data['lat'],
+            lon=data['lon'],
+            description=[sys.intern(d) for d in data['description']],
+            **columns
+        )
+
+
+# Компоненты ответа air_pollution (µg/m³)
+AIR_COMPONENTS = ('co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3')
+
+
+@dataclass(slots=True)
+class AirPollutionSeries:
+    """
+    Почасовой ряд загрязнения воздуха (air_pollution/forecast и /history):
+    по массиву на каждый компонент, как колонки Forecast.
+    """
+    lat: float
+    lon: float
+    dt: array
+    aqi: array                          # индекс OpenWeather 1..5
+    components: Dict[str, array]        # компонент -> значения по часам
+    cache_age: Optional[float] = None
+
+    @classmethod
+    def from_api(cls, data: Dict) -> "AirPollutionSeries":
+        """Разбирает ответ air_pollution/forecast или /history. Raises: KeyError при неполном ответе."""
+        dt, aqi = array('q'), array('b')
+        components = {name: array('d') for name in AIR_COMPONENTS}
+        for item in sorted(data['list'], key=lambda x: x['dt']):
+            dt.append(int(item['dt']))
+            aqi.append(int(item.get('main', {}).get('aqi', 0)))
+            values = item['components']
+            for name in AIR_COMPONENTS:
+                components[name].append(float(values.get(name, 0.0)))
+
+        coord = data.get('coord', {})
+        return cls(lat=float(coord.get('lat', 0.0)), lon=float(coord.get('lon', 0.0)),
+                   dt=dt, aqi=aqi, components=components)
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    def at(self, i: int) -> Dict[str, float]:
+        """Компоненты часа i в формате ответа air_pollution."""
+        return {name: values[i] for name, values in self.components.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'lat': self.lat,
+            'lon': self.lon,
+            'dt': self.dt.tolist(),
+            'aqi': self.aqi.tolist(),
+            'components': {name: values.tolist() for name, values in self.components.items()},
+            MODEL_KEY: "AirPollutionSeries",
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AirPollutionSeries":
+        return cls(
+            lat=data['lat'],
+            lon=data['lon'],
+            dt=array('q', data['dt']),
+            aqi=array('b', data['aqi']),
+            components={name: array('d', values) for name, values in data['components'].items()},
+        )
+
+
+MODELS = {
+    "CurrentWeather": CurrentWeather,
+    "Forecast": Forecast,
+    "AirPollutionSeries": AirPollutionSeries,
+}
+
+
+def with_cache_age(model: Any, age: float) -> Any:
+    """Копия модели с пометкой возраста данных."""
+    return replace(model, cache_age=age)
+
+
+def encode_model(obj: Any) -> Dict[str, Any]:
+    """Для json.dump(default=...): модель -> словарь с меткой типа."""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def decode_model(data: Dict) -> Any:
+    """Для json.load(object_hook=...): словарь с меткой типа -> модель."""
+    model = MODELS.get(data.get(MODEL_KEY)) if MODEL_KEY in data else None
+    return model.from_dict(data) if model is not None else data
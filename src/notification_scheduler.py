@@ -0,0 +1,233 @@
+import heapq
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from weather_formatter import format_weather_output
+from geo_grid import GRID_CELL_KM, snap_to_grid
+
+TICK_INTERVAL = 30          # как часто проверять, кому пора отправлять (сек)
+DEFAULT_INTERVAL_H = 2
+RETRY_DELAY = 60            # первая повторная попытка после ошибки загрузки погоды (сек), дальше вдвое дольше
+
+# send(user_id, text); для личных чатов Telegram chat_id совпадает с user_id
+SendFunction = Callable[[int, str], None]
+RenderFunction = Callable[[object, str], str]
+
+
+def render_notification(weather, city: str) -> str:
+    return f"🔔 *Погода по подписке*\n\n{format_weather_output(weather, city)}"
+
+
+@dataclass(slots=True)
+class Subscriber:
+    user_id: int
+    city: str
+    lat: float
+    lon: float
+    interval: float     # сек
+    due: float          # time.time() следующей отправки
+    retries: int = 0    # неудачных попыток подряд
+
+
+class NotificationScheduler:
+    """
+    Рассылка погоды подписчикам по расписанию.
+
+    Подписчики лежат в min-куче по времени следующей отправки. На каждом
+    тике из кучи достаются все, кому пора; они группируются по ячейке сетки
+    grid_km (как и ключи кэша), погода запрашивается один раз на группу
+    (все группы параллельно через get_bundle_many), сообщение рендерится
+    один раз на город и рассылается всем в группе.
+
+    Если погоду для группы загрузить не удалось, ее подписчики получают
+    повторную попытку через retry_delay (с каждой неудачей вдвое позже, но не
+    позже следующей плановой отправки). Запросы рассылки фоновые: лимит API
+    они делят с командами пользователей, пропуская их вперед.
+
+    Отписка и смена интервала не ищут запись в куче: устаревшие записи
+    пропускаются при извлечении (сверяется due подписчика).
+    """
+
+    def __init__(self, weather_client, send: SendFunction,
+                 render: RenderFunction = render_notification,
+                 tick_interval: float = TICK_INTERVAL,
+                 grid_km: float = GRID_CELL_KM,
+                 retry_delay: float = RETRY_DELAY):
+        self.weather_client = weather_client
+        self.send = send
+        self.render = render
+        self.tick_interval = tick_interval
+        self.grid_km = grid_km
+        self.retry_delay = retry_delay
+
+        self.ticks = 0
+        self.fetches = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+        self._subscribers: Dict[int, Subscriber] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, users: Dict[str, Dict]) -> int:
+        """
+        Подписывает пользователей с включенными уведомлениями и известной локацией.
+        Первые отправки разносятся по интервалу, чтобы после перезапуска
+        все подписчики не пришли на один тик.
+        """
+        now = time.time()
+        count = 0
+        for user_id, data in users.items():
+            notifications = data.get("notifications", {})
+            if not notifications.get("enabled") or data.get("last_lat") is None:
+                continue
+            interval = notifications.get("interval_h", DEFAULT_INTERVAL_H) * 3600
+            offset = zlib.crc32(str(user_id).encode()) % max(1, int(interval))
+            self.subscribe(int(user_id), data.get("last_city", ""), data["last_lat"], data["last_lon"],
+                           notifications.get("interval_h", DEFAULT_INTERVAL_H), due=now + offset)
+            count += 1
+        return count
+
+    def subscribe(self, user_id: int, city: str, lat: float, lon: float,
+                  interval_h: float = DEFAULT_INTERVAL_H, due: float = None) -> None:
+        interval = interval_h * 3600
+        due = time.time() + interval if due is None else due
+        with self._lock:
+            self._subscribers[user_id] = Subscriber(user_id, city, lat, lon, interval, due)
+            heapq.heappush(self._heap, (due, user_id))
+
+    def unsubscribe(self, user_id: int) -> None:
+        with self._lock:
+            self._subscribers.pop(user_id, None)
+
+    def update_location(self, user_id: int, city: str, lat: float, lon: float) -> None:
+        """Новая локация подписчика; расписание не меняется. Для неподписанных ничего не делает."""
+        with self._lock:
+            subscriber = self._subscribers.get(user_id)
+            if subscriber is not None:
+                subscriber.city, subscriber.lat, subscriber.lon = city, lat, lon
+
+    def _pop_due(self, now: float) -> List[Subscriber]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, user_id = heapq.heappop(self._heap)
+                subscriber = self._subscribers.get(user_id)
+                if subscriber is None or subscriber.due != due_at:
+                    continue  # отписался или перепланирован
+                due.append(Subscriber(subscriber.user_id, subscriber.city, subscriber.lat,
+                                      subscriber.lon, subscriber.interval, subscriber.due,
+                                      subscriber.retries))
+                # Следующая отправка; если тики пропускались, не догоняем их пачкой
+                subscriber.due = max(due_at + subscriber.interval, now + 1)
+                heapq.heappush(self._heap, (subscriber.due, user_id))
+        return due
+
+    def _retry(self, subscribers: List[Subscriber], now: float) -> None:
+        """Переносит отправку не получивших погоду на повторную попытку."""
+        with self._lock:
+            for popped in subscribers:
+                subscriber = self._subscribers.get(popped.user_id)
+                if subscriber is None:
+                    continue
+                retry_at = now + self.retry_delay * 2 ** popped.retries
+                if retry_at >= subscriber.due:
+                    # Следующая плановая отправка наступит раньше повтора
+                    subscriber.retries = 0
+                    continue
+                subscriber.due = retry_at
+                subscriber.retries = popped.retries + 1
+                heapq.heappush(self._heap, (retry_at, subscriber.user_id))
+                self.retried += 1
+
+    def _reset_retries(self, subscribers: List[Subscriber]) -> None:
+        with self._lock:
+            for popped in subscribers:
+                subscriber = self._subscribers.get(popped.user_id)
+                if subscriber is not None:
+                    subscriber.retries = 0
+
+    def tick(self, now: float = None) -> int:
+        """Отправляет уведомления всем, кому пора. Returns: сколько сообщений отправлено."""
+        now = time.time() if now is None else now
+        self.ticks += 1
+
+        due = self._pop_due(now)
+        if not due:
+            return 0
+
+        groups: Dict[Tuple[float, float], List[Subscriber]] = {}
+        for subscriber in due:
+            key = snap_to_grid(subscriber.lat, subscriber.lon, self.grid_km)
+            groups.setdefault(key, []).append(subscriber)
+
+        locations = list(groups)
+        items = self.weather_client.get_bundle_many(locations, ("weather",), background=True)
+        self.fetches += len(locations)
+
+        sent = 0
+        for location, item in zip(locations, items):
+            subscribers = groups[location]
+            weather = item['weather']
+            if weather is None:
+                print(f"⚠️ Уведомления для {location}: {item['errors'].get('weather')}")
+                self.failed += len(subscribers)
+                self._retry(subscribers, now)
+                continue
+
+            if any(subscriber.retries for subscriber in subscribers):
+                self._reset_retries(subscribers)
+
+            texts: Dict[str, str] = {}
+            for subscriber in subscribers:
+                text = texts.get(subscriber.city)
+                if text is None:
+                    text = texts[subscriber.city] = self.render(weather, subscriber.city)
+                try:
+                    self.send(subscriber.user_id, text)
+                    sent += 1
+                except Exception as e:
+                    print(f"⚠️ Не удалось отправить уведомление {subscriber.user_id}: {e}")
+                    self.failed += 1
+
+        self.sent += sent
+        return sent
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.tick_interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"⚠️ Ошибка рассылки уведомлений: {e}")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.tick_interval)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscribers = len(self._subscribers)
+            next_due = self._heap[0][0] - time.time() if self._heap else None
+        return {
+            "subscribers": subscribers,
+            "next_due_in": next_due,
+            "ticks": self.ticks,
+            "fetches": self.fetches,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
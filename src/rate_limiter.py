@@ -0,0 +1,330 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from exceptions import RateLimitExceededError
+
+# Бесплатный тариф OpenWeather: 60 запросов в минуту, 1 000 000 в месяц
+CALLS_PER_MINUTE = 60
+CALLS_PER_DAY = 30000
+MAX_WAIT = 5.0       # дольше этого запрос в очереди не ждет, а отбрасывается (сек)
+SAVE_EVERY = 20      # запросы процесса прибавляются к общему счетчику дня пачками по N
+# Дневной счетчик общий для процессов бота и CLI
+QUOTA_DB = os.getenv("OPENWEATHER_QUOTA_DB", "api_quota.db")
+LEGACY_QUOTA_FILE = "api_quota.json"   # прежний формат, читается один раз при переходе
+# Фоновые запросы (рассылка) не трогают эту долю минутного лимита - она остается
+# командам пользователей - и ждут своей очереди дольше интерактивных
+INTERACTIVE_RESERVE = 0.25
+BACKGROUND_MAX_WAIT = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity в запасе.
+
+    reserve() не спит сам, а возвращает, сколько нужно подождать перед
+    запросом, поэтому подходит и для потоков, и для asyncio. Запас может
+    уходить в минус - так ожидающие запросы выстраиваются в очередь.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """Сколько токенов в запасе сейчас."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def reserve(self, tokens: float = 1, max_wait: float = None, not_before: float = 0.0) -> Optional[float]:
+        """
+        Резервирует токены.
+
+        Args:
+            tokens: Сколько токенов нужно
+            max_wait: Если ждать дольше, резерв не делается и возвращается None
+            not_before: Момент time.monotonic(), раньше которого запрос отправлять нельзя
+
+        Returns:
+            Сколько секунд подождать перед отправкой или None, если ждать слишком долго
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= tokens
+
+            wait = max(0.0, not_before - now)
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+
+            if max_wait is not None and wait > max_wait:
+                self.tokens += tokens
+                return None
+            return wait
+
+    def try_take(self, tokens: float = 1, floor: float = 0.0, not_before: float = 0.0) -> float:
+        """
+        Берет токены, только если их запас не опустится ниже floor и
+        not_before уже наступил. В отличие от reserve не встает в очередь.
+
+        Returns:
+            0.0, если токены взяты, иначе примерно сколько секунд подождать до следующей попытки
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, not_before - now, (floor + tokens - self.tokens) / self.rate)
+            if wait == 0.0:
+                self.tokens -= tokens
+            return wait
+
+
+class QuotaStore:
+    """
+    Дневные счетчики запросов в SQLite (WAL).
+
+    add() прибавляет запросы к счетчику дня в транзакции BEGIN IMMEDIATE и
+    возвращает новое значение, поэтому процессы не затирают чужие запросы,
+    как при перезаписи файла. У каждого потока свое соединение.
+    """
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, calls INTEGER NOT NULL)"
+
+    def __init__(self, db_file: str = QUOTA_DB):
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: транзакции открываем явно (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, day: str) -> int:
+        row = self._connect().execute("SELECT calls FROM quota WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else 0
+
+    def add(self, day: str, calls: int) -> int:
+        """Прибавляет calls к счетчику дня. Returns: счетчик с учетом других процессов."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""INSERT INTO quota (day, calls) VALUES (?, ?)
+                            ON CONFLICT(day) DO UPDATE SET calls = calls + excluded.calls""", (day, calls))
+            total = conn.execute("SELECT calls FROM quota WHERE day = ?", (day,)).fetchone()[0]
+            conn.execute("DELETE FROM quota WHERE day < ?", (day,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return total
+
+    def close(self) -> None:
+        """Закрывает соединение текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RateLimiter:
+    """
+    Учет лимитов OpenWeather до отправки запроса.
+
+    Минутный лимит сглаживается token bucket'ом, дневной считается общим
+    для процессов счетчиком в QuotaStore, который не сбрасывается при
+    перезапуске. Процесс прибавляет к нему свои запросы пачками по SAVE_EVERY
+    и заодно узнает, сколько потратили другие, поэтому вместе процессы могут
+    превысить дневной лимит не больше чем на SAVE_EVERY запросов каждый.
+    После ответа 429 запросы приостанавливаются на время из Retry-After.
+
+    Запросы внутри background() - фоновые: они не встают в очередь bucket'а
+    перед командами пользователей, а берут токен, только пока в запасе
+    остается interactive_reserve минутного лимита.
+    """
+
+    def __init__(self, per_minute: int = CALLS_PER_MINUTE, per_day: int = CALLS_PER_DAY,
+                 max_wait: float = MAX_WAIT, quota_db: str = QUOTA_DB,
+                 interactive_reserve: float = INTERACTIVE_RESERVE,
+                 background_max_wait: float = BACKGROUND_MAX_WAIT):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.max_wait = max_wait
+        self.quota = QuotaStore(quota_db)
+        self.interactive_reserve = interactive_reserve
+        self.background_max_wait = background_max_wait
+
+        self.bucket = TokenBucket(rate=per_minute / 60.0, capacity=per_minute)
+        self.shed = 0  # сколько запросов отброшено без отправки
+
+        self._paused_until = 0.0
+        self._day = self._today()
+        self._day_calls = 0      # общий счетчик с последней синхронизации + свои неучтенные
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self._load_quota()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _today() -> str:
+        # OpenWeather считает квоту по UTC
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    @contextmanager
+    def background(self):
+        """Запросы этого потока внутри блока - фоновые (с низким приоритетом)."""
+        previous = getattr(self._local, "background", False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def reserve(self, max_wait: float = None) -> float:
+        """
+        Резервирует один запрос к API.
+
+        Фоновый запрос (см. background) ждет свободного токена здесь же,
+        не дольше background_max_wait, и возвращает 0.
+
+        Returns:
+            Сколько секунд подождать перед отправкой
+
+        Raises:
+            RateLimitExceededError: дневной лимит исчерпан или ждать пришлось бы дольше max_wait
+        """
+        if getattr(self._local, "background", False):
+            return self._reserve_background(self.background_max_wait if max_wait is None else max_wait)
+
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        with self._lock:
+            self._check_day()
+            wait = self.bucket.reserve(max_wait=max_wait, not_before=self._paused_until)
+            if wait is None:
+                self.shed += 1
+                raise RateLimitExceededError("Превышен лимит запросов, попробуйте позже")
+            self._count_call()
+
+        return wait
+
+    def _reserve_background(self, max_wait: float) -> float:
+        floor = self.per_minute * self.interactive_reserve
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                self._check_day()
+                wait = self.bucket.try_take(floor=floor, not_before=self._paused_until)
+                if wait == 0.0:
+                    self._count_call()
+                    return 0.0
+            if time.monotonic() + wait > deadline:
+                with self._lock:
+                    self.shed += 1
+                raise RateLimitExceededError("Превышен лимит запросов для фоновых задач")
+            time.sleep(wait)
+
+    def _check_day(self) -> None:
+        today = self._today()
+        if today != self._day:
+            if self._unsaved:
+                self._save_quota()
+            self._day = today
+            self._day_calls = 0
+            self._load_quota()
+
+        if self._day_calls >= self.per_day:
+            self.shed += 1
+            raise RateLimitExceededError("Дневной лимит запросов к API исчерпан")
+
+    def _count_call(self) -> None:
+        self._day_calls += 1
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY:
+            self._save_quota()
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает отправку запросов (по Retry-After из ответа 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "day": self._day,
+                "day_calls": self._day_calls,
+                "day_remaining": max(0, self.per_day - self._day_calls),
+                "shed": self.shed,
+                "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            }
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._unsaved:
+                self._save_quota()
+
+    def _save_quota(self) -> None:
+        try:
+            self._day_calls = self.quota.add(self._day, self._unsaved)
+            self._unsaved = 0
+        except sqlite3.Error as e:
+            print(f"⚠️ Не удалось сохранить счетчик запросов: {e}")
+
+    def _load_quota(self) -> None:
+        try:
+            self._day_calls = self.quota.get(self._day) + self._unsaved
+            if not self._day_calls:
+                self._load_legacy_quota()
+        except sqlite3.Error as e:
+            print(f"⚠️ Счетчик запросов недоступен, считаем только свои: {e}")
+
+    def _load_legacy_quota(self) -> None:
+        if not os.path.exists(LEGACY_QUOTA_FILE):
+            return
+
+        try:
+            with open(LEGACY_QUOTA_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("date") == self._day and int(data.get("calls", 0)) > 0:
+                self._day_calls = self.quota.add(self._day, int(data["calls"]))
+        except (IOError, json.JSONDecodeError, ValueError, AttributeError):
+            pass
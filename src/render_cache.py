@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+MAX_ENTRIES = 5000
+DEFAULT_LOCALE = "ru"
+# Вместо ID локации в callback_data кнопок; при выдаче страницы заменяется на ID запроса
+LOCATION_ID = "{location_id}"
+
+# Готовая страница: текст сообщения и клавиатура в JSON (или None)
+Page = Tuple[str, Optional[str]]
+
+
+class RenderCache:
+    """
+    Кэш готовых сообщений бота: текст и JSON клавиатуры.
+
+    Ключ - (локация, страница, язык), где локация - ячейка сетки, как в
+    ключах кэша погоды: страница одна на всех, кто спросил о точках этой
+    ячейки. В записи хранится версия данных, по которым страница отрисована
+    (время загрузки записи кэша погоды); если версия не совпала, страница
+    отрисовывается заново и заменяет старую. Записи вытесняются в порядке LRU.
+
+    Кнопки ссылаются на ID локации из CallbackRegistry, а он у каждого
+    запроса свой, поэтому в кэше клавиатура хранится с LOCATION_ID и
+    подставляет location_id при выдаче.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Tuple, Tuple[Hashable, Page]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, version: Optional[Hashable], location: Hashable, page: str,
+                      render: Callable[[], Tuple[str, Any]], locale: str = DEFAULT_LOCALE,
+                      location_id: str = None) -> Page:
+        """
+        Готовая страница из кэша или результат render(), который кладется в кэш.
+
+        render возвращает (текст, клавиатура); клавиатура сохраняется в JSON
+        (telebot принимает reply_markup строкой). version=None - без кэша.
+        """
+        key = (location, page, locale)
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return self._with_location_id(entry[1], location_id)
+                self.misses += 1
+
+        text, markup = render()
+        result = (text, markup.to_json() if hasattr(markup, 'to_json') else markup)
+
+        if version is not None:
+            with self._lock:
+                self._entries[key] = (version, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return self._with_location_id(result, location_id)
+
+    @staticmethod
+    def _with_location_id(page: Page, location_id: Optional[str]) -> Page:
+        text, markup = page
+        if location_id is None or markup is None:
+            return page
+        return text, markup.replace(LOCATION_ID, location_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
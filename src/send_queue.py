@@ -0,0 +1,244 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rate_limiter import TokenBucket
+
+# Лимиты Telegram Bot API: около 30 сообщений в секунду на бота
+# и не чаще одного сообщения в секунду в один чат (короткие всплески допустимы)
+MESSAGES_PER_SECOND = 30
+PER_CHAT_PER_SECOND = 1.0
+PER_CHAT_BURST = 3
+SEND_WORKERS = 8
+MAX_RETRIES = 3          # сколько раз повторять сообщение после 429
+MAX_CHAT_BUCKETS = 10000  # сверх этого удаляются bucket'ы неактивных чатов
+
+# Приоритеты: меньше - раньше
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+SendFunction = Callable[..., Any]
+
+
+def telegram_retry_after(error: Exception) -> Optional[float]:
+    """retry_after из ошибки 429 Telegram (ApiTelegramException) или None для других ошибок."""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    result_json = getattr(error, "result_json", None) or {}
+    retry_after = result_json.get("parameters", {}).get("retry_after")
+    return float(retry_after) if retry_after is not None else 1.0
+
+
+class OutgoingMessage:
+    __slots__ = ("priority", "chat_id", "text", "kwargs", "future",
+                 "enqueued_at", "attempts", "chat_reserved")
+
+    def __init__(self, priority: int, chat_id: int, text: str, kwargs: Dict):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.chat_reserved = False
+
+
+class TelegramSendQueue:
+    """
+    Очередь исходящих сообщений Telegram с учетом лимитов.
+
+    Поток-диспетчер выбирает сообщение с наивысшим приоритетом (ответы
+    пользователям раньше рассылок), проверяет token bucket чата и общий
+    token bucket бота и передает сообщение в пул потоков отправки.
+    Сообщение в чат, исчерпавший свой лимит, откладывается и не задерживает
+    сообщения в другие чаты. На ответ 429 сообщение повторяется через
+    retry_after, а чат до этого времени ставится на паузу.
+
+    send() возвращает Future с результатом send_func (отправленным Message).
+    """
+
+    def __init__(self, send_func: SendFunction,
+                 per_second: float = MESSAGES_PER_SECOND,
+                 per_chat_per_second: float = PER_CHAT_PER_SECOND,
+                 per_chat_burst: float = PER_CHAT_BURST,
+                 workers: int = SEND_WORKERS):
+        self.send_func = send_func
+        self.per_chat_per_second = per_chat_per_second
+        self.per_chat_burst = per_chat_burst
+
+        self.global_bucket = TokenBucket(rate=per_second, capacity=per_second)
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latency: Dict[int, List[float]] = {}   # priority -> [count, total, max]
+
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_paused: Dict[int, float] = {}
+        self._ready: List[Tuple[int, int, OutgoingMessage]] = []
+        self._delayed: List[Tuple[float, int, OutgoingMessage]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._aborted = False   # close не дождался очереди: диспетчер больше ничего не отправляет
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tg-send")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="tg-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def send(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> Future:
+        """Ставит сообщение в очередь. kwargs передаются в send_func (parse_mode, reply_markup...)."""
+        message = OutgoingMessage(priority, chat_id, text, kwargs)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Очередь отправки остановлена")
+            heapq.heappush(self._ready, (priority, next(self._seq), message))
+            self._cond.notify()
+        return message.future
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._prune_chat_buckets()
+            bucket = TokenBucket(rate=self.per_chat_per_second, capacity=self.per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self) -> None:
+        # Полный bucket ничем не отличается от нового - такие можно забыть
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items()
+                if bucket.available() >= bucket.capacity]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    def _defer(self, message: OutgoingMessage, not_before: float) -> None:
+        heapq.heappush(self._delayed, (not_before, next(self._seq), message))
+
+    def _next_message(self) -> Optional[OutgoingMessage]:
+        """Ждет и достает следующее сообщение. None - очередь остановлена и пуста."""
+        with self._cond:
+            while True:
+                if self._aborted:
+                    return None
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, message = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (message.priority, next(self._seq), message))
+
+                if self._ready:
+                    _, _, message = heapq.heappop(self._ready)
+                    paused_until = self._chat_paused.get(message.chat_id, 0.0)
+                    if paused_until > now:
+                        self._defer(message, paused_until)
+                        continue
+                    if paused_until:
+                        del self._chat_paused[message.chat_id]
+                    return message
+
+                if self._stopped and not self._delayed:
+                    return None
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+
+            if not message.chat_reserved:
+                message.chat_reserved = True
+                wait = self._chat_bucket(message.chat_id).reserve()
+                if wait > 0:
+                    with self._cond:
+                        self._defer(message, time.monotonic() + wait)
+                    continue
+
+            wait = self.global_bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+            message.chat_reserved = False
+            self._executor.submit(self._deliver, message)
+
+    def _deliver(self, message: OutgoingMessage) -> None:
+        try:
+            result = self.send_func(message.chat_id, message.text, **message.kwargs)
+        except Exception as e:
+            retry_after = telegram_retry_after(e)
+            if retry_after is not None and message.attempts < MAX_RETRIES:
+                message.attempts += 1
+                with self._cond:
+                    self.retried += 1
+                    not_before = time.monotonic() + retry_after
+                    self._chat_paused[message.chat_id] = max(
+                        self._chat_paused.get(message.chat_id, 0.0), not_before)
+                    self._defer(message, not_before)
+                    self._cond.notify()
+                return
+            with self._cond:
+                self.failed += 1
+            message.future.set_exception(e)
+            return
+
+        latency = time.monotonic() - message.enqueued_at
+        with self._cond:
+            self.sent += 1
+            stats = self._latency.setdefault(message.priority, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += latency
+            stats[2] = max(stats[2], latency)
+        message.future.set_result(result)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            latency = {
+                PRIORITY_NAMES.get(priority, str(priority)): {
+                    "sent": count,
+                    "avg_latency": total / count,
+                    "max_latency": max_latency,
+                }
+                for priority, (count, total, max_latency) in self._latency.items()
+            }
+            return {
+                "queued": len(self._ready) + len(self._delayed),
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "by_priority": latency,
+            }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Отправляет то, что уже в очереди (не дольше timeout), и останавливает
+        потоки. Сообщения, которые не успели уйти (в том числе отложенные
+        после 429), завершаются ошибкой RuntimeError - их Future не зависают.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._dispatcher.join(timeout)
+        if self._dispatcher.is_alive():
+            with self._cond:
+                self._aborted = True
+                self._cond.notify_all()
+            # Диспетчер ждет не дольше паузы общего лимита
+            self._dispatcher.join()
+        # Пул останавливается только после диспетчера: submit в остановленный пул падает
+        self._executor.shutdown(wait=True)
+
+        with self._cond:
+            pending = [message for _, _, message in self._ready] + [message for _, _, message in self._delayed]
+            self._ready.clear()
+            self._delayed.clear()
+            self.failed += len(pending)
+        for message in pending:
+            if not message.future.done():
+                message.future.set_exception(RuntimeError("Очередь отправки остановлена"))
@@ -0,0 +1,197 @@
+import json
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # без msgpack файлы пишутся в JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from models import encode_model, decode_model
+
+MAGIC = b"WCB"          # weather cache binary
+FORMAT_VERSION = 1
+
+# magic, версия формата, кодек, сжатие
+FILE_HEADER = struct.Struct("<3sBBB")
+# fetched_at, expires_at (unix time), длина ключа, длина данных
+ENTRY_HEADER = struct.Struct("<ddHI")
+
+# кодек и сжатие отдельно упакованных данных (строки кэша в SQLite)
+PAYLOAD_HEADER = struct.Struct("<BB")
+
+# (ключ, fetched_at, expires_at, данные)
+Entry = Tuple[str, float, float, Any]
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    id: int
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+@dataclass(frozen=True)
+class Compressor:
+    name: str
+    id: int
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=encode_model).encode('utf-8')
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data, object_hook=decode_model)
+
+
+CODECS = {"json": Codec("json", 1, _json_dumps, _json_loads)}
+if msgpack is not None:
+    CODECS["msgpack"] = Codec(
+        "msgpack", 2,
+        lambda obj: msgpack.packb(obj, default=encode_model, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, object_hook=decode_model, raw=False, strict_map_key=False),
+    )
+
+COMPRESSORS = {
+    "none": Compressor("none", 0, bytes, bytes),
+    "zlib": Compressor("zlib", 1, lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    # Компрессоры zstandard не потокобезопасны - создаются на каждый вызов
+    COMPRESSORS["zstd"] = Compressor(
+        "zstd", 2,
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+if lz4 is not None:
+    COMPRESSORS["lz4"] = Compressor("lz4", 3, lz4.frame.compress, lz4.frame.decompress)
+
+_CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+_COMPRESSORS_BY_ID = {compressor.id: compressor for compressor in COMPRESSORS.values()}
+
+
+def default_format() -> str:
+    """Самый компактный формат из доступных: msgpack и zstd, если установлены."""
+    codec = "msgpack" if "msgpack" in CODECS else "json"
+    compression = next(name for name in ("zstd", "lz4", "zlib") if name in COMPRESSORS)
+    return f"{codec}+{compression}"
+
+
+def parse_format(spec: str) -> Tuple[Codec, Compressor]:
+    """
+    'msgpack+zstd' -> (кодек, сжатие). Недоступные кодек или сжатие
+    заменяются на json / zlib с предупреждением.
+    """
+    codec_name, _, compression_name = (spec or default_format()).partition("+")
+    codec = CODECS.get(codec_name)
+    if codec is None:
+        print(f"⚠️ Формат '{codec_name}' недоступен, кэш сохраняется в JSON")
+        codec = CODECS["json"]
+    compressor = COMPRESSORS.get(compression_name or "none")
+    if compressor is None:
+        print(f"⚠️ Сжатие '{compression_name}' недоступно, используется zlib")
+        compressor = COMPRESSORS["zlib"]
+    return codec, compressor
+
+
+def is_binary_file(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_entries(path: str, entries: Iterable[Entry], codec: Codec = None, compressor: Compressor = None) -> int:
+    """
+    Атомарно записывает записи в файл: заголовок файла, затем для каждой
+    записи заголовок (сроки, длины), ключ и сжатые данные. Кодек и сжатие -
+    результат parse_format (по умолчанию default_format()).
+    Returns: сколько записей записано.
+    """
+    if codec is None or compressor is None:
+        codec, compressor = parse_format(default_format())
+    tmp_file = f"{path}.tmp"
+    count = 0
+    with open(tmp_file, 'wb') as f:
+        f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, codec.id, compressor.id))
+        for key, fetched_at, expires_at, data in entries:
+            key_bytes = key.encode('utf-8')
+            payload = compressor.compress(codec.dumps(data))
+            f.write(ENTRY_HEADER.pack(fetched_at, expires_at, len(key_bytes), len(payload)))
+            f.write(key_bytes)
+            f.write(payload)
+            count += 1
+    os.replace(tmp_file, path)
+    return count
+
+
+def read_entries(path: str, keep: Optional[Callable[[float, float], bool]] = None) -> Iterator[Entry]:
+    """
+    Читает записи файла. keep(fetched_at, expires_at) решает по заголовку,
+    нужна ли запись: данные отброшенных записей не распаковываются и не
+    разбираются. Raises: ValueError для чужого или поврежденного файла.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError("файл кэша обрезан")
+        magic, version, codec_id, compressor_id = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("неизвестный формат файла кэша")
+        codec = _CODECS_BY_ID.get(codec_id)
+        compressor = _COMPRESSORS_BY_ID.get(compressor_id)
+        if codec is None or compressor is None:
+            raise ValueError("файл кэша записан форматом, который здесь недоступен")
+
+        while True:
+            header = f.read(ENTRY_HEADER.size)
+            if not header:
+                return
+            if len(header) < ENTRY_HEADER.size:
+                raise ValueError("файл кэша обрезан")
+            fetched_at, expires_at, key_len, payload_len = ENTRY_HEADER.unpack(header)
+            key = f.read(key_len).decode('utf-8')
+            if keep is not None and not keep(fetched_at, expires_at):
+                f.seek(payload_len, os.SEEK_CUR)
+                continue
+            payload = f.read(payload_len)
+            if len(payload) < payload_len:
+                raise ValueError("файл кэша обрезан")
+            try:
+                data = codec.loads(compressor.decompress(payload))
+            except Exception as e:  # у zlib, zstd, lz4 и msgpack свои типы ошибок
+                raise ValueError(f"поврежденная запись {key}: {e}") from e
+            yield key, fetched_at, expires_at, data
+
+
+def encode_payload(data: Any, codec: Codec, compressor: Compressor) -> bytes:
+    """Отдельное значение с коротким заголовком формата: читается при любых настройках читателя."""
+    return PAYLOAD_HEADER.pack(codec.id, compressor.id) + compressor.compress(codec.dumps(data))
+
+
+def decode_payload(blob: bytes) -> Any:
+    """Обратное к encode_payload. Raises: ValueError для недоступного формата или поврежденных данных."""
+    codec_id, compressor_id = PAYLOAD_HEADER.unpack_from(blob)
+    codec = _CODECS_BY_ID.get(codec_id)
+    compressor = _COMPRESSORS_BY_ID.get(compressor_id)
+    if codec is None or compressor is None:
+        raise ValueError("данные записаны форматом, который здесь недоступен")
+    try:
+        return codec.loads(compressor.decompress(blob[PAYLOAD_HEADER.size:]))
+    except Exception as e:  # у zlib, zstd, lz4 и msgpack свои типы ошибок
+        raise ValueError(f"поврежденные данные: {e}") from e
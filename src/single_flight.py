@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов (single-flight).
+
+    Пока вызов с ключом key выполняется, остальные потоки с тем же ключом не
+    делают свой запрос, а ждут и получают тот же результат или то же исключение.
+    """
+
+    def __init__(self):
+        self.calls = 0       # сколько вызовов реально выполнено
+        self.coalesced = 0   # сколько вызовов присоединилось к уже идущему
+
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+
+class AsyncSingleFlight:
+    """Тот же механизм для корутин одного event loop."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: отмена одного ожидающего не должна отменять общий запрос
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._in_flight[key] = future
+        self.calls += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                del self._in_flight[key]
+            else:
+                future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
@@ -1,60 +1,39 @@
+import atexit
+import copy
 import json
 import os
-from typing import Dict, Any
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 USER_DATA_FILE = "User_Data.json"
+USER_DB_FILE = "User_Data.db"
 
+# json - старый формат (весь файл перезаписывается на каждое изменение),
+# sqlite - база в режиме WAL с построчным чтением и записью,
+# memory - пользователи в памяти, изменения пачками сбрасываются в JSON-файл
+STORAGE_BACKEND = os.getenv("USER_STORAGE_BACKEND", "sqlite")
 
-def init_user_data():
-    """Создает файл с данными пользователей, если его нет"""
-    if not os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
-
-
-def load_all_users() -> Dict[str, Any]:
-    init_user_data()
-    try:
-        with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return {}
-
-
-def save_all_users(users_data: Dict[str, Any]) -> None:
-    try:
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users_data, f, ensure_ascii=False, indent=2)
-    except IOError as e:
-        print(f"⚠️ Ошибка сохранения данных: {e}")
+FLUSH_INTERVAL = 5.0    # как часто сбрасывать измененных пользователей на диск (сек)
+FLUSH_THRESHOLD = 100   # сбросить раньше, если накопилось столько измененных
 
 
-def load_user(user_id: int) -> Dict[str, Any]:
-    users = load_all_users()
-    return users.get(str(user_id), {
+def default_user() -> Dict[str, Any]:
+    return {
         "notifications": {"enabled": False, "interval_h": 2},
         "created_at": datetime.now().isoformat()
-    })
-
-
-def save_user(user_id: int, user_data: Dict[str, Any]) -> None:
-    users = load_all_users()
-    users[str(user_id)] = user_data
-    save_all_users(users)
+    }
 
 
-def update_user_location(user_id: int, city: str, lat: float, lon: float) -> None:
-    user_data = load_user(user_id)
+def _apply_location(user_data: Dict[str, Any], city: str, lat: float, lon: float) -> None:
     user_data["last_city"] = city
     user_data["last_lat"] = lat
     user_data["last_lon"] = lon
     user_data["last_updated"] = datetime.now().isoformat()
-    save_user(user_id, user_data)
 
 
-def toggle_notifications(user_id: int, enabled: bool = None) -> bool:
-    user_data = load_user(user_id)
+def _apply_notifications(user_data: Dict[str, Any], enabled: Optional[bool]) -> bool:
     if "notifications" not in user_data:
         user_data["notifications"] = {"enabled": False, "interval_h": 2}
 
@@ -63,6 +42,464 @@ def toggle_notifications(user_id: int, enabled: bool = None) -> bool:
         user_data["notifications"]["enabled"] = not user_data["notifications"]["enabled"]
     else:
         user_data["notifications"]["enabled"] = enabled
-
-    save_user(user_id, user_data)
     return user_data["notifications"]["enabled"]
+
+
+class JSONUserStorage:
+    """Все пользователи в одном JSON-файле. Любое изменение перезаписывает файл целиком."""
+
+    def __init__(self, data_file: str = USER_DATA_FILE):
+        self.data_file = data_file
+        # Потоки бота не должны терять изменения друг друга между чтением и записью
+        self._lock = threading.RLock()
+
+    def init(self) -> None:
+        with self._lock:
+            if not os.path.exists(self.data_file):
+                self.save_all({})
+
+    def load_all(self) -> Dict[str, Any]:
+        with self._lock:
+            self.init()
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return {}
+
+    def save_all(self, users_data: Dict[str, Any]) -> None:
+        try:
+            self._write(users_data)
+        except IOError as e:
+            print(f"⚠️ Ошибка сохранения данных: {e}")
+
+    def _write(self, users_data: Dict[str, Any]) -> None:
+        with self._lock:
+            # Через временный файл, чтобы при сбое не остался обрезанный JSON
+            tmp_file = self.data_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(users_data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.data_file)
+
+    def save_many(self, users_data: Dict[str, Any]) -> None:
+        """Сохраняет нескольких пользователей одной записью файла. Raises: IOError."""
+        with self._lock:
+            users = self.load_all()
+            users.update(users_data)
+            self._write(users)
+
+    def load(self, user_id: int) -> Dict[str, Any]:
+        return self.load_all().get(str(user_id), default_user())
+
+    def save(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        with self._lock:
+            users = self.load_all()
+            users[str(user_id)] = user_data
+            self.save_all(users)
+
+    def update_location(self, user_id: int, city: str, lat: float, lon: float) -> None:
+        with self._lock:
+            user_data = self.load(user_id)
+            _apply_location(user_data, city, lat, lon)
+            self.save(user_id, user_data)
+
+    def toggle_notifications(self, user_id: int, enabled: bool = None) -> bool:
+        with self._lock:
+            user_data = self.load(user_id)
+            result = _apply_notifications(user_data, enabled)
+            self.save(user_id, user_data)
+            return result
+
+    def users_with_notifications(self) -> List[int]:
+        return [int(user_id) for user_id, data in self.load_all().items()
+                if data.get("notifications", {}).get("enabled")]
+
+
+class SQLiteUserStorage:
+    """
+    Пользователи в SQLite (WAL): одна строка на пользователя.
+
+    Данные пользователя хранятся JSON-документом в колонке data, а поля,
+    по которым нужны выборки (уведомления, последний город), дублируются
+    в отдельные колонки с индексом. У каждого потока свое соединение;
+    WAL позволяет читать параллельно с записью.
+
+    При первом запуске пользователи один раз переносятся из User_Data.json.
+    Схема применяется при каждом подключении (IF NOT EXISTS), поэтому
+    новые индексы появляются и в уже существующей базе.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            notifications_enabled INTEGER NOT NULL DEFAULT 0,
+            last_city TEXT,
+            last_lat REAL,
+            last_lon REAL,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_notifications
+            ON users (notifications_enabled) WHERE notifications_enabled = 1;
+        CREATE INDEX IF NOT EXISTS idx_users_location ON users (last_lat, last_lon);
+        CREATE INDEX IF NOT EXISTS idx_users_city ON users (last_city);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: str = USER_DB_FILE, json_file: Optional[str] = USER_DATA_FILE):
+        self.db_file = db_file
+        self.json_file = json_file
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: транзакции открываем явно (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def init(self) -> None:
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            conn.executescript(self.SCHEMA)
+            self._migrate_from_json(conn)
+            self._initialized = True
+
+    def _migrate_from_json(self, conn: sqlite3.Connection) -> None:
+        """Однократный перенос пользователей из JSON-файла. Сам файл не удаляется."""
+        if not self.json_file or not os.path.exists(self.json_file):
+            return
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+
+        try:
+            with open(self.json_file, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"⚠️ Не удалось прочитать {self.json_file} для переноса: {e}")
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, user_data in users.items():
+                self._upsert(conn, int(user_id), user_data)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                         (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"✅ Перенесено пользователей из {self.json_file}: {len(users)}")
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, user_id: int, user_data: Dict[str, Any]) -> None:
+        conn.execute(
+            """INSERT INTO users (user_id, data, notifications_enabled, last_city, last_lat, last_lon, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   data = excluded.data,
+                   notifications_enabled = excluded.notifications_enabled,
+                   last_city = excluded.last_city,
+                   last_lat = excluded.last_lat,
+                   last_lon = excluded.last_lon,
+                   updated_at = excluded.updated_at""",
+            (
+                user_id,
+                json.dumps(user_data, ensure_ascii=False),
+                int(bool(user_data.get("notifications", {}).get("enabled"))),
+                user_data.get("last_city"),
+                user_data.get("last_lat"),
+                user_data.get("last_lon"),
+                datetime.now().isoformat(),
+            )
+        )
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, user_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, user_id: int, change) -> Any:
+        """Читает, меняет и записывает пользователя в одной транзакции - без потерянных обновлений."""
+        self.init()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            user_data = self._select(conn, user_id) or default_user()
+            result = change(user_data)
+            self._upsert(conn, user_id, user_data)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def load_all(self) -> Dict[str, Any]:
+        self.init()
+        rows = self._connect().execute("SELECT user_id, data FROM users").fetchall()
+        return {str(user_id): json.loads(data) for user_id, data in rows}
+
+    def save_all(self, users_data: Dict[str, Any]) -> None:
+        self.init()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM users")
+            for user_id, user_data in users_data.items():
+                self._upsert(conn, int(user_id), user_data)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save_many(self, users_data: Dict[str, Any]) -> None:
+        """Сохраняет нескольких пользователей в одной транзакции."""
+        self.init()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, user_data in users_data.items():
+                self._upsert(conn, int(user_id), user_data)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self, user_id: int) -> Dict[str, Any]:
+        self.init()
+        return self._select(self._connect(), int(user_id)) or default_user()
+
+    def save(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        self.init()
+        self._upsert(self._connect(), int(user_id), user_data)
+
+    def update_location(self, user_id: int, city: str, lat: float, lon: float) -> None:
+        self._modify(int(user_id), lambda user_data: _apply_location(user_data, city, lat, lon))
+
+    def toggle_notifications(self, user_id: int, enabled: bool = None) -> bool:
+        return self._modify(int(user_id), lambda user_data: _apply_notifications(user_data, enabled))
+
+    def users_with_notifications(self) -> List[int]:
+        self.init()
+        rows = self._connect().execute(
+            "SELECT user_id FROM users WHERE notifications_enabled = 1").fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """Закрывает соединение текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class WriteBehindUserStorage:
+    """
+    Пользователи в памяти с отложенной записью (write-behind).
+
+    Все пользователи загружаются из backend один раз, load_user отвечает из
+    памяти. Изменения только помечают пользователя как измененного; фоновый
+    поток сбрасывает измененных пачкой через backend.save_many() раз в
+    flush_interval секунд или сразу, как их накопится flush_threshold.
+    При выходе из программы несохраненное сбрасывается (atexit).
+    """
+
+    def __init__(self, backend=None, flush_interval: float = FLUSH_INTERVAL,
+                 flush_threshold: int = FLUSH_THRESHOLD):
+        self.backend = backend if backend is not None else JSONUserStorage()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self.flushes = 0
+        self.flushed_users = 0
+
+        self._users: Optional[Dict[str, Any]] = None
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        atexit.register(self.close)
+
+    def init(self) -> None:
+        with self._lock:
+            if self._users is not None:
+                return
+            self.backend.init()
+            self._users = self.backend.load_all()
+            self._thread = threading.Thread(target=self._flush_loop, name="user-storage-flush", daemon=True)
+            self._thread.start()
+
+    def _table(self) -> Dict[str, Any]:
+        if self._users is None:
+            self.init()
+        return self._users
+
+    def _mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if len(self._dirty) >= self.flush_threshold:
+            self._wakeup.set()
+
+    def load_all(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self._table())
+
+    def save_all(self, users_data: Dict[str, Any]) -> None:
+        # Под _flush_lock: сброс, снявший снимок до save_all, не перезапишет новые данные старыми
+        with self._flush_lock, self._lock:
+            self.backend.save_all(users_data)
+            self._users = copy.deepcopy(users_data)
+            self._dirty.clear()
+
+    def load(self, user_id: int) -> Dict[str, Any]:
+        with self._lock:
+            user_data = self._table().get(str(user_id))
+            # Копия: изменения вызывающего не должны попадать в таблицу без save_user
+            return copy.deepcopy(user_data) if user_data is not None else default_user()
+
+    def save(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        with self._lock:
+            key = str(user_id)
+            self._table()[key] = copy.deepcopy(user_data)
+            self._mark_dirty(key)
+
+    def _modify(self, user_id: int, change) -> Any:
+        with self._lock:
+            key = str(user_id)
+            users = self._table()
+            user_data = users.get(key)
+            if user_data is None:
+                user_data = users[key] = default_user()
+            result = change(user_data)
+            self._mark_dirty(key)
+            return result
+
+    def update_location(self, user_id: int, city: str, lat: float, lon: float) -> None:
+        self._modify(user_id, lambda user_data: _apply_location(user_data, city, lat, lon))
+
+    def toggle_notifications(self, user_id: int, enabled: bool = None) -> bool:
+        return self._modify(user_id, lambda user_data: _apply_notifications(user_data, enabled))
+
+    def users_with_notifications(self) -> List[int]:
+        with self._lock:
+            return [int(user_id) for user_id, data in self._table().items()
+                    if data.get("notifications", {}).get("enabled")]
+
+    def flush(self) -> None:
+        """Записывает измененных пользователей одной пачкой."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                batch = {key: copy.deepcopy(self._users[key]) for key in self._dirty}
+                self._dirty.clear()
+
+            try:
+                self.backend.save_many(batch)
+            except Exception as e:
+                print(f"⚠️ Ошибка сохранения данных: {e}")
+                with self._lock:
+                    # Не потерять изменения - попробуем при следующем сбросе
+                    self._dirty.update(batch)
+                return
+
+            self.flushes += 1
+            self.flushed_users += len(batch)
+
+    def _flush_loop(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "users": len(self._users or {}),
+                "dirty": len(self._dirty),
+                "flushes": self.flushes,
+                "flushed_users": self.flushed_users,
+            }
+
+    def close(self) -> None:
+        """Останавливает фоновый поток и сбрасывает несохраненные изменения."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+
+BACKENDS = {
+    "json": JSONUserStorage,
+    "sqlite": SQLiteUserStorage,
+    "memory": WriteBehindUserStorage,
+}
+
+_storage = None
+
+
+def get_storage():
+    """Хранилище, выбранное переменной окружения USER_STORAGE_BACKEND (json, sqlite или memory)."""
+    global _storage
+    if _storage is None:
+        backend = BACKENDS.get(STORAGE_BACKEND.lower())
+        if backend is None:
+            print(f"⚠️ Неизвестный USER_STORAGE_BACKEND={STORAGE_BACKEND}, используется sqlite")
+            backend = SQLiteUserStorage
+        _storage = backend()
+    return _storage
+
+
+def set_storage(storage) -> None:
+    """Подменяет хранилище (например, на другой файл)."""
+    global _storage
+    _storage = storage
+
+
+def init_user_data():
+    """Создает хранилище данных пользователей, если его нет"""
+    get_storage().init()
+
+
+def load_all_users() -> Dict[str, Any]:
+    return get_storage().load_all()
+
+
+def save_all_users(users_data: Dict[str, Any]) -> None:
+    get_storage().save_all(users_data)
+
+
+def load_user(user_id: int) -> Dict[str, Any]:
+    return get_storage().load(user_id)
+
+
+def save_user(user_id: int, user_data: Dict[str, Any]) -> None:
+    get_storage().save(user_id, user_data)
+
+
+def update_user_location(user_id: int, city: str, lat: float, lon: float) -> None:
+    get_storage().update_location(user_id, city, lat, lon)
+
+
+def toggle_notifications(user_id: int, enabled: bool = None) -> bool:
+    return get_storage().toggle_notifications(user_id, enabled)
+
+
+def get_users_with_notifications() -> List[int]:
+    """ID пользователей с включенными уведомлениями."""
+    return get_storage().users_with_notifications()
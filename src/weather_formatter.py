@@ -1,5 +1,13 @@
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List
-from datetime import datetime
+
+from cache_manager import CACHE_AGE_KEY
+from models import CurrentWeather, Forecast
+
+try:
+    from forecast_analytics import ForecastFrame
+except ImportError:  # numpy не установлен: прогноз выводится без аналитики
+    ForecastFrame = None
 
 WEATHER_EMOJIS = {
     'ясно': '☀️', 'солнечно': '☀️', 'clear': '☀️',
@@ -12,34 +20,37 @@ WEATHER_EMOJIS = {
 }
 
 
-def format_weather_output(weather_data: Dict, city: str) -> str:
-    try:
-        temp = weather_data['main']['temp']
-        feels_like = weather_data['main'].get('feels_like', temp)
-        description = weather_data['weather'][0]['description'].lower()
-        humidity = weather_data['main']['humidity']
-        pressure = weather_data['main']['pressure']
-        wind_speed = weather_data['wind']['speed']
-
-        emoji = '🌤️'
-        for key, value in WEATHER_EMOJIS.items():
-            if key in description:
-                emoji = value
-                break
-
-        return (f"{emoji} *Погода в {city}:*\n"
-                f"🌡️ Температура: {temp:.1f}°C (ощущается как {feels_like:.1f}°C)\n"
-                f"📝 {description.capitalize()}\n"
-                f"💧 Влажность: {humidity}%\n"
-                f"📊 Давление: {pressure} гПа\n"
-                f"💨 Ветер: {wind_speed} м/с")
-    except KeyError as e:
-        return f"⚠️ Неполные данные о погоде: отсутствует поле {e}"
-
-
-def format_forecast_day(forecast_data: Dict, day_index: int) -> str:
+def format_data_age(data) -> str:
+    """Пометка для устаревших данных из кэша (stale-while-revalidate)."""
+    age = data.get(CACHE_AGE_KEY) if isinstance(data, dict) else getattr(data, 'cache_age', None)
+    if age is None:
+        return ""
+    return f"\n🕒 Данные получены {int(age // 60)} мин назад, обновляются..."
+
+
+def get_weather_emoji(description: str) -> str:
+    for key, value in WEATHER_EMOJIS.items():
+        if key in description:
+            return value
+    return '🌤️'
+
+
+def format_weather_output(weather: CurrentWeather, city: str) -> str:
+    description = weather.description.lower()
+    emoji = get_weather_emoji(description)
+
+    return (f"{emoji} *Погода в {city}:*\n"
+            f"🌡️ Температура: {weather.temp:.1f}°C (ощущается как {weather.feels_like:.1f}°C)\n"
+            f"📝 {description.capitalize()}\n"
+            f"💧 Влажность: {weather.humidity}%\n"
+            f"📊 Давление: {weather.pressure} гПа\n"
+            f"💨 Ветер: {weather.wind_speed} м/с"
+            f"{format_data_age(weather)}")
+
+
+def format_forecast_day(forecast: Forecast, day_index: int) -> str:
     """
-    Детальный прогноз на день по часам (8 прогнозов с шагом 3 часа)
+    Детальный прогноз на день по часам (до 8 прогнозов с шагом 3 часа)
 
     Возвращает:
     📅 Вс, 21.12:
@@ -49,47 +60,25 @@ def format_forecast_day(forecast_data: Dict, day_index: int) -> str:
     ...
     """
     try:
-        # Группируем прогнозы по дням
-        forecasts_by_day = {}
-        for item in forecast_data['list']:
-            date_str = item['dt_txt'].split()[0]  # Берем только дату
-            if date_str not in forecasts_by_day:
-                forecasts_by_day[date_str] = []
-            forecasts_by_day[date_str].append(item)
-
-        # Сортируем дни по дате
-        days = sorted(list(forecasts_by_day.keys()))
-
-        if day_index >= len(days):
+        # Дни уже разбиты при создании прогноза (ForecastIndex), по местному времени города
+        if not 0 <= day_index < len(forecast.days):
             return "❌ Неверный индекс дня"
 
-        target_day = days[day_index]
-        day_forecasts = forecasts_by_day[target_day]
-
-        # Сортируем прогнозы по времени внутри дня
-        day_forecasts.sort(key=lambda x: x['dt_txt'])
-
-        # Конвертируем дату в читаемый формат
-        date_obj = datetime.strptime(target_day, "%Y-%m-%d")
-        day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date_obj.weekday()]
-        date_formatted = date_obj.strftime("%d.%m")
+        day = forecast.days[day_index]
 
         # Создаем заголовок
-        lines = [f"📅 *{day_name}, {date_formatted}:*", ""]
+        lines = [f"📅 *{day.weekday}, {day.label}:*", ""]
 
         # Добавляем каждый прогноз по часам
-        for forecast in day_forecasts:
-            # Извлекаем время
-            time_str = forecast['dt_txt'].split()[1]
-            hour_min = time_str[:5]  # ЧЧ:ММ
+        for i in range(day.start, day.stop):
+            point = forecast[i]
+            local_time = forecast.local_time(i)
+            hour_min = local_time.strftime("%H:%M")
 
-            # Извлекаем данные
-            temp = forecast['main']['temp']
-            feels_like = forecast['main'].get('feels_like', temp)
-            description = forecast['weather'][0]['description'].lower()
+            description = point.description.lower()
 
             # Эмодзи для времени суток
-            hour = int(time_str[:2])
+            hour = local_time.hour
             if 6 <= hour < 12:
                 time_emoji = "🌅"  # утро
             elif 12 <= hour < 18:
@@ -99,28 +88,20 @@ def format_forecast_day(forecast_data: Dict, day_index: int) -> str:
             else:
                 time_emoji = "🌙"  # ночь
 
-            # Эмодзи для погоды
-            weather_emoji = '🌤️'
-            for key, value in WEATHER_EMOJIS.items():
-                if key in description:
-                    weather_emoji = value
-                    break
-
             lines.append(
                 f"{time_emoji} *{hour_min}:* "
-                f"{weather_emoji} {temp:.1f}°C "
-                f"(ощущается {feels_like:.1f}°C), "
+                f"{get_weather_emoji(description)} {point.temp:.1f}°C "
+                f"(ощущается {point.feels_like:.1f}°C), "
                 f"{description.capitalize()}"
             )
 
         # Добавляем статистику внизу
-        temps = [f['main']['temp'] for f in day_forecasts]
-        min_temp = min(temps)
-        max_temp = max(temps)
-
         lines.append(f"\n📊 *Статистика дня:*")
-        lines.append(f"   🌡️ Диапазон: {min_temp:.1f}°C — {max_temp:.1f}°C")
-        lines.append(f"   📈 Прогнозов: {len(day_forecasts)}/8")
+        lines.append(f"   🌡️ Диапазон: {day.temp_min:.1f}°C — {day.temp_max:.1f}°C")
+        lines.append(f"   🌡️ Средняя: {day.temp_mean:.1f}°C")
+        lines.append(f"   {get_weather_emoji(day.dominant)} Преобладает: {day.dominant}")
+        lines.append(f"   📈 Прогнозов: {len(day)}/8")
+        lines.extend(format_day_insights(forecast, day_index))
 
         return "\n".join(lines)
 
@@ -128,19 +109,46 @@ def format_forecast_day(forecast_data: Dict, day_index: int) -> str:
         return f"⚠️ Ошибка форматирования прогноза: {e}"
 
 
-def format_forecast_summary(forecast_data: Dict) -> str:
+def format_day_insights(forecast: Forecast, day_index: int) -> List[str]:
+    """Строки аналитики дня: комфорт, лучшее время, предупреждения (пусто без numpy)"""
+    if ForecastFrame is None:
+        return []
+
+    insights = ForecastFrame.from_forecast(forecast).insights()
+    if not 0 <= day_index < len(insights):
+        return []
+    day = insights[day_index]
+
+    lines = [f"   😌 Комфорт: {day['comfort']:.0f}/100"]
+    if day['best_time'] is not None:
+        best = datetime.fromtimestamp(day['best_time'], timezone(timedelta(seconds=forecast.timezone)))
+        lines.append(f"   ⭐ Лучшее время для прогулки: {best.strftime('%H:%M')}")
+    if day['pop_max'] >= 0.5:
+        lines.append(f"   ☔ Вероятность осадков до {day['pop_max']:.0%}")
+    if day['pressure_drops']:
+        lines.append("   📉 Резкое падение давления - возможна непогода")
+    if day['anomalies']:
+        lines.append("   ⚠️ Необычная для этого времени суток температура")
+    return lines
+
+
+def format_forecast_summary(forecast: Forecast) -> str:
     """Краткое описание прогноза на 5 дней"""
-    try:
-        city = forecast_data['city']['name']
-        country = forecast_data['city']['country']
-        cnt = forecast_data['cnt']
+    trend = ""
+    if ForecastFrame is not None and len(forecast) > 1:
+        slope = float(ForecastFrame.from_forecast(forecast).temp_trend()[0])
+        if slope >= 1:
+            trend = f"📈 Тренд: теплеет на {slope:.1f}°C в сутки\n"
+        elif slope <= -1:
+            trend = f"📉 Тренд: холодает на {-slope:.1f}°C в сутки\n"
+        else:
+            trend = "➡️ Тренд: температура без заметных изменений\n"
 
-        return (f"📅 *Прогноз на 5 дней для {city}, {country}:*\n"
-                f"📊 Всего прогнозов: {cnt}\n"
-                f"⏱️ Шаг прогноза: 3 часа\n\n"
-                f"Выберите день для подробной информации:")
-    except KeyError as e:
-        return f"⚠️ Неполные данные прогноза: {e}"
+    return (f"📅 *Прогноз на 5 дней для {forecast.city_name}, {forecast.country}:*\n"
+            f"📊 Всего прогнозов: {forecast.cnt}\n"
+            f"⏱️ Шаг прогноза: 3 часа{format_data_age(forecast)}\n"
+            f"{trend}\n"
+            f"Выберите день для подробной информации:")
 
 
 def format_air_quality_report(analysis_result: Dict) -> str:
@@ -171,36 +179,60 @@ def format_air_quality_report(analysis_result: Dict) -> str:
     return "\n".join(lines)
 
 
-def format_city_comparison(city1: str, weather1: Dict, city2: str, weather2: Dict) -> str:
-    try:
-        temp1 = weather1['main']['temp']
-        temp2 = weather2['main']['temp']
-        desc1 = weather1['weather'][0]['description']
-        desc2 = weather2['weather'][0]['description']
-        hum1 = weather1['main']['humidity']
-        hum2 = weather2['main']['humidity']
-        wind1 = weather1['wind']['speed']
-        wind2 = weather2['wind']['speed']
-
-        temp_diff = temp1 - temp2
-        if temp_diff > 0:
-            temp_comment = f"В {city1} на {temp_diff:.1f}°C теплее"
-        elif temp_diff < 0:
-            temp_comment = f"В {city2} на {abs(temp_diff):.1f}°C теплее"
-        else:
-            temp_comment = "Температура одинаковая"
-
-        return (f"🌡️ *Сравнение погоды:*\n\n"
-                f"🏙️ *{city1}:*\n"
-                f"  Температура: {temp1:.1f}°C\n"
-                f"  Погода: {desc1.capitalize()}\n"
-                f"  Влажность: {hum1}%\n"
-                f"  Ветер: {wind1} м/с\n\n"
-                f"🏙️ *{city2}:*\n"
-                f"  Температура: {temp2:.1f}°C\n"
-                f"  Погода: {desc2.capitalize()}\n"
-                f"  Влажность: {hum2}%\n"
-                f"  Ветер: {wind2} м/с\n\n"
-                f"📊 *Итог:* {temp_comment}")
-    except KeyError as e:
-        return f"⚠️ Ошибка сравнения: {e}"
+def format_city_comparison(city1: str, weather1: CurrentWeather,
+                           city2: str, weather2: CurrentWeather) -> str:
+    temp_diff = weather1.temp - weather2.temp
+    if temp_diff > 0:
+        temp_comment = f"В {city1} на {temp_diff:.1f}°C теплее"
+    elif temp_diff < 0:
+        temp_comment = f"В {city2} на {abs(temp_diff):.1f}°C теплее"
+    else:
+        temp_comment = "Температура одинаковая"
+
+    return (f"🌡️ *Сравнение погоды:*\n\n"
+            f"🏙️ *{city1}:*\n"
+            f"  Температура: {weather1.temp:.1f}°C\n"
+            f"  Погода: {weather1.description.capitalize()}\n"
+            f"  Влажность: {weather1.humidity}%\n"
+            f"  Ветер: {weather1.wind_speed} м/с\n\n"
+            f"🏙️ *{city2}:*\n"
+            f"  Температура: {weather2.temp:.1f}°C\n"
+            f"  Погода: {weather2.description.capitalize()}\n"
+            f"  Влажность: {weather2.humidity}%\n"
+            f"  Ветер: {weather2.wind_speed} м/с\n\n"
+            f"📊 *Итог:* {temp_comment}")
+
+
+def format_cities_comparison(items: List[Dict]) -> str:
+    """
+    Сравнение погоды в нескольких городах.
+
+    items - результат WeatherAPIClient.get_weather_many: города с ошибкой
+    выводятся отдельной строкой и не участвуют в итоге.
+    """
+    lines = ["🌡️ *Сравнение погоды:*", ""]
+    temps = []
+
+    for item in items:
+        city = item['city']
+        if item.get('error') is not None:
+            lines.append(f"🏙️ *{city}:* ❌ {item['error']}")
+            lines.append("")
+            continue
+
+        weather = item['weather']
+        lines.append(f"🏙️ *{city}:*")
+        lines.append(f"  Температура: {weather.temp:.1f}°C")
+        lines.append(f"  Погода: {weather.description.capitalize()}")
+        lines.append(f"  Влажность: {weather.humidity}%")
+        lines.append(f"  Ветер: {weather.wind_speed} м/с")
+        lines.append("")
+        temps.append((weather.temp, city))
+
+    if len(temps) >= 2:
+        warmest = max(temps)
+        coldest = min(temps)
+        lines.append(f"📊 *Итог:* теплее всего в {warmest[1]} ({warmest[0]:.1f}°C), "
+                     f"холоднее всего в {coldest[1]} ({coldest[0]:.1f}°C)")
+
+    return "\n".join(lines).rstrip()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули src импортируют друг друга напрямую (from models import ...), как при запуске бота
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute() / "src"))
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import pytest
+
+from cache_manager import CacheManager
+from cache_store import SQLiteCacheStore
+
+KEY = CacheManager.make_key("weather", 55.75, 37.62)
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    """Несколько CacheManager над одной базой - как процессы бота."""
+    caches = []
+
+    def make(**kwargs):
+        options = {"cache_file": str(tmp_path / "cache.bin"), "db_file": str(tmp_path / "cache.db"),
+                   "sync_interval": 0, "purge_interval": 3600, **kwargs}
+        cache = CacheManager(**options)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_l2_entry_is_promoted_to_l1(make_cache):
+    writer, reader = make_cache(), make_cache()
+    writer.set(KEY, {"temp": 1})
+
+    assert KEY not in reader._entries
+    assert reader.get(KEY) == {"temp": 1}
+    assert KEY in reader._entries
+    assert reader.stats()["promotions"] == 1
+
+    # Второе чтение - из L1
+    assert reader.get(KEY) == {"temp": 1}
+    assert reader.stats()["promotions"] == 1
+
+
+def test_update_invalidates_other_instances(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set(KEY, {"temp": 1})
+    assert second.get(KEY) == {"temp": 1}
+
+    first.set(KEY, {"temp": 2})
+    assert second.get(KEY) == {"temp": 2}
+    assert second.stats()["invalidations"] == 1
+    # Своя запись не считается чужим изменением
+    assert first.get(KEY) == {"temp": 2}
+    assert first.stats()["invalidations"] == 0
+
+
+def test_sync_interval_limits_checks(make_cache):
+    first, second = make_cache(), make_cache(sync_interval=3600)
+    first.set(KEY, {"temp": 1})
+    assert second.get(KEY) == {"temp": 1}
+
+    first.set(KEY, {"temp": 2})
+    # До следующей синхронизации второй экземпляр отвечает из L1
+    assert second.get(KEY) == {"temp": 1}
+    second._last_sync = 0.0
+    assert second.get(KEY) == {"temp": 2}
+
+
+def test_delete_leaves_tombstone(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set(KEY, {"temp": 1})
+    assert second.get(KEY) == {"temp": 1}
+    version = first.store.max_version()
+
+    first.delete(KEY)
+    assert first.store.get(KEY) is None
+    assert first.store.changes(version) == [(KEY, version + 1, pytest.approx(time.time() + 600, abs=5), True)]
+    assert second.get(KEY) is None
+    assert "weather" not in second._spatial or not second._spatial["weather"].within(55.75, 37.62, 1)
+
+
+def test_clear_invalidates_all_instances(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set(KEY, {"temp": 1})
+    first.set("bundle:1.0000:2.0000", {"weather": None})
+    assert second.get(KEY) == {"temp": 1}
+
+    second.clear()
+    assert first.get(KEY) is None
+    assert first.get("bundle:1.0000:2.0000") is None
+    assert first.store.count() == 0
+
+
+def test_nearest_entry_from_other_instance(make_cache):
+    first, second = make_cache(), make_cache()
+    second.set(CacheManager.make_key("weather", 55.751, 37.621), {"temp": 3})
+
+    entry = first.get_nearest_entry(KEY, max_km=1)
+    assert entry is not None and entry["data"] == {"temp": 3}
+    assert first.stats()["nearby_hits"] == 1
+
+
+def test_evicted_l1_entry_is_read_back_from_l2(make_cache):
+    cache = make_cache(max_entries=2)
+    for i in range(5):
+        cache.set(f"x:{i}", i)
+
+    assert len(cache._entries) == 2
+    assert cache.get("x:0") == 0
+    assert cache.stats()["promotions"] == 1
+
+
+def test_purge_keeps_version_counter_monotonic(make_cache):
+    cache = make_cache(max_stale=0)
+    cache.set("old:1", 1, ttl=-1)
+    version = cache.store.max_version()
+
+    cache.purge()
+    assert cache.store.get("old:1") is None
+    assert cache.store.changes(0) == []
+
+    # Номер версии не переиспользуется после удаления строк
+    cache.set("new:1", 2)
+    assert cache.store.max_version() == version + 1
+
+
+def test_purge_rebuilds_spatial_index(make_cache):
+    first, second = make_cache(max_stale=0), make_cache(max_stale=0)
+    expired = CacheManager.make_key("weather", 10, 10)
+    second.set(expired, 1, ttl=0.01)
+    first.get("unrelated")   # синхронизация: чужой ключ попадает в индекс
+    assert first._spatial["weather"].within(10, 10, 1)
+
+    time.sleep(0.02)
+    first.purge()
+    assert "weather" not in first._spatial
+
+
+def test_purge_thread_starts_on_first_write(make_cache):
+    cache = make_cache()
+    assert cache._thread is None
+
+    cache.set(KEY, {"temp": 1})
+    assert cache._thread.is_alive()
+    cache.close()
+    assert not cache._thread.is_alive()
+
+
+def test_l2_read_does_not_hold_l1_lock(make_cache):
+    writer, reader = make_cache(), make_cache()
+    writer.set(KEY, {"temp": 1})
+    reader.get("unrelated")   # синхронизация до подмены store.get
+
+    read = reader.store.get
+    lock_free = []
+
+    def probe():
+        acquired = reader._lock.acquire(timeout=1)
+        if acquired:
+            reader._lock.release()
+        lock_free.append(acquired)
+
+    def get(key):
+        # Другой поток должен получить блокировку L1, пока идет чтение L2
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        return read(key)
+
+    reader.store.get = get
+    assert reader.get(KEY) == {"temp": 1}
+    assert lock_free == [True]
+
+
+def test_file_cache_is_migrated_to_store(tmp_path, make_cache):
+    file_cache = CacheManager(cache_file=str(tmp_path / "cache.bin"), backend="file")
+    file_cache.set(KEY, {"temp": 5})
+    file_cache.flush()
+
+    cache = make_cache()
+    assert cache.store.count() == 1
+    assert cache.get(KEY) == {"temp": 5}
+
+
+def test_store_put_many_shares_version(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.db"))
+    now = time.time()
+    version = store.put_many([("a", now, now + 60, 1), ("b", now, now + 60, {"v": 2})])
+
+    assert [(key, v) for key, v, _, _ in store.changes(0)] == [("a", version), ("b", version)]
+    assert store.get("b")[2:] == (version, {"v": 2})
+    assert store.keys(now) == ["a", "b"]
+    store.close()
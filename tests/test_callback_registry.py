@@ -0,0 +1,37 @@
+import time
+
+from callback_registry import CallbackRegistry
+
+
+def test_same_location_gets_same_id():
+    registry = CallbackRegistry()
+    location_id = registry.register("Нью_Йорк", 40.71, -74.01)
+
+    assert registry.register("Нью_Йорк", 40.71, -74.01) == location_id
+    assert registry.register("Москва", 55.75, 37.62) != location_id
+    # ID без '_' - его можно склеивать в callback_data
+    assert "_" not in location_id and len(f"day_{location_id}_4".encode()) <= 64
+
+    location = registry.resolve(location_id)
+    assert (location.name, location.lat, location.lon) == ("Нью_Йорк", 40.71, -74.01)
+
+
+def test_unknown_and_expired_ids():
+    registry = CallbackRegistry(ttl=0.01)
+    location_id = registry.register("Москва", 55.75, 37.62)
+    assert registry.resolve("00000000") is None
+
+    time.sleep(0.02)
+    assert registry.resolve(location_id) is None
+    registry.register("Казань", 55.79, 49.12)
+    assert len(registry) == 1
+
+
+def test_oldest_entries_are_evicted():
+    registry = CallbackRegistry(max_entries=2)
+    first = registry.register("a", 1, 1)
+    registry.register("b", 2, 2)
+    registry.register("c", 3, 3)
+
+    assert registry.resolve(first) is None
+    assert len(registry) == 2
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from api_client import WeatherAPIClient
+from cache_manager import CacheManager
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from exceptions import CircuitOpenError, RateLimitExceededError
+from geocoding_index import GeocodingIndex
+from rate_limiter import RateLimiter
+
+
+def make_breaker(**kwargs):
+    changes = []
+    breaker = CircuitBreaker("weather", failure_threshold=2, reset_timeout=0.05,
+                             on_state_change=lambda name, old, new: changes.append((old, new)), **kwargs)
+    return breaker, changes
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.before_request()
+        breaker.record_failure()
+
+
+def test_opens_after_threshold_and_rejects():
+    breaker, changes = make_breaker()
+    fail(breaker)
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    assert breaker.stats()["rejected"] == 1
+    assert changes == [(CLOSED, OPEN)]
+
+
+def test_half_open_probe_success_closes():
+    breaker, changes = make_breaker()
+    fail(breaker, 2)
+    time.sleep(0.06)
+
+    breaker.before_request()
+    assert breaker.state == HALF_OPEN
+    # Пока идет пробный запрос, остальные отклоняются
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert changes == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+
+
+def test_half_open_probe_failure_reopens():
+    breaker, _ = make_breaker()
+    fail(breaker, 2)
+    time.sleep(0.06)
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened_count"] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_cancel_releases_probe():
+    breaker, _ = make_breaker()
+    fail(breaker, 2)
+    time.sleep(0.06)
+
+    breaker.before_request()
+    breaker.cancel()
+    assert breaker.state == HALF_OPEN
+    breaker.before_request()   # следующий запрос снова может быть пробным
+
+
+class TooManyRequestsSession:
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, timeout=None):
+        self.requests += 1
+        return type("Response", (), {"status_code": 429, "headers": {"Retry-After": "0"}})()
+
+    def close(self):
+        pass
+
+
+def test_final_429_does_not_trip_breaker(tmp_path):
+    session = TooManyRequestsSession()
+    breakers = CircuitBreakerRegistry(failure_threshold=1, on_state_change=None)
+    client = WeatherAPIClient(
+        "key", CacheManager(cache_file=str(tmp_path / "cache.bin"), backend="file"),
+        geocoding_index=GeocodingIndex(str(tmp_path / "geocoding.json")),
+        rate_limiter=RateLimiter(quota_db=str(tmp_path / "quota.db")),
+        circuit_breakers=breakers, session=session)
+
+    with pytest.raises(RateLimitExceededError):
+        client.get_current_weather(55.75, 37.62)
+    assert session.requests == 3
+    assert breakers.get("weather").stats() == {
+        "state": CLOSED, "failures": 0, "total_failures": 0, "rejected": 0, "opened_count": 0}
+    client.close()
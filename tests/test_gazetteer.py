@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from gazetteer import Gazetteer, build_gazetteer, open_gazetteer
+
+CITIES = [
+    {"name": "Moscow", "country": "RU", "coord": {"lat": 55.7522, "lon": 37.6156},
+     "population": 12000000, "local_names": {"ru": "Москва", "en": "Moscow"}},
+    {"name": "Kazan", "country": "RU", "coord": {"lat": 55.7887, "lon": 49.1221},
+     "population": 1250000, "local_names": {"ru": "Казань"}},
+    {"name": "Mozhaysk", "country": "RU", "coord": {"lat": 55.5069, "lon": 36.0243},
+     "population": 30000, "local_names": {"ru": "Можайск"}},
+    # Два далеких Springfield с одинаковым населением: какой из них нужен, непонятно
+    {"name": "Springfield", "country": "US", "coord": {"lat": 39.80, "lon": -89.64}, "population": 150000},
+    {"name": "Springfield", "country": "US", "coord": {"lat": 42.10, "lon": -72.59}, "population": 150000},
+    {"name": "Suva", "country": "FJ", "coord": {"lat": -18.14, "lon": 178.44}, "population": 90000},
+    {"name": "Taveuni", "country": "FJ", "coord": {"lat": -16.85, "lon": -179.97}, "population": 9000},
+]
+
+
+@pytest.fixture(scope="module")
+def gazetteer(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("gazetteer")
+    source = tmp / "city.list.json"
+    source.write_text(json.dumps(CITIES), encoding="utf-8")
+    path = str(tmp / "gazetteer.bin")
+    assert build_gazetteer(str(source), path) > len(CITIES)
+    gazetteer = Gazetteer(path)
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_lookup_by_any_name(gazetteer):
+    assert gazetteer.lookup("москва").name == "Москва"
+    assert gazetteer.lookup("Moscow").lat == pytest.approx(55.7522)
+    assert gazetteer.lookup("Атлантида") is None
+    # Неоднозначное название отдается геокодеру API
+    assert gazetteer.lookup("Springfield") is None
+
+
+def test_prefix_and_fuzzy(gazetteer):
+    assert [place.name for place in gazetteer.prefix("Мо")] == ["Москва", "Можайск"]
+    assert [place.name for place in gazetteer.fuzzy("Казнаь")] == ["Казань"]
+    assert [place.name for place in gazetteer.suggest("Масква")] == ["Москва"]
+
+
+def test_nearest(gazetteer):
+    assert gazetteer.nearest(55.70, 37.60).name == "Москва"
+    assert gazetteer.nearest(50.0, 10.0) is None
+    # Через антимеридиан
+    assert gazetteer.nearest(-16.85, 179.99, max_km=50).name == "Taveuni"
+
+
+def test_open_missing_or_foreign_file(tmp_path):
+    assert open_gazetteer(str(tmp_path / "missing.bin")) is None
+    foreign = tmp_path / "foreign.bin"
+    foreign.write_bytes(b"not a gazetteer file at all, just some bytes" * 4)
+    assert open_gazetteer(str(foreign)) is None
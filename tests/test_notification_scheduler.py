@@ -0,0 +1,78 @@
+from notification_scheduler import NotificationScheduler
+
+
+class FakeWeatherClient:
+    """get_bundle_many без сети: погода или ошибка для всех локаций."""
+
+    def __init__(self):
+        self.fail = False
+        self.calls = []
+
+    def get_bundle_many(self, locations, endpoints, background=False):
+        self.calls.append((list(locations), background))
+        if self.fail:
+            return [{'weather': None, 'errors': {'weather': RuntimeError("API недоступен")}} for _ in locations]
+        return [{'weather': f"погода {lat:.2f}", 'errors': {}} for lat, _ in locations]
+
+
+def make_scheduler(client, sent, **kwargs):
+    return NotificationScheduler(client, send=lambda user_id, text: sent.append((user_id, text)),
+                                 render=lambda weather, city: f"{city}: {weather}", **kwargs)
+
+
+def test_group_is_fetched_once_and_rendered_per_city():
+    client, sent = FakeWeatherClient(), []
+    scheduler = make_scheduler(client, sent)
+    scheduler.subscribe(1, "Москва", 55.75, 37.62, interval_h=1, due=100)
+    scheduler.subscribe(2, "Москва", 55.751, 37.621, interval_h=1, due=100)
+    scheduler.subscribe(3, "Казань", 55.79, 49.12, interval_h=1, due=500)
+
+    assert scheduler.tick(100) == 2
+    assert len(client.calls) == 1
+    locations, background = client.calls[0]
+    assert len(locations) == 1 and background
+    assert sorted(user_id for user_id, _ in sent) == [1, 2]
+    assert scheduler._subscribers[1].due == 100 + 3600
+
+
+def test_failed_group_is_retried_with_backoff():
+    client, sent = FakeWeatherClient(), []
+    scheduler = make_scheduler(client, sent, retry_delay=10)
+    scheduler.subscribe(1, "Москва", 55.75, 37.62, interval_h=1, due=100)
+
+    client.fail = True
+    assert scheduler.tick(100) == 0
+    assert scheduler._subscribers[1].due == 110
+    assert scheduler.tick(110) == 0
+    # Каждая следующая попытка вдвое позже
+    assert scheduler._subscribers[1].due == 130
+    assert scheduler.stats()["retried"] == 2
+
+    client.fail = False
+    assert scheduler.tick(130) == 1
+    subscriber = scheduler._subscribers[1]
+    assert (subscriber.due, subscriber.retries) == (130 + 3600, 0)
+
+
+def test_retry_never_passes_the_next_regular_send():
+    client, sent = FakeWeatherClient(), []
+    scheduler = make_scheduler(client, sent, retry_delay=3600)
+    scheduler.subscribe(1, "Москва", 55.75, 37.62, interval_h=0.5, due=100)
+
+    client.fail = True
+    scheduler.tick(100)
+    subscriber = scheduler._subscribers[1]
+    assert (subscriber.due, subscriber.retries) == (100 + 1800, 0)
+    assert scheduler.stats()["retried"] == 0
+
+
+def test_unsubscribed_user_is_not_retried():
+    client, sent = FakeWeatherClient(), []
+    scheduler = make_scheduler(client, sent, retry_delay=10)
+    scheduler.subscribe(1, "Москва", 55.75, 37.62, interval_h=1, due=100)
+
+    client.fail = True
+    scheduler.tick(100)
+    scheduler.unsubscribe(1)
+    assert scheduler.tick(110) == 0
+    assert len(client.calls) == 1
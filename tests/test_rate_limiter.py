@@ -0,0 +1,97 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import rate_limiter
+from exceptions import RateLimitExceededError
+from rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+
+
+@pytest.fixture
+def make_limiter(tmp_path):
+    def make(**kwargs):
+        return RateLimiter(**{"quota_db": str(tmp_path / "quota.db"), **kwargs})
+    return make
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after("завтра") is None
+    assert parse_retry_after(None) is None
+
+
+def test_pause_delays_next_request(make_limiter):
+    limiter = make_limiter(per_minute=600)
+    assert limiter.reserve() == 0.0
+
+    limiter.pause(2.0)
+    assert limiter.reserve() == pytest.approx(2.0, abs=0.1)
+    # Пауза длиннее max_wait - запрос отбрасывается, а не ждет
+    with pytest.raises(RateLimitExceededError):
+        limiter.reserve(max_wait=1.0)
+    assert limiter.stats()["shed"] == 1
+
+
+def test_token_bucket_queues_and_sheds():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    assert bucket.reserve(max_wait=0.05) is None
+
+
+def test_daily_cap(make_limiter):
+    limiter = make_limiter(per_minute=600, per_day=3)
+    for _ in range(3):
+        limiter.reserve()
+    with pytest.raises(RateLimitExceededError):
+        limiter.reserve()
+
+
+def test_daily_quota_is_shared_between_processes(make_limiter):
+    first, second = make_limiter(per_minute=600), make_limiter(per_minute=600)
+    for _ in range(rate_limiter.SAVE_EVERY):
+        first.reserve()
+    for _ in range(5):
+        second.reserve()
+    second.flush()
+
+    # Счетчик прибавляется, а не перезаписывается последним процессом
+    assert second.stats()["day_calls"] == rate_limiter.SAVE_EVERY + 5
+    assert make_limiter().stats()["day_calls"] == rate_limiter.SAVE_EVERY + 5
+
+
+def test_legacy_quota_file_is_imported(tmp_path, monkeypatch, make_limiter):
+    legacy = tmp_path / "api_quota.json"
+    legacy.write_text(json.dumps({"date": RateLimiter._today(), "calls": 7}), encoding="utf-8")
+    monkeypatch.setattr(rate_limiter, "LEGACY_QUOTA_FILE", str(legacy))
+
+    assert make_limiter().stats()["day_calls"] == 7
+    assert make_limiter().stats()["day_calls"] == 7
+
+
+def test_background_requests_leave_interactive_reserve(make_limiter):
+    limiter = make_limiter(per_minute=4, interactive_reserve=0.25, background_max_wait=0.05)
+    with limiter.background():
+        for _ in range(3):
+            assert limiter.reserve() == 0.0
+        with pytest.raises(RateLimitExceededError):
+            limiter.reserve()
+
+    # Последний токен остался командам пользователей
+    assert limiter.reserve() == 0.0
+
+
+def test_background_request_waits_for_refill(make_limiter):
+    limiter = make_limiter(per_minute=600, interactive_reserve=0.0)
+    limiter.bucket.tokens = 0.0
+    started = time.monotonic()
+    with limiter.background():
+        assert limiter.reserve() == 0.0
+    assert time.monotonic() - started >= 0.05
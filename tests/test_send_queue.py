@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from send_queue import BULK, INTERACTIVE, TelegramSendQueue
+
+
+class TooManyRequests(Exception):
+    """Как ApiTelegramException на ответ 429."""
+    error_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Too Many Requests")
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+class FakeBot:
+    def __init__(self, limited=0):
+        self.limited = limited   # сколько первых отправок получат 429
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            if self.limited:
+                self.limited -= 1
+                raise TooManyRequests(0.05)
+            self.sent.append((chat_id, text))
+            return len(self.sent)
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(bot, **kwargs):
+        queue = TelegramSendQueue(bot.send_message, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close(timeout=1)
+
+
+def test_message_is_retried_after_429(make_queue):
+    bot = FakeBot(limited=2)
+    queue = make_queue(bot)
+
+    assert queue.send(1, "привет").result(timeout=5) == 1
+    assert bot.sent == [(1, "привет")]
+    assert queue.stats()["retried"] == 2
+
+
+def test_retries_are_limited(make_queue):
+    bot = FakeBot(limited=10)
+    queue = make_queue(bot)
+
+    with pytest.raises(TooManyRequests):
+        queue.send(1, "привет").result(timeout=5)
+    assert queue.stats()["failed"] == 1
+
+
+def test_interactive_messages_go_first(make_queue):
+    bot = FakeBot()
+    # Один поток отправки: сообщения уходят в том порядке, в котором их выбрал диспетчер
+    queue = make_queue(bot, workers=1)
+
+    # Пока очередь заблокирована, диспетчер не забирает сообщения и видит их все сразу
+    with queue._cond:
+        futures = [queue.send(chat_id, "рассылка", priority=BULK) for chat_id in (1, 2)]
+        futures.append(queue.send(3, "ответ", priority=INTERACTIVE))
+    for future in futures:
+        future.result(timeout=5)
+
+    assert [chat_id for chat_id, _ in bot.sent] == [3, 1, 2]
+    assert set(queue.stats()["by_priority"]) == {"interactive", "bulk"}
+
+
+def test_close_fails_pending_futures(make_queue):
+    bot = FakeBot()
+    # Второе сообщение в тот же чат ждет лимита чата дольше, чем close готов ждать
+    queue = make_queue(bot, per_chat_per_second=0.1, per_chat_burst=1)
+    sent = queue.send(1, "первое")
+    pending = queue.send(1, "второе")
+    assert sent.result(timeout=5) == 1
+
+    queue.close(timeout=0.1)
+    with pytest.raises(RuntimeError):
+        pending.result(timeout=1)
+    assert queue.stats()["failed"] == 1
+    with pytest.raises(RuntimeError):
+        queue.send(1, "после остановки")
@@ -0,0 +1,145 @@
+import json
+import time
+
+import pytest
+
+import cache_manager
+from cache_manager import CacheManager
+from models import AirPollutionSeries, CurrentWeather, Forecast
+from serialization import (
+    CODECS, COMPRESSORS, ENTRY_HEADER, FILE_HEADER, decode_payload, encode_payload,
+    is_binary_file, parse_format, read_entries, write_entries
+)
+
+FORMATS = [f"{codec}+{compression}" for codec in CODECS for compression in COMPRESSORS]
+
+
+def make_forecast() -> Forecast:
+    items = [{
+        "dt": 1766300000 + k * 10800,
+        "main": {"temp": 10.5 + k, "feels_like": 9.0 + k, "humidity": 60, "pressure": 1012},
+        "wind": {"speed": 3.5},
+        "pop": 0.2,
+        "weather": [{"description": "облачно"}],
+    } for k in range(16)]
+    return Forecast.from_api({"list": items, "city": {"name": "Москва", "country": "RU", "timezone": 10800}})
+
+
+def make_weather() -> CurrentWeather:
+    return CurrentWeather.from_api({
+        "name": "Москва", "dt": 1766300000, "timezone": 10800,
+        "main": {"temp": -3.5, "feels_like": -8.0, "humidity": 80, "pressure": 1005},
+        "wind": {"speed": 4.0}, "weather": [{"description": "снег"}],
+        "sys": {"country": "RU", "sunrise": 1766290000, "sunset": 1766320000},
+    })
+
+
+def make_series() -> AirPollutionSeries:
+    return AirPollutionSeries.from_api({
+        "coord": {"lat": 55.75, "lon": 37.62},
+        "list": [{"dt": 1766300000 + h * 3600, "main": {"aqi": 2},
+                  "components": {"pm2_5": 12.5 + h, "no2": 30.0}} for h in range(24)],
+    })
+
+
+def sample_entries(now: float):
+    return [
+        ("forecast:55.7500:37.6200", now, now + 3600, make_forecast()),
+        ("weather:55.7500:37.6200", now, now + 600, make_weather()),
+        ("air_pollution_forecast:55.7500:37.6200", now, now + 3600, make_series()),
+        ("bundle:55.7500:37.6200", now, now + 600, {"weather": make_weather(), "errors": {}, "тег": [1, 2.5]}),
+    ]
+
+
+@pytest.mark.parametrize("spec", FORMATS)
+def test_round_trip(tmp_path, spec):
+    path = tmp_path / "cache.bin"
+    now = time.time()
+    entries = sample_entries(now)
+    codec, compressor = parse_format(spec)
+
+    assert write_entries(str(path), entries, codec, compressor) == len(entries)
+    assert is_binary_file(str(path))
+    assert list(read_entries(str(path))) == entries
+
+
+@pytest.mark.parametrize("spec", FORMATS)
+def test_payload_round_trip(spec):
+    codec, compressor = parse_format(spec)
+    forecast = make_forecast()
+    assert decode_payload(encode_payload(forecast, codec, compressor)) == forecast
+
+
+def test_expired_entries_are_skipped_without_decoding(tmp_path):
+    path = tmp_path / "cache.bin"
+    now = time.time()
+    codec, compressor = parse_format("json+zlib")
+    write_entries(str(path), [("old", now - 7200, now - 3600, {"v": 1}),
+                              ("new", now, now + 3600, {"v": 2})], codec, compressor)
+
+    # Портим данные истекшей записи: читатель не должен их распаковывать
+    raw = bytearray(path.read_bytes())
+    payload_start = FILE_HEADER.size + ENTRY_HEADER.size + len(b"old")
+    raw[payload_start:payload_start + 4] = b"\xff\xff\xff\xff"
+    path.write_bytes(bytes(raw))
+
+    kept = list(read_entries(str(path), lambda _, expires_at: expires_at > now))
+    assert [(key, data) for key, _, _, data in kept] == [("new", {"v": 2})]
+
+    with pytest.raises(ValueError):
+        list(read_entries(str(path)))
+
+
+def test_foreign_and_truncated_files_raise(tmp_path):
+    foreign = tmp_path / "foreign.bin"
+    foreign.write_bytes(b"{}")
+    with pytest.raises(ValueError):
+        list(read_entries(str(foreign)))
+
+    path = tmp_path / "cache.bin"
+    now = time.time()
+    write_entries(str(path), sample_entries(now))
+    path.write_bytes(path.read_bytes()[:-5])
+    with pytest.raises(ValueError):
+        list(read_entries(str(path)))
+
+
+def test_unavailable_format_falls_back(capsys):
+    codec, compressor = parse_format("yaml+brotli")
+    assert (codec.name, compressor.name) == ("json", "zlib")
+    assert "недоступ" in capsys.readouterr().out
+
+
+def test_file_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = CacheManager(cache_file=path, backend="file")
+    forecast = make_forecast()
+    cache.set("forecast:55.7500:37.6200", forecast)
+    cache.set("old:1", {"v": 1}, ttl=-cache.max_stale - 1)
+    cache.flush()
+
+    reloaded = CacheManager(cache_file=path, backend="file")
+    assert reloaded.get("forecast:55.7500:37.6200") == forecast
+    assert "old:1" not in reloaded._entries
+
+
+def test_legacy_json_cache_is_read_and_rewritten(tmp_path, monkeypatch):
+    legacy = tmp_path / "weather_cache.json"
+    now = time.time()
+    legacy.write_text(json.dumps({
+        "weather:55.7500:37.6200": {"data": make_weather().to_dict(), "fetched_at": now, "expires_at": now + 600},
+        "weather:0.0000:0.0000": {"data": {"v": 0}, "fetched_at": now - 86400, "expires_at": now - 86000},
+        # Файл самого старого формата - одна запись без ключей
+        "timestamp": "2024-01-01T00:00:00",
+    }), encoding="utf-8")
+    monkeypatch.setattr(cache_manager, "LEGACY_CACHE_FILE", str(legacy))
+
+    path = tmp_path / "cache.bin"
+    cache = CacheManager(cache_file=str(path), backend="file")
+    assert cache.get("weather:55.7500:37.6200") == make_weather()
+    assert "weather:0.0000:0.0000" not in cache._entries
+
+    # Перенесенные записи сохраняются в новом формате без новых изменений
+    cache.flush()
+    assert is_binary_file(str(path))
+    assert [key for key, _, _, _ in read_entries(str(path))] == ["weather:55.7500:37.6200"]
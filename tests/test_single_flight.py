@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "погода"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("weather", fetch)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("weather", fetch)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["coalesced"] < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results == ["погода"] * 4
+    assert calls == [1]
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_error_is_shared_and_key_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("нет данных")
+
+    with pytest.raises(ValueError):
+        flight.do("weather", fail)
+    assert flight.do("weather", lambda: 1) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_calls_are_coalesced():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "погода"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("weather", fetch) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["погода"] * 4
+    assert calls == [1]
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+import pytest
+
+from storage import SQLiteUserStorage, WriteBehindUserStorage
+
+
+@pytest.fixture
+def users_json(tmp_path):
+    path = tmp_path / "User_Data.json"
+    path.write_text(json.dumps({
+        "1": {"notifications": {"enabled": True, "interval_h": 2},
+              "last_city": "Москва", "last_lat": 55.75, "last_lon": 37.62},
+        "2": {"notifications": {"enabled": False, "interval_h": 2}},
+    }), encoding="utf-8")
+    return path
+
+
+def test_users_are_migrated_from_json_once(tmp_path, users_json):
+    db_file = str(tmp_path / "users.db")
+    storage = SQLiteUserStorage(db_file, str(users_json))
+    assert storage.load(1)["last_city"] == "Москва"
+    assert storage.users_with_notifications() == [1]
+    storage.close()
+
+    # Изменения после переноса не затираются файлом при следующем запуске
+    users_json.write_text(json.dumps({"3": {}}), encoding="utf-8")
+    storage = SQLiteUserStorage(db_file, str(users_json))
+    storage.update_location(2, "Казань", 55.79, 49.12)
+    assert sorted(storage.load_all()) == ["1", "2"]
+    storage.close()
+
+    reopened = SQLiteUserStorage(db_file, str(users_json))
+    assert reopened.load(2)["last_city"] == "Казань"
+    assert "3" not in reopened.load_all()
+    reopened.close()
+
+
+def test_schema_indexes_are_added_to_existing_db(tmp_path):
+    db_file = str(tmp_path / "users.db")
+    storage = SQLiteUserStorage(db_file, None)
+    storage.init()
+    conn = storage._connect()
+    conn.execute("DROP INDEX idx_users_location")
+    storage.close()
+
+    reopened = SQLiteUserStorage(db_file, None)
+    reopened.init()
+    indexes = {row[0] for row in reopened._connect().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_users_notifications", "idx_users_location", "idx_users_city"} <= indexes
+    reopened.close()
+
+
+class SlowBackend:
+    """Backend, в котором сброс пачки идет долго - чтобы save_all попал в его середину."""
+
+    def __init__(self):
+        self.users = {}
+
+    def init(self):
+        pass
+
+    def load_all(self):
+        return dict(self.users)
+
+    def save_all(self, users_data):
+        self.users = dict(users_data)
+
+    def save_many(self, users_data):
+        time.sleep(0.1)
+        self.users.update(users_data)
+
+
+def test_save_all_is_not_overwritten_by_running_flush():
+    backend = SlowBackend()
+    storage = WriteBehindUserStorage(backend, flush_interval=3600)
+    storage.save(1, {"v": "старое"})
+
+    flush = threading.Thread(target=storage.flush)
+    flush.start()
+    time.sleep(0.02)
+    storage.save_all({"1": {"v": "новое"}})
+    flush.join()
+
+    assert backend.users == {"1": {"v": "новое"}}
+    storage.close()
+
+
+def test_write_behind_flushes_changes_in_batches():
+    backend = SlowBackend()
+    storage = WriteBehindUserStorage(backend, flush_interval=3600)
+    storage.update_location(1, "Москва", 55.75, 37.62)
+    storage.toggle_notifications(1, True)
+    assert backend.users == {}
+
+    storage.flush()
+    assert backend.users["1"]["last_city"] == "Москва"
+    assert storage.stats()["flushes"] == 1
+    assert storage.users_with_notifications() == [1]
+    storage.close()